@@ -41,10 +41,122 @@ class AppConstants:
     # AI Model Configuration
     AI_MODELS = {
         'GROQ_MODEL': 'openai/gpt-oss-120b',
-        'TEMPERATURE': 0.7,
-        'MAX_TOKENS': 2000
+        'TEMPERATURE': 0.3,
+        # No completion limit by default: gpt-oss models count their reasoning against it, and
+        # output size is bounded by MERMAID_MAX_CHARS. A reply cut off by a route's limit fails
+        # the call (finish_reason 'length') instead of being used
+        'MAX_TOKENS': None,
+        
+        # Model routing (diagrams/services/model_router.py). Keys are 'default', a step
+        # ('analyzer', 'generator', 'fused', 'refine', 'repair') or 'step:diagram_type'; each field comes from
+        # the most specific key that sets it, then from the values above. A failed call
+        # moves down `fallbacks`. LLM_ROUTES (JSON, same shape) overrides entries.
+        'MODEL_ROUTES': {
+            'default': {
+                'fallbacks': ['llama-3.3-70b-versatile'],
+                'latency_target_ms': 15000,
+            },
+            # Classification into JSON doesn't need the large model
+            'analyzer': {
+                'model': 'openai/gpt-oss-20b',
+                'temperature': 0.0,
+                'max_tokens': 2048,
+                'fallbacks': ['openai/gpt-oss-120b'],
+                'latency_target_ms': 3000,
+            },
+            'generator:flowchart': {
+                'model': 'openai/gpt-oss-20b',
+                'fallbacks': ['openai/gpt-oss-120b'],
+                'latency_target_ms': 8000,
+            },
+            'generator:state': {
+                'model': 'openai/gpt-oss-20b',
+                'fallbacks': ['openai/gpt-oss-120b'],
+                'latency_target_ms': 8000,
+            },
+            # Editing existing code: near-deterministic, one short call
+            'refine': {
+                'model': 'openai/gpt-oss-20b',
+                'temperature': 0.1,
+                'fallbacks': ['openai/gpt-oss-120b'],
+                'latency_target_ms': 5000,
+            },
+            # Rewriting a handful of lines that failed validation
+            'repair': {
+                'model': 'openai/gpt-oss-20b',
+                'temperature': 0.0,
+                'max_tokens': 1024,
+                'fallbacks': ['openai/gpt-oss-120b'],
+                'latency_target_ms': 3000,
+            },
+        },
+        
+        # Resilience policy for LLM calls (diagrams/services/llm_client.py)
+        # Total time all LLM calls for one generation may take
+        'REQUEST_DEADLINE_SECONDS': 45,
+        # Fraction of the total budget each step may use, retries included
+        'STEP_BUDGET_SHARE': {
+            'analyzer': 0.35,
+            'generator': 1.0,
+            'fused': 1.0,
+        },
+        # Don't start an attempt with less time than this left
+        'MIN_ATTEMPT_SECONDS': 1.0,
+        'MAX_RETRIES': 2,
+        'RETRY_BASE_DELAY_SECONDS': 0.5,
+        'RETRY_MAX_DELAY_SECONDS': 4.0,
+        # Send a duplicate request once a call runs past the step's p95 latency
+        'HEDGE_ENABLED': False,
+        'HEDGE_MIN_SAMPLES': 20,
+        # Circuit breaker: open when BREAKER_FAILURE_RATE of the last BREAKER_WINDOW_SIZE
+        # calls failed (after at least BREAKER_MIN_CALLS), serve offline fallbacks meanwhile
+        'BREAKER_WINDOW_SIZE': 20,
+        'BREAKER_MIN_CALLS': 5,
+        'BREAKER_FAILURE_RATE': 0.5,
+        'BREAKER_OPEN_SECONDS': 30,
+        # Adaptive concurrency (diagrams/services/rate_limiter.py): per-process in-flight
+        # calls grow by ~1 per round trip and are cut by AIMD_DECREASE_FACTOR on a 429
+        # or when less than RATE_LIMIT_LOW_WATERMARK of the provider quota is left
+        'AIMD_INITIAL_CONCURRENCY': 4,
+        'AIMD_MIN_CONCURRENCY': 1,
+        'AIMD_DECREASE_FACTOR': 0.5,
+        'AIMD_COOLDOWN_SECONDS': 2.0,
+        'RATE_LIMIT_LOW_WATERMARK': 0.1,
+    }
+    
+    # Generation pipeline modes: two LLM calls (analyze, then generate), one fused call,
+    # or both steps in parallel when the user picked the diagram type
+    GENERATION_MODES = ['two_step', 'fused', 'speculative']
+    
+    # Delay before the browser reopens an SSE stream the server closed (the `retry:` hint)
+    SSE_RETRY_MS = 1000
+    
+    # Near-duplicate prompt reuse: off, suggest (link the earlier diagram) or serve (reuse it)
+    PROMPT_REUSE_MODES = ['off', 'suggest', 'serve']
+    
+    # System prompt variants (diagrams/services/prompts/registry.py) and the most
+    # tokens each prompt may use; `manage.py check` fails when a prompt outgrows it
+    PROMPT_VARIANTS = ['full', 'compact']
+    PROMPT_TOKEN_BUDGETS = {
+        'full': {
+            'default': 1600,
+            # Sent on every edit of a diagram, so it stays as small as the compact prompts
+            'refine': 300,
+            'repair': 300,
+        },
+        'compact': {
+            'default': 450,
+            'analyzer': 300,
+        },
     }
     
+    # Server-side validation (diagrams/services/mermaid_validator.py): at most this many
+    # rejected lines are sent for repair; more than that means the diagram is beyond
+    # line-level fixes and is left for the browser to report
+    REPAIR_MAX_LINES = 8
+    # Neighbouring lines sent on each side of a broken line
+    REPAIR_CONTEXT_LINES = 1
+    
     # File Upload Settings
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
     ALLOWED_FILE_EXTENSIONS = ['.txt', '.md', '.json']
@@ -60,15 +172,21 @@ class AppConstants:
         'SUCCESS': {
             'DIAGRAM_GENERATED': 'Diagram generated successfully!',
             'SESSION_SAVED': 'Session saved successfully!',
+            'DIAGRAM_REUSED': 'Reused a diagram made for a very similar prompt.',
         },
         'ERROR': {
             'GENERATION_FAILED': 'Failed to generate diagram. Please try again.',
             'INVALID_PROMPT': 'Please provide a valid prompt.',
             'API_ERROR': 'API service unavailable. Please try again later.',
             'DATABASE_ERROR': 'Database error occurred. Please try again.',
+            'QUEUE_FULL': 'Too many diagrams are being generated right now. Please try again in a moment.',
+            'GENERATION_TIMEOUT': 'Diagram generation timed out. Please try again.',
+            'INVALID_INSTRUCTION': 'Please describe the change you want to make.',
+            'NOTHING_TO_REFINE': 'Only completed diagrams can be refined.',
         },
         'INFO': {
             'PROCESSING': 'Processing your request...',
+            'REFINING': 'Applying your change to the diagram...',
             'LOADING': 'Loading...',
         }
     }
@@ -115,6 +233,9 @@ class ValidationRules:
     PROMPT_MIN_LENGTH = 10
     PROMPT_MAX_LENGTH = 2000
     
+    REFINE_INSTRUCTION_MIN_LENGTH = 3
+    REFINE_INSTRUCTION_MAX_LENGTH = 500
+    
     DIAGRAM_TYPE_VALIDATION = {
         'required': True,
         'choices': list(AppConstants.DIAGRAM_TYPES.values())
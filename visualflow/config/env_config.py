@@ -53,6 +53,63 @@ class EnvConfig:
     APP_NAME = os.getenv('APP_NAME', 'VisualFlow')
     APP_VERSION = os.getenv('APP_VERSION', '1.0.0')
     
+    # Background Generation
+    GENERATION_MAX_WORKERS = int(os.getenv('GENERATION_MAX_WORKERS', '4'))
+    GENERATION_MAX_PENDING = int(os.getenv('GENERATION_MAX_PENDING', '32'))
+    GENERATION_STALE_SECONDS = int(os.getenv('GENERATION_STALE_SECONDS', '300'))
+    GENERATION_MODE = os.getenv('GENERATION_MODE', 'two_step').lower()
+    PROMPT_VARIANT = os.getenv('PROMPT_VARIANT', 'full').lower()
+    LLM_ROUTES = os.getenv('LLM_ROUTES', '')
+    
+    # Repair lines that fail server-side Mermaid validation with a small LLM call
+    MERMAID_REPAIR_ENABLED = os.getenv('MERMAID_REPAIR_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    
+    # Cleaned LLM output past these limits is cut at a line boundary before the syntax fixer
+    # runs (0 = no limit); 50000 characters is also Mermaid's default maxTextSize
+    MERMAID_MAX_CHARS = int(os.getenv('MERMAID_MAX_CHARS', '50000'))
+    MERMAID_MAX_LINES = int(os.getenv('MERMAID_MAX_LINES', '2000'))
+    
+    # Near-duplicate prompt reuse (off, suggest or serve)
+    PROMPT_REUSE_MODE = os.getenv('PROMPT_REUSE_MODE', 'suggest').lower()
+    PROMPT_REUSE_THRESHOLD = float(os.getenv('PROMPT_REUSE_THRESHOLD', '0.8'))
+    
+    # LLM Backend (groq, stub, record or replay)
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'groq').lower()
+    LLM_STUB_URL = os.getenv('LLM_STUB_URL', 'http://127.0.0.1:8765')
+    LLM_CASSETTE_DIR = os.getenv('LLM_CASSETTE_DIR', '')
+    
+    # ASGI (async views + event-loop generation jobs)
+    USE_ASYNC_VIEWS = os.getenv('USE_ASYNC_VIEWS', 'false').lower() in ('true', '1', 'yes')
+    ASYNC_GENERATION_MAX_CONCURRENCY = int(os.getenv('ASYNC_GENERATION_MAX_CONCURRENCY', '64'))
+    # Under WSGI an SSE connection holds a worker thread, so it is closed after this many
+    # seconds and the browser reconnects (0 = no SSE, the display page polls status)
+    SSE_WSGI_MAX_SECONDS = int(os.getenv('SSE_WSGI_MAX_SECONDS', '20'))
+    
+    # LLM HTTP Transport
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', '20'))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', '10'))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', '60'))
+    LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv('LLM_HTTP_TIMEOUT_SECONDS', '60'))
+    LLM_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT_SECONDS', '5'))
+    LLM_HTTP2 = os.getenv('LLM_HTTP2', 'true').lower() in ('true', '1', 'yes')
+    LLM_HTTP_WARMUP = os.getenv('LLM_HTTP_WARMUP', 'false').lower() in ('true', '1', 'yes')
+    
+    # LLM Rate Limiting (shared by all worker processes through the database)
+    LLM_RATE_LIMIT_RPM = float(os.getenv('LLM_RATE_LIMIT_RPM', '30'))
+    LLM_RATE_LIMIT_BURST = int(os.getenv('LLM_RATE_LIMIT_BURST', '5'))
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+    
+    # LLM Response Cache
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+    LLM_CACHE_MEMORY_ENTRIES = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', '256'))
+    LLM_CACHE_MAX_DB_ENTRIES = int(os.getenv('LLM_CACHE_MAX_DB_ENTRIES', '10000'))
+    
+    # Local Intent Classifier
+    INTENT_CLASSIFIER_ENABLED = os.getenv('INTENT_CLASSIFIER_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    INTENT_CLASSIFIER_PATH = os.getenv('INTENT_CLASSIFIER_PATH', '')
+    INTENT_CLASSIFIER_THRESHOLD = float(os.getenv('INTENT_CLASSIFIER_THRESHOLD', '0.85'))
+    
     @classmethod
     def get_database_url(cls):
         """Get database URL for Django"""
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Session, Contact
+from django.db.models import Avg, Count, Q, Sum
+from .models import Session, Contact, LLMCacheEntry, LLMRateLimit, GenerationMetrics
 from config.constants import AppConstants
 
 @admin.register(Contact)
@@ -10,10 +11,28 @@ class ContactAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
 
 
+class GenerationMetricsInline(admin.StackedInline):
+    """Read-only timings and token usage shown on the session page"""
+    model = GenerationMetrics
+    can_delete = False
+    extra = 0
+    readonly_fields = [
+        'mode', 'model_name', 'prompt_version', 'analyzer_ms', 'generator_ms', 'fixer_ms', 'db_ms', 'total_ms',
+        'prompt_tokens', 'completion_tokens', 'llm_calls', 'cache_hits', 'used_fallback',
+        'node_count', 'edge_count', 'steps',
+    ]
+    fields = readonly_fields
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
     """Admin interface for Session model"""
     
+    inlines = [GenerationMetricsInline]
+    
     list_display = [
         'id', 'prompt_preview', 'diagram_type', 'status', 
         'created_at', 'has_diagram'
@@ -24,11 +43,11 @@ class SessionAdmin(admin.ModelAdmin):
     ]
     
     search_fields = [
-        'prompt', 'id'
+        'prompt', 'id', 'content_hash'
     ]
     
     readonly_fields = [
-        'id', 'created_at', 'updated_at', 'user_ip', 'user_agent'
+        'id', 'created_at', 'updated_at', 'user_ip', 'user_agent', 'content_hash'
     ]
     
     fieldsets = (
@@ -36,7 +55,7 @@ class SessionAdmin(admin.ModelAdmin):
             'fields': ('id', 'prompt', 'diagram_type', 'status')
         }),
         ('Generated Content', {
-            'fields': ('generated_uml', 'diagram_svg', 'error_message'),
+            'fields': ('generated_uml', 'content_hash', 'diagram_svg', 'error_message'),
             'classes': ('collapse',)
         }),
         ('Metadata', {
@@ -56,3 +75,80 @@ class SessionAdmin(admin.ModelAdmin):
     has_diagram.short_description = 'Has Diagram'
     has_diagram.boolean = True
 
+
+
+@admin.register(LLMCacheEntry)
+class LLMCacheEntryAdmin(admin.ModelAdmin):
+    """Admin interface for cached LLM responses"""
+    
+    list_display = ['key', 'namespace', 'hit_count', 'created_at', 'last_accessed_at', 'expires_at']
+    list_filter = ['namespace', 'created_at']
+    search_fields = ['key']
+    readonly_fields = ['namespace', 'key', 'created_at', 'last_accessed_at', 'hit_count']
+
+
+@admin.register(LLMRateLimit)
+class LLMRateLimitAdmin(admin.ModelAdmin):
+    """Shared LLM rate-limit buckets; delete a row to reset its bucket and any pause"""
+    
+    list_display = ['name', 'tokens', 'updated_at', 'blocked_until', 'version']
+    readonly_fields = ['name', 'tokens', 'updated_at', 'blocked_until', 'version']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(GenerationMetrics)
+class GenerationMetricsAdmin(admin.ModelAdmin):
+    """Per-session generation metrics, with averages per diagram type above the list"""
+    
+    change_list_template = 'admin/diagrams/generationmetrics/change_list.html'
+    
+    list_display = [
+        'session', 'diagram_type', 'mode', 'model_name', 'total_ms', 'analyzer_ms',
+        'generator_ms', 'fixer_ms', 'db_ms', 'prompt_tokens', 'completion_tokens', 'cache_hits',
+        'node_count', 'edge_count', 'used_fallback', 'created_at'
+    ]
+    list_filter = ['session__diagram_type', 'mode', 'model_name', 'prompt_version', 'used_fallback', 'created_at']
+    list_select_related = ['session']
+    ordering = ['-created_at']
+    readonly_fields = [field.name for field in GenerationMetrics._meta.fields]
+    
+    def diagram_type(self, obj):
+        return obj.session.diagram_type
+    diagram_type.short_description = 'Diagram Type'
+    diagram_type.admin_order_field = 'session__diagram_type'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        """Aggregate the filtered metrics per diagram type, slowest first"""
+        response = super().changelist_view(request, extra_context=extra_context)
+        try:
+            queryset = response.context_data['cl'].queryset
+        except (AttributeError, KeyError):
+            # Redirects and error responses carry no changelist
+            return response
+        
+        response.context_data['summary_by_type'] = (
+            queryset.order_by()
+            .values('session__diagram_type')
+            .annotate(
+                generations=Count('session'),
+                avg_total_ms=Avg('total_ms'),
+                avg_analyzer_ms=Avg('analyzer_ms'),
+                avg_generator_ms=Avg('generator_ms'),
+                avg_fixer_ms=Avg('fixer_ms'),
+                avg_db_ms=Avg('db_ms'),
+                avg_prompt_tokens=Avg('prompt_tokens'),
+                avg_completion_tokens=Avg('completion_tokens'),
+                avg_nodes=Avg('node_count'),
+                avg_edges=Avg('edge_count'),
+                total_tokens=Sum('prompt_tokens') + Sum('completion_tokens'),
+                cache_hits=Sum('cache_hits'),
+                fallbacks=Count('session', filter=Q(used_fallback=True)),
+            )
+            .order_by('-avg_total_ms')
+        )
+        return response
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class DiagramsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diagrams'
+
+    def ready(self):
+        from config.env_config import EnvConfig
+        from . import checks  # noqa: F401  registers the system checks
+        from . import signals  # noqa: F401  connects the signal handlers
+
+        # Pay the TLS handshake at boot rather than on the worker's first generation
+        if EnvConfig.LLM_HTTP_WARMUP:
+            from .services.llm_backends import llm_backend
+            llm_backend.warm_up_in_background()
@@ -0,0 +1,236 @@
+"""
+Benchmark helpers - a synthetic corpus of raw LLM outputs and timing statistics
+
+The corpus imitates what the generator step gets back from the model before
+cleaning: prose around a fenced block, emoji node IDs, reserved words as IDs,
+PK/FK attributes in the wrong order, tilde generics, unquoted multiplicities
+and styling lines. It is deterministic for a given seed, so timings and
+fixer output can be compared between commits.
+
+The fuzz inputs are the opposite: single lines built to make backtracking
+patterns blow up, and random streams of Mermaid tokens, for checking that the
+fixer and validator stay linear in the size of their input.
+"""
+
+import math
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Tuple
+
+CORPUS_TYPES = ('flowchart', 'er', 'class', 'sequence')
+CORPUS_SIZES_KB = (1, 10, 50, 200)
+
+EMOJIS = ('🚀', '📝', '🔍', '💾', '⚠️', '✅', '❌', '🧑‍🎓', '🏢', '📦')
+WORDS = ('user', 'order', 'payment', 'invoice', 'account', 'product', 'cart', 'shipment',
+         'review', 'session', 'token', 'report', 'ledger', 'catalog', 'ticket', 'profile')
+
+PREAMBLE = "Here is the Mermaid diagram for your request:\n\n```mermaid\n"
+POSTAMBLE = "\n```\n\nThe diagram shows the main components and how they interact. Let me know if you want changes!"
+
+
+def _name(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(WORDS).capitalize()}{rng.choice(WORDS).capitalize()}{index}"
+
+
+def _flowchart_block(rng: random.Random, i: int) -> str:
+    a, b, c = _name(rng, i), _name(rng, i + 1), _name(rng, i + 2)
+    emoji = rng.choice(EMOJIS)
+    return (
+        f"    {a}[{emoji} {a} step] --> {b}{{❓ {b} ok?}}\n"
+        f"    {b} -->|✅ Yes| {emoji}[{c} done]\n"
+        f"    {b} -->|❌ No| end[⚠️ Stop {i}]\n"
+        f"    start --> {a}\n"
+        f"    style {a} fill:#f9f,stroke:#333\n"
+    )
+
+
+def _er_block(rng: random.Random, i: int) -> str:
+    a, b = _name(rng, i).upper(), _name(rng, i + 1).upper()
+    return (
+        f"    {a} }}o--o{{ {b} : \"links {i}\"\n"
+        f"    {a} {{\n"
+        f"        PK {a.lower()}Id\n"
+        f"        FK {b.lower()}Id int\n"
+        f"        int {b.lower()}Ref PK FK\n"
+        f"        string name\n"
+        f"    }}\n"
+    )
+
+
+def _class_block(rng: random.Random, i: int) -> str:
+    a, b = _name(rng, i), _name(rng, i + 1)
+    return (
+        f"    class {a} {{\n"
+        f"        +int id\n"
+        f"        +List~{b}~ items\n"
+        f"        +save() 💾\n"
+        f"    }}\n"
+        f"    {a} 1 --> * {b} : owns\n"
+        f"    {a} \"1\" *-- {b}\n"
+        f"    class {b}:::highlight\n"
+    )
+
+
+def _sequence_block(rng: random.Random, i: int) -> str:
+    a, b = _name(rng, i), _name(rng, i + 1)
+    return (
+        f"    {a}->>+{b}: {rng.choice(EMOJIS)} request {i}\n"
+        f"    alt ✅ ok\n"
+        f"        {b}-->>{a}: result {i}\n"
+        f"    else ❌ failed\n"
+        f"        {b}-->>-{a}: error {i}\n"
+        f"    end\n"
+    )
+
+
+BLOCKS: Dict[str, Tuple[str, Callable[[random.Random, int], str]]] = {
+    'flowchart': ('graph TD\n    classDef highlight fill:#ff0\n', _flowchart_block),
+    'er': ('erDiagram\n', _er_block),
+    'class': ('classDiagram\n', _class_block),
+    'sequence': ('sequenceDiagram\n', _sequence_block),
+}
+
+
+def build_output(diagram_type: str, size_bytes: int, seed: int = 0) -> str:
+    """One raw LLM response of about `size_bytes` UTF-8 bytes"""
+    rng = random.Random(f"{diagram_type}:{size_bytes}:{seed}")
+    header, block = BLOCKS[diagram_type]
+    parts, size, index = [PREAMBLE, header], len((PREAMBLE + header + POSTAMBLE).encode('utf-8')), 0
+    while size < size_bytes:
+        text = block(rng, index)
+        parts.append(text)
+        size += len(text.encode('utf-8'))
+        index += 3
+    parts.append(POSTAMBLE)
+    return ''.join(parts)
+
+
+def build_corpus(sizes_kb=CORPUS_SIZES_KB, types=CORPUS_TYPES, seed: int = 0) -> List[Tuple[str, str]]:
+    """(name, raw_output) pairs such as ('er-50kb', ...) for every type and size"""
+    return [
+        (f"{diagram_type}-{kb}kb", build_output(diagram_type, kb * 1024, seed))
+        for kb in sizes_kb
+        for diagram_type in types
+    ]
+
+
+# Each builds a line from `n` repeats of a fragment: long runs of one token, openers that are
+# never closed, separators with nothing between them
+ADVERSARIAL_LINES: Dict[str, Callable[[int], str]] = {
+    'emoji_run': lambda n: '🚀' * n,
+    'emoji_unclosed': lambda n: '🚀[' * n,
+    'emoji_unclosed_words': lambda n: '🚀[a ' * n,
+    'space_run': lambda n: 'a' + ' ' * n + 'b',
+    'tab_space_run': lambda n: ' \t' * n,
+    'keyword_space_run': lambda n: 'end' + ' ' * n,
+    'word': lambda n: 'a' * n,
+    'words': lambda n: 'ab ' * n,
+    'digit_run': lambda n: 'A ' + '1' * n,
+    'multiplicities': lambda n: 'A 1 ' * n,
+    'arrows': lambda n: '--> ' * n,
+    'dashes': lambda n: '-' * n,
+    'dotted_dashes': lambda n: '-.' * n,
+    'double_dashed_names': lambda n: 'a--' * n,
+    'dots': lambda n: 'a' + '.' * n + 'b',
+    'quotes': lambda n: 'a "' * n,
+    'unclosed_quotes': lambda n: 'a "b' * n,
+    'tildes': lambda n: 'a~' * n,
+    'keys': lambda n: 'a b PK ' * n,
+    'brackets': lambda n: '[' * n,
+    'parentheses': lambda n: 'A((' * n,
+    'braces': lambda n: '{' * n,
+    'shapes': lambda n: 'A[(' * n,
+    'edge_labels': lambda n: 'A -->|' * n,
+    'unclosed_label': lambda n: 'A[' + 'a ' * n,
+    'class_relations': lambda n: 'A "1" --> ' * n,
+    'er_relations': lambda n: 'A ||--o{ ' * n,
+    'messages': lambda n: 'A->>' * n,
+    'annotations': lambda n: '<<' * n,
+}
+# Appended to every adversarial line so no rule is skipped for lack of its trigger text
+TRIGGER_TAIL = ' [ ~ " K -- class'
+FUZZ_HEADERS = ('graph TD', 'classDiagram', 'erDiagram', 'sequenceDiagram', 'stateDiagram-v2', 'journey')
+FUZZ_TOKENS = (
+    'A', 'end', 'class ', 'PK', 'FK', '1', '*', '0..*', ' ', '  ', '\t', '-->', '---', '--', '-.', '==>',
+    '..', '<|--', '*--', 'o--', '}o--o{', '||--o{', '->>', '[', ']', '(', ')', '{', '}', '"', '~', '|',
+    ':', ';', '<<', '>>', '&', ':::', '%%', '🚀', '✅', 'é',
+) + WORDS
+
+
+def build_adversarial(pattern: str, header: str, size_chars: int) -> str:
+    """A diagram whose only statement is the adversarial line `pattern`, about `size_chars` long"""
+    line = ADVERSARIAL_LINES[pattern]
+    return f"{header}\n    {line(max(1, size_chars // len(line(1))))}{TRIGGER_TAIL}\n"
+
+
+def build_fuzz_output(rng: random.Random, size_chars: int) -> str:
+    """Random lines of Mermaid tokens under a random header; one line in 20 is very long"""
+    lines = [rng.choice(FUZZ_HEADERS)]
+    size = len(lines[0])
+    while size < size_chars:
+        tokens = rng.randint(1, 2000) if rng.random() < 0.05 else rng.randint(1, 12)
+        line = ' ' * rng.randint(0, 8) + ''.join(rng.choice(FUZZ_TOKENS) for _ in range(tokens))
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines)
+
+
+def growth_exponent(small_size: int, small_ms: float, large_size: int, large_ms: float,
+                    floor_ms: float = 1.0) -> float:
+    """
+    k in time ~ size**k between two measurements: about 1 for linear work, 2 for quadratic
+
+    Timings under `floor_ms` are raised to it, since sub-millisecond samples are mostly noise.
+    """
+    return math.log(max(large_ms, floor_ms) / max(small_ms, floor_ms)) / math.log(large_size / small_size)
+
+
+def summarize(samples_s: List[float], bytes_per_op: int = 0) -> Dict[str, float]:
+    """Latency statistics in milliseconds, throughput, and MB/s when the input size is known"""
+    ordered = sorted(samples_s)
+    total = sum(ordered)
+    result = {
+        'iterations': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] * 1000,
+        'min_ms': ordered[0] * 1000,
+        'max_ms': ordered[-1] * 1000,
+        'ops_per_s': len(ordered) / total if total else 0.0,
+    }
+    if bytes_per_op:
+        result['mb_per_s'] = bytes_per_op * len(ordered) / total / 1e6 if total else 0.0
+    return result
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 1,
+            bytes_per_op: int = 0) -> Dict[str, float]:
+    """Time `iterations` calls of `fn` after `warmup` untimed ones"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, bytes_per_op)
+
+
+def compare(baseline: Dict[str, Dict], current: Dict[str, Dict], metric: str = 'p50_ms',
+            threshold: float = 0.10) -> List[Dict]:
+    """
+    Per-benchmark change of `metric` between two result sets
+
+    Returns:
+        List[Dict]: name, baseline, current, change (fraction) and whether it regressed past `threshold`
+    """
+    rows = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name].get(metric), current[name].get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        rows.append({'name': name, 'baseline': before, 'current': after,
+                     'change': change, 'regressed': change > threshold})
+    return rows
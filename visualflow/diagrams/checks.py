@@ -0,0 +1,68 @@
+"""
+System checks for the diagrams app (run by `manage.py check`, runserver and migrate)
+"""
+
+from django.core.checks import Error, Warning, register
+
+from config.constants import AppConstants
+from config.env_config import EnvConfig
+
+
+@register()
+def check_prompt_budgets(app_configs, **kwargs):
+    """Fail when a registered system prompt outgrows its token budget"""
+    from .services.prompts.registry import prompt_registry
+
+    messages = []
+    if EnvConfig.PROMPT_VARIANT not in AppConstants.PROMPT_VARIANTS:
+        messages.append(Warning(
+            f"PROMPT_VARIANT '{EnvConfig.PROMPT_VARIANT}' is unknown, serving the full prompts",
+            hint=f"Use one of: {', '.join(AppConstants.PROMPT_VARIANTS)}",
+            id='diagrams.W001',
+        ))
+
+    for spec, budget in prompt_registry.over_budget():
+        messages.append(Error(
+            f"Prompt {spec.label} is {spec.tokens} tokens, over its budget of {budget}",
+            hint="Trim the prompt or raise AppConstants.PROMPT_TOKEN_BUDGETS deliberately",
+            obj=spec.label,
+            id='diagrams.E001',
+        ))
+    return messages
+
+
+@register()
+def check_model_routes(app_configs, **kwargs):
+    """Report an LLM_ROUTES override that could not be applied"""
+    from .services.model_router import model_router
+
+    return [
+        Error(error, hint="LLM_ROUTES is ignored until it is fixed", id='diagrams.E002')
+        for error in model_router.errors
+    ]
+
+
+@register()
+def check_llm_backend(app_configs, **kwargs):
+    """Fail on an LLM_BACKEND that names no registered backend"""
+    from .services.llm_backends import BACKENDS
+
+    if EnvConfig.LLM_BACKEND in BACKENDS:
+        return []
+    return [Error(
+        f"LLM_BACKEND '{EnvConfig.LLM_BACKEND}' is unknown, the Groq API is used instead",
+        hint=f"Use one of: {', '.join(BACKENDS)}",
+        id='diagrams.E003',
+    )]
+
+
+@register()
+def check_prompt_reuse(app_configs, **kwargs):
+    """Warn about a PROMPT_REUSE_MODE that disables reuse by accident"""
+    if EnvConfig.PROMPT_REUSE_MODE in AppConstants.PROMPT_REUSE_MODES:
+        return []
+    return [Warning(
+        f"PROMPT_REUSE_MODE '{EnvConfig.PROMPT_REUSE_MODE}' is unknown, similar prompts are not reused",
+        hint=f"Use one of: {', '.join(AppConstants.PROMPT_REUSE_MODES)}",
+        id='diagrams.W002',
+    )]
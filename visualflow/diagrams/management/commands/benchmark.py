@@ -0,0 +1,376 @@
+"""
+Benchmark the generation path in-process and write the results as JSON for comparison between commits
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from config.constants import AppConstants
+from config.env_config import EnvConfig
+from diagrams.benchmarks import (
+    ADVERSARIAL_LINES, CORPUS_SIZES_KB, CORPUS_TYPES, FUZZ_HEADERS, build_adversarial, build_corpus,
+    build_fuzz_output, compare, growth_exponent, measure, summarize,
+)
+
+SUITES = ('pipeline', 'fixer', 'views', 'fuzz')
+
+PROMPTS = {
+    'flowchart': 'User login with email validation, password reset and account lockout after three failures',
+    'er': 'Library with Books, Members, Loans and Authors where members borrow many books',
+}
+
+HISTORY_SESSIONS = 200
+
+# Characters per streamed chunk, about the 3-5 tokens an LLM stream delivers at a time
+STREAM_CHUNK_CHARS = 16
+
+# Time growth from a quarter of the fuzz size to the full size above which a pattern counts as superlinear
+SUPERLINEAR_EXPONENT = 1.5
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark generate_mermaid_code against an in-process LLM stub, the response cleaner, "
+        "syntax fixer and validator on 1-200 KB outputs, and the generate/display/history/download views. "
+        "The fuzz suite checks that the fixer and validator stay linear on adversarial and random input. "
+        "Runs on a throwaway test database and writes JSON results"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed iterations per benchmark (fewer for the largest fixer inputs)')
+        parser.add_argument('--sizes', nargs='+', type=int, default=list(CORPUS_SIZES_KB),
+                            help='Fixer input sizes in KB')
+        parser.add_argument('--fuzz-size', type=int, default=None,
+                            help='Largest fuzz input in characters (default: MERMAID_MAX_CHARS, or 65536 without a limit)')
+        parser.add_argument('--fuzz-cases', type=int, default=200, help='Random fuzz inputs')
+        parser.add_argument('--stub-latency', default='fixed:0',
+                            help="Stub time to first token (see llm_stub_server --latency); the default "
+                                 "measures only the app's own overhead")
+        parser.add_argument('--stub-tokens-per-second', type=float, default=0)
+        parser.add_argument('--output', default=None,
+                            help='Result file (default: benchmarks/<git commit>.json)')
+        parser.add_argument('--compare', default=None, metavar='BASELINE',
+                            help='Earlier result file to compare p50 latencies against')
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help='Relative p50 slowdown reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Also fail when a fuzz pattern grows superlinearly')
+
+    def handle(self, *args, **options):
+        from diagrams.services.rate_limiter import SharedTokenBucket, llm_rate_limiter
+
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be positive")
+
+        # Handler output would dominate the timings of sub-millisecond steps
+        logging.disable(logging.INFO)
+        setup_test_environment(debug=False)
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+            # Shared-cache in-memory SQLite fails concurrent writers with "table is locked"
+            # instead of waiting; a file behaves like the deployed database
+            connection.settings_dict['TEST']['NAME'] = str(Path(tempfile.gettempdir()) / 'visualflow-benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # The shared rate limit is for the real API; it would only throttle the stub
+        bucket = llm_rate_limiter.bucket
+        llm_rate_limiter.bucket = SharedTokenBucket(bucket.name, requests_per_minute=0, burst=bucket.capacity)
+        try:
+            results = self._run(options)
+        finally:
+            llm_rate_limiter.bucket = bucket
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+
+        report = {'meta': self._meta(options), 'results': results}
+        output = Path(options['output'] or settings.BASE_DIR / 'benchmarks' / f"{report['meta']['commit'] or 'local'}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, sort_keys=True))
+
+        self._print(results)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {output}"))
+        if options['compare']:
+            self._compare(options, results)
+        superlinear = [name for name, stats in results.items()
+                       if stats.get('exponent', 0) > SUPERLINEAR_EXPONENT]
+        if superlinear and options['fail_on_regression']:
+            raise CommandError(f"{len(superlinear)} fuzz pattern(s) grow superlinearly: {', '.join(sorted(superlinear))}")
+
+    def _run(self, options):
+        from diagrams.services.llm_backends import StubBackend
+        from diagrams.services.llm_stub import StubConfig, StubLLMServer
+        from diagrams.services.mermaid_service import mermaid_service
+
+        results = {}
+        if 'fixer' in options['suites']:
+            results.update(self._bench_fixer(mermaid_service, options))
+        if 'fuzz' in options['suites']:
+            results.update(self._bench_fuzz(mermaid_service, options))
+        if not {'pipeline', 'views'} & set(options['suites']):
+            return results
+
+        try:
+            server = StubLLMServer('127.0.0.1', 0, StubConfig(
+                latency=options['stub_latency'],
+                tokens_per_second=options['stub_tokens_per_second'],
+                seed=0,
+            ))
+        except ValueError as e:
+            raise CommandError(str(e))
+        server.start_in_background()
+        previous_backend = mermaid_service.backend
+        mermaid_service.use_backend(StubBackend(server.url))
+        try:
+            if 'pipeline' in options['suites']:
+                results.update(self._bench_pipeline(mermaid_service, options))
+            if 'views' in options['suites']:
+                results.update(self._bench_views(mermaid_service, options))
+        finally:
+            mermaid_service.use_backend(previous_backend)
+            server.shutdown()
+            server.server_close()
+        return results
+
+    def _bench_fixer(self, service, options):
+        from diagrams.services.fallback_generator import build_fallback_diagram
+        from diagrams.services.mermaid_ast import parse, serialize
+        from diagrams.services.mermaid_validator import validate_mermaid
+
+        def stream(chunks):
+            processor = service._stream_processor()
+            for chunk in chunks:
+                processor.feed(chunk)
+                if processor.done:
+                    break
+            return processor.finish()
+
+        results = {}
+        for name, raw in build_corpus(sizes_kb=options['sizes'], types=CORPUS_TYPES):
+            kb = int(name.rsplit('-', 1)[1][:-2])
+            iterations = max(3, options['iterations'] // max(1, kb // 10))
+            size = len(raw.encode('utf-8'))
+            cleaned = service._clean_ai_response(raw)
+            results[f'clean.{name}'] = measure(lambda: service._clean_ai_response(raw), iterations,
+                                               bytes_per_op=size)
+            results[f'fix.{name}'] = measure(lambda: service._fix_syntax_errors(cleaned), iterations,
+                                             bytes_per_op=len(cleaned.encode('utf-8')))
+            fixed = service._fix_syntax_errors(cleaned)
+            # Lets --compare catch a fixer change that alters output, not just speed
+            results[f'fix.{name}']['output_digest'] = hashlib.sha256(fixed.encode('utf-8')).hexdigest()[:16]
+            results[f'validate.{name}'] = measure(lambda: validate_mermaid(fixed), iterations,
+                                                  bytes_per_op=len(fixed.encode('utf-8')))
+            results[f'parse.{name}'] = measure(lambda: parse(fixed), iterations,
+                                               bytes_per_op=len(fixed.encode('utf-8')))
+            diagram = parse(fixed)
+            results[f'serialize.{name}'] = measure(lambda: serialize(diagram), iterations)
+            chunks = [raw[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(raw), STREAM_CHUNK_CHARS)]
+            results[f'stream.{name}'] = measure(lambda: stream(chunks), iterations, bytes_per_op=size)
+            streamed = stream(chunks)
+            results[f'stream.{name}']['output_digest'] = hashlib.sha256(streamed.encode('utf-8')).hexdigest()[:16]
+            if streamed != service._fix_syntax_errors(service._limit_size(cleaned)):
+                self.stdout.write(self.style.WARNING(f"  stream {name}: output differs from _clean_and_fix"))
+            self.stdout.write(f"  fixer {name}: {results[f'fix.{name}']['p50_ms']:.2f}ms p50")
+
+        # Diagrams of the size the generator usually returns, one of each type per round
+        typical = [build_fallback_diagram(PROMPTS['er'], diagram_type)
+                   for diagram_type in ('flowchart', 'class', 'er', 'sequence', 'state')]
+        results['parse.typical'] = measure(lambda: [parse(code) for code in typical], options['iterations'] * 10)
+        results['parse.typical']['diagrams_per_s'] = results['parse.typical']['ops_per_s'] * len(typical)
+        self.stdout.write(f"  parse typical: {results['parse.typical']['diagrams_per_s']:.0f} diagrams/s")
+        return results
+
+    def _bench_fuzz(self, service, options):
+        from diagrams.services.mermaid_ast import parse
+        from diagrams.services.mermaid_validator import validate_mermaid
+
+        def process(code):
+            fixed = service._fix_syntax_errors(code)
+            validate_mermaid(fixed)
+            parse(fixed)
+
+        large = options['fuzz_size'] or EnvConfig.MERMAID_MAX_CHARS or 65536
+        small = large // 4
+        results = {}
+        # Worst header per pattern; the size limit doesn't apply here, so growth shows the rules themselves
+        for pattern in ADVERSARIAL_LINES:
+            worst = None
+            for header in FUZZ_HEADERS:
+                timings = []
+                for size in (small, large):
+                    code = build_adversarial(pattern, header, size)
+                    timings.append(measure(lambda: process(code), 2, warmup=0)['min_ms'])
+                exponent = growth_exponent(small, timings[0], large, timings[1])
+                if worst is None or exponent > worst['exponent']:
+                    worst = {'p50_ms': timings[1], 'exponent': exponent, 'header': header, 'size_chars': large}
+            results[f'fuzz.{pattern}'] = worst
+            line = f"  fuzz {pattern}: {worst['p50_ms']:.2f}ms at {large} chars, growth x^{worst['exponent']:.2f}"
+            self.stdout.write(self.style.ERROR(line) if worst['exponent'] > SUPERLINEAR_EXPONENT else line)
+
+        # Random output through the whole local path, size limit included; reproduce case i
+        # with build_fuzz_output(random.Random(i), size)
+        samples, sizes = [], []
+        for case in range(options['fuzz_cases']):
+            raw = build_fuzz_output(random.Random(case), random.Random(-case).randint(1, large))
+            started = time.perf_counter()
+            try:
+                fixed = service._clean_and_fix(raw)
+                validate_mermaid(fixed)
+                parse(fixed)
+                processor = service._stream_processor()
+                for i in range(0, len(raw), STREAM_CHUNK_CHARS):
+                    processor.feed(raw[i:i + STREAM_CHUNK_CHARS])
+                processor.finish()
+            except Exception as e:
+                raise CommandError(f"Fuzz case {case} raised {type(e).__name__}: {e}")
+            samples.append(time.perf_counter() - started)
+            sizes.append(len(raw.encode('utf-8')))
+        if samples:
+            results['fuzz.random'] = summarize(samples, bytes_per_op=sum(sizes) // len(sizes))
+            self.stdout.write(f"  fuzz random: {results['fuzz.random']['max_ms']:.2f}ms worst of {len(samples)}")
+        return results
+
+    def _bench_pipeline(self, service, options):
+        results = {}
+        counter = itertools.count()
+        for mode in AppConstants.GENERATION_MODES:
+            for diagram_type, prompt in PROMPTS.items():
+                def generate():
+                    # A fresh prompt per call so the response cache never answers
+                    code, error, _ = service.generate_mermaid_code(
+                        f"{prompt} (run {next(counter)})", diagram_type, mode=mode, explicit_type=True)
+                    if not code:
+                        raise CommandError(f"Pipeline {mode}/{diagram_type} failed against the stub: {error}")
+                results[f'pipeline.{mode}.{diagram_type}'] = measure(generate, options['iterations'])
+                self.stdout.write(f"  pipeline {mode}/{diagram_type}: "
+                                  f"{results[f'pipeline.{mode}.{diagram_type}']['p50_ms']:.1f}ms p50")
+
+        if EnvConfig.LLM_CACHE_ENABLED:
+            results['pipeline.cached.flowchart'] = measure(
+                lambda: service.generate_mermaid_code(PROMPTS['flowchart'], 'flowchart', explicit_type=True),
+                options['iterations'])
+        return results
+
+    def _bench_views(self, service, options):
+        from diagrams.models import Session
+        from diagrams.services.generation_jobs import job_runner
+
+        client = Client()
+        results = {}
+
+        def check(response, expected=200):
+            if response.status_code != expected:
+                raise CommandError(f"{response.request['PATH_INFO']} returned HTTP {response.status_code}")
+            return response
+
+        # generate: time the request itself, then how fast the background jobs drain
+        samples = []
+        started = time.perf_counter()
+        for i in range(options['iterations']):
+            while job_runner.pending >= job_runner.max_pending:
+                time.sleep(0.005)
+            t0 = time.perf_counter()
+            check(client.post(reverse('diagrams:generate'), {
+                'prompt': f"{PROMPTS['flowchart']} (view {i})",
+                'diagram_type': 'flowchart',
+            }), expected=302)
+            samples.append(time.perf_counter() - t0)
+        while job_runner.pending:
+            time.sleep(0.005)
+        wall = time.perf_counter() - started
+        results['views.generate'] = summarize(samples)
+        results['views.generate.completed_per_s'] = {
+            'iterations': len(samples),
+            'ops_per_s': Session.objects.filter(status='completed').count() / wall,
+        }
+
+        code = service._fix_syntax_errors(service._clean_ai_response(build_corpus((10,), ('flowchart',))[0][1]))
+        Session.objects.bulk_create([
+            Session(prompt=f"{PROMPTS['flowchart']} ({i})", diagram_type='flowchart',
+                    generated_uml=code, status='completed')
+            for i in range(HISTORY_SESSIONS)
+        ])
+        ids = itertools.cycle(Session.objects.filter(status='completed').values_list('id', flat=True))
+
+        for name, url in (
+            ('display', lambda: reverse('diagrams:display', args=[next(ids)])),
+            ('history', lambda: reverse('diagrams:history')),
+            ('history.filtered', lambda: reverse('diagrams:history') + '?type=flowchart&status=completed&page=3'),
+            ('download.mmd', lambda: reverse('diagrams:download', args=[next(ids)]) + '?format=mmd'),
+            ('download.png', lambda: reverse('diagrams:download', args=[next(ids)]) + '?format=png'),
+        ):
+            results[f'views.{name}'] = measure(lambda: check(client.get(url())), options['iterations'])
+            self.stdout.write(f"  view {name}: {results[f'views.{name}']['p50_ms']:.2f}ms p50")
+        return results
+
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                    text=True, cwd=settings.BASE_DIR, timeout=10).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': connection.vendor,
+            'prompt_variant': EnvConfig.PROMPT_VARIANT,
+            'cache_enabled': EnvConfig.LLM_CACHE_ENABLED,
+            'mermaid_max_chars': EnvConfig.MERMAID_MAX_CHARS,
+            'mermaid_max_lines': EnvConfig.MERMAID_MAX_LINES,
+            'options': {key: options[key] for key in ('suites', 'iterations', 'sizes', 'stub_latency',
+                                                      'stub_tokens_per_second', 'fuzz_size', 'fuzz_cases')},
+        }
+
+    def _print(self, results):
+        self.stdout.write(f"{'benchmark':<40} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>10} {'MB/s':>8}")
+        for name, stats in sorted(results.items()):
+            self.stdout.write(
+                f"{name:<40} {stats.get('p50_ms', 0):>10.2f} {stats.get('p95_ms', 0):>10.2f} "
+                f"{stats.get('ops_per_s', 0):>10.1f} {stats.get('mb_per_s', 0):>8.1f}"
+            )
+
+    def _compare(self, options, results):
+        try:
+            baseline = json.loads(Path(options['compare']).read_text())
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read baseline {options['compare']}: {e}")
+
+        rows = compare(baseline.get('results', {}), results, threshold=options['threshold'])
+        self.stdout.write(f"\nCompared with {baseline.get('meta', {}).get('commit') or options['compare']} (p50):")
+        for row in rows:
+            line = (f"  {row['name']:<40} {row['baseline']:>10.2f} -> {row['current']:>10.2f} ms "
+                    f"({row['change']:+.1%})")
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+
+        changed = sorted(
+            name for name, stats in results.items()
+            if stats.get('output_digest') and baseline.get('results', {}).get(name, {}).get('output_digest')
+            not in (None, stats['output_digest'])
+        )
+        for name in changed:
+            self.stdout.write(self.style.WARNING(f"  {name:<40} output differs from the baseline"))
+
+        regressions = [row for row in rows if row['regressed']]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} benchmark(s) slower than the baseline by more than "
+                               f"{options['threshold']:.0%}")
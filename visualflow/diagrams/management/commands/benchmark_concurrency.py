@@ -0,0 +1,116 @@
+"""
+Load-test a running server: concurrent diagram submissions, then poll each one to completion
+"""
+
+import asyncio
+import re
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+SESSION_URL_RE = re.compile(r'/display/([0-9a-f-]{36})/')
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Submit concurrent generations to a running server (WSGI or ASGI) and report "
+        "submit latency, end-to-end latency and throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of the running server')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Total generations to submit')
+        parser.add_argument('--concurrency', type=int, default=10,
+                            help='Generations in flight at once')
+        parser.add_argument('--prompt', default='Create a user login process flowchart with validation and error handling')
+        parser.add_argument('--diagram-type', default='flowchart')
+        parser.add_argument('--mode', default='', help='generation_mode form field (empty for the server default)')
+        parser.add_argument('--poll-interval', type=float, default=0.5)
+        parser.add_argument('--timeout', type=float, default=300.0,
+                            help='Give up on a generation after this many seconds')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        results, wall = asyncio.run(self._run(options))
+
+        submitted = [r for r in results if r['session_id']]
+        completed = [r for r in submitted if r['status'] == 'completed']
+        submit_ms = [r['submit_ms'] for r in results if r['submit_ms'] is not None]
+        total_ms = [r['total_ms'] for r in completed]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['requests']} requests, concurrency {options['concurrency']}, {wall:.1f}s wall time"
+        ))
+        self.stdout.write(f"  submitted: {len(submitted)}  completed: {len(completed)}  "
+                          f"failed: {sum(r['status'] == 'failed' for r in submitted)}  "
+                          f"timed out: {sum(r['status'] == 'timeout' for r in submitted)}  "
+                          f"rejected/errors: {len(results) - len(submitted)}")
+        for label, values in (('submit', submit_ms), ('end-to-end', total_ms)):
+            self.stdout.write(f"  {label} ms: p50={_percentile(values, 0.5):.0f}  "
+                              f"p95={_percentile(values, 0.95):.0f}  max={max(values, default=0):.0f}")
+        self.stdout.write(f"  throughput: {len(completed) / wall:.2f} diagrams/s")
+
+    async def _run(self, options):
+        limits = httpx.Limits(max_connections=options['concurrency'] * 2)
+        async with httpx.AsyncClient(base_url=options['url'], limits=limits, timeout=60.0) as client:
+            # One GET gives us the CSRF cookie every POST needs
+            response = await client.get('/')
+            csrf_token = client.cookies.get('csrftoken')
+            if response.status_code != 200 or not csrf_token:
+                raise CommandError(f"Could not fetch a CSRF token from {options['url']} (HTTP {response.status_code})")
+
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                self._one(client, semaphore, csrf_token, options)
+                for _ in range(options['requests'])
+            ))
+            return results, time.perf_counter() - started
+
+    async def _one(self, client, semaphore, csrf_token, options):
+        result = {'session_id': None, 'status': 'error', 'submit_ms': None, 'total_ms': None}
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post('/generate/', data={
+                    'csrfmiddlewaretoken': csrf_token,
+                    'prompt': options['prompt'],
+                    'diagram_type': options['diagram_type'],
+                    'generation_mode': options['mode'],
+                }, headers={'Referer': options['url']})
+            except httpx.HTTPError as e:
+                self.stderr.write(f"Submit failed: {e}")
+                return result
+            result['submit_ms'] = (time.perf_counter() - started) * 1000
+
+            match = SESSION_URL_RE.search(response.headers.get('location', ''))
+            if response.status_code != 302 or not match:
+                return result
+            result['session_id'] = match.group(1)
+
+            deadline = started + options['timeout']
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(options['poll_interval'])
+                try:
+                    status = (await client.get(f"/api/status/{result['session_id']}/")).json()['status']
+                except (httpx.HTTPError, ValueError, KeyError):
+                    continue
+                if status != 'processing':
+                    result['status'] = status
+                    result['total_ms'] = (time.perf_counter() - started) * 1000
+                    return result
+
+            result['status'] = 'timeout'
+            return result
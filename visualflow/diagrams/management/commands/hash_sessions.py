@@ -0,0 +1,42 @@
+"""
+Compute content hashes for sessions saved before Session.content_hash existed
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from diagrams.models import Session
+from diagrams.services.mermaid_ast import content_hash
+
+
+class Command(BaseCommand):
+    help = "Hash the canonical Mermaid code of sessions that have no content hash (new sessions are hashed on save)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rehash', action='store_true',
+                            help='Recompute every hash, e.g. after the canonical form changed')
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.filter(generated_uml__isnull=False).only('id', 'generated_uml', 'content_hash')
+        if not options['rehash']:
+            sessions = sessions.filter(content_hash='')
+
+        started = time.perf_counter()
+        seen = updated = 0
+        batch = []
+        for session in sessions.iterator(chunk_size=options['batch_size']):
+            seen += 1
+            digest = content_hash(session.generated_uml) if session.generated_uml else ''
+            if digest != session.content_hash:
+                session.content_hash = digest
+                batch.append(session)
+            if len(batch) >= options['batch_size']:
+                updated += Session.objects.bulk_update(batch, ['content_hash'])
+                batch = []
+        if batch:
+            updated += Session.objects.bulk_update(batch, ['content_hash'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {updated} of {seen} sessions in {elapsed:.1f}s"))
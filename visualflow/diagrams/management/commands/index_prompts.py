@@ -0,0 +1,38 @@
+"""
+Build the near-duplicate prompt index for sessions completed before it existed
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from diagrams.models import PromptFingerprint, Session
+from diagrams.services.prompt_index import prompt_index
+
+
+class Command(BaseCommand):
+    help = "Fingerprint the prompts of completed sessions for near-duplicate reuse (new sessions are indexed on save)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the index first instead of only adding missing sessions')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            deleted, _ = PromptFingerprint.objects.all().delete()
+            self.stdout.write(f"Dropped {deleted} fingerprints")
+
+        sessions = (
+            Session.objects.filter(status='completed', generated_uml__isnull=False, prompt_fingerprint__isnull=True,
+                                   parent__isnull=True, reused=False)
+            .only('id', 'prompt', 'diagram_type')
+        )
+        started = time.perf_counter()
+        seen, written = prompt_index.rebuild(sessions, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {written} of {seen} sessions in {elapsed:.1f}s "
+            f"({seen - written} prompts too short to fingerprint)"
+        ))
@@ -0,0 +1,60 @@
+"""
+Serve the offline LLM stand-in so the app can run and be load-tested without the Groq API
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diagrams.services.llm_stub import StubConfig, StubLLMServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run an OpenAI/Groq-compatible chat completions server with configurable latency, "
+        "streaming speed and injected failures (point the app at it with LLM_BACKEND=stub)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', default='lognormal:400,0.4',
+                            help="Time to first token in ms: fixed:MS, uniform:LO,HI, normal:MEAN,SD "
+                                 "or lognormal:MEDIAN,SIGMA")
+        parser.add_argument('--tokens-per-second', type=float, default=500,
+                            help='Completion speed after the first token (0 = instant)')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests answered with --error-status')
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--timeout-rate', type=float, default=0.0,
+                            help='Fraction of requests that hang without answering')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Seed for reproducible latencies and failures')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] + options['timeout_rate'] <= 1:
+            raise CommandError("--error-rate plus --timeout-rate must be between 0 and 1")
+        try:
+            config = StubConfig(
+                latency=options['latency'],
+                tokens_per_second=options['tokens_per_second'],
+                error_rate=options['error_rate'],
+                error_status=options['error_status'],
+                timeout_rate=options['timeout_rate'],
+                seed=options['seed'],
+            )
+            server = StubLLMServer(options['host'], options['port'], config)
+        except ValueError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f"Cannot listen on {options['host']}:{options['port']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"LLM stub listening on {server.url}"))
+        self.stdout.write(f"  latency {options['latency']}, {options['tokens_per_second']:g} tokens/s, "
+                          f"errors {options['error_rate']:.0%} (HTTP {options['error_status']}), "
+                          f"hangs {options['timeout_rate']:.0%}")
+        self.stdout.write(f"  run the app with LLM_BACKEND=stub LLM_STUB_URL={server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,56 @@
+"""
+Train the local diagram-type classifier from completed sessions
+"""
+
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagrams.models import Session
+from diagrams.services.intent_classifier import IntentClassifier
+
+
+class Command(BaseCommand):
+    help = ("Train the local intent classifier from completed sessions whose diagram type the user picked "
+            "(auto-detected types would teach it its own predictions)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.INTENT_CLASSIFIER_PATH),
+                            help='Where to write the model file')
+        parser.add_argument('--min-per-type', type=int, default=5,
+                            help='Drop diagram types with fewer completed sessions than this')
+        parser.add_argument('--max-samples', type=int, default=50000,
+                            help='Use at most this many of the most recent sessions')
+        parser.add_argument('--epochs', type=int, default=25)
+        parser.add_argument('--min-df', type=int, default=2)
+
+    def handle(self, *args, **options):
+        rows = list(
+            Session.objects.filter(status='completed', explicit_type=True, parent__isnull=True)
+            .order_by('-created_at')
+            .values_list('prompt', 'diagram_type')[:options['max_samples']]
+        )
+
+        counts = Counter(diagram_type for _, diagram_type in rows)
+        keep = {t for t, n in counts.items() if n >= options['min_per_type']}
+        rows = [(prompt, t) for prompt, t in rows if t in keep]
+
+        dropped = sorted(t for t in counts if t not in keep)
+        if dropped:
+            self.stdout.write(f"Skipping types with too few examples: {', '.join(dropped)}")
+
+        if len(keep) < 2:
+            raise CommandError("Need completed sessions with a user-picked type for at least two diagram types to train")
+
+        classifier = IntentClassifier()
+        report = classifier.train(
+            [prompt for prompt, _ in rows],
+            [t for _, t in rows],
+            min_df=options['min_df'],
+            epochs=options['epochs'],
+        )
+        classifier.save(options['output'])
+
+        self.stdout.write(self.style.SUCCESS(f"Saved intent classifier to {options['output']}"))
+        for key, value in report.items():
+            self.stdout.write(f"  {key}: {value}")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0002_contact_remove_diagramfeedback_session_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespace', models.CharField(help_text="Cache namespace (e.g. 'generation')", max_length=32)),
+                ('key', models.CharField(help_text='SHA-256 of the normalized request', max_length=64)),
+                ('value', models.TextField(help_text='Cached response payload')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the entry was stored')),
+                ('expires_at', models.DateTimeField(help_text='When the entry stops being served')),
+                ('last_accessed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Last time the entry was served, used for eviction')),
+                ('hit_count', models.PositiveIntegerField(default=0, help_text='Number of times the entry was served')),
+            ],
+            options={
+                'verbose_name': 'LLM Cache Entry',
+                'verbose_name_plural': 'LLM Cache Entries',
+                'indexes': [models.Index(fields=['expires_at'], name='diagrams_ll_expires_5b86c9_idx'), models.Index(fields=['namespace', 'last_accessed_at'], name='diagrams_ll_namespa_706bd1_idx')],
+                'constraints': [models.UniqueConstraint(fields=('namespace', 'key'), name='unique_llm_cache_key')],
+            },
+        ),
+    ]
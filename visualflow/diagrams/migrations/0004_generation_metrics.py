@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0003_llm_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationMetrics',
+            fields=[
+                ('session', models.OneToOneField(help_text='Session these metrics belong to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='generation_metrics', serialize=False, to='diagrams.session')),
+                ('mode', models.CharField(blank=True, help_text='Generation mode (two_step, fused, speculative)', max_length=20)),
+                ('model_name', models.CharField(blank=True, help_text='LLM that served the generation', max_length=100)),
+                ('analyzer_ms', models.FloatField(default=0, help_text='Time spent in the analyzer LLM call')),
+                ('generator_ms', models.FloatField(default=0, help_text='Time spent in the generator (or fused) LLM call')),
+                ('fixer_ms', models.FloatField(default=0, help_text='Time spent cleaning and fixing the Mermaid code')),
+                ('db_ms', models.FloatField(default=0, help_text='Time spent saving the session')),
+                ('total_ms', models.FloatField(default=0, help_text='Wall time of the whole generation')),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('llm_calls', models.PositiveSmallIntegerField(default=0, help_text='LLM calls actually made')),
+                ('cache_hits', models.PositiveSmallIntegerField(default=0, help_text='Steps served from the LLM cache')),
+                ('used_fallback', models.BooleanField(default=False, help_text='Served by the offline fallback generator')),
+                ('steps', models.JSONField(blank=True, default=list, help_text='Raw per-call records (step, ms, tokens, model, cached)')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Generation Metrics',
+                'verbose_name_plural': 'Generation Metrics',
+                'indexes': [models.Index(fields=['created_at'], name='diagrams_ge_created_32a898_idx')],
+            },
+        ),
+    ]
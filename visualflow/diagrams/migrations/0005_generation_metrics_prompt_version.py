@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0004_generation_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationmetrics',
+            name='prompt_version',
+            field=models.CharField(blank=True, help_text='System prompt that produced the diagram (name/variant@hash)', max_length=100),
+        ),
+    ]
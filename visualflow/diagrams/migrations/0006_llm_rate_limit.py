@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0005_generation_metrics_prompt_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMRateLimit',
+            fields=[
+                ('name', models.CharField(help_text="Bucket name (e.g. 'groq')", max_length=50, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField(help_text='Requests available as of updated_at')),
+                ('updated_at', models.FloatField(help_text='Unix time of the last refill')),
+                ('blocked_until', models.FloatField(default=0, help_text='Unix time before which no request may be sent (set from 429s and rate-limit headers)')),
+                ('version', models.PositiveBigIntegerField(default=0, help_text='Incremented on every update; writers only succeed against the version they read')),
+            ],
+            options={
+                'verbose_name': 'LLM Rate Limit',
+                'verbose_name_plural': 'LLM Rate Limits',
+            },
+        ),
+    ]
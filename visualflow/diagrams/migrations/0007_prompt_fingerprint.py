@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0006_llm_rate_limit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptFingerprint',
+            fields=[
+                ('session', models.OneToOneField(help_text='Completed session this prompt belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='prompt_fingerprint', serialize=False, to='diagrams.session')),
+                ('diagram_type', models.CharField(help_text='Diagram type, with aliases folded (erd -> er)', max_length=20)),
+                ('features', models.TextField(help_text='Space-separated normalized words and word pairs the bands were computed from')),
+                ('band0', models.BigIntegerField()),
+                ('band1', models.BigIntegerField()),
+                ('band2', models.BigIntegerField()),
+                ('band3', models.BigIntegerField()),
+                ('band4', models.BigIntegerField()),
+                ('band5', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Prompt Fingerprint',
+                'verbose_name_plural': 'Prompt Fingerprints',
+                'indexes': [models.Index(fields=['diagram_type', 'band0'], name='prompt_fp_band0_idx'), models.Index(fields=['diagram_type', 'band1'], name='prompt_fp_band1_idx'), models.Index(fields=['diagram_type', 'band2'], name='prompt_fp_band2_idx'), models.Index(fields=['diagram_type', 'band3'], name='prompt_fp_band3_idx'), models.Index(fields=['diagram_type', 'band4'], name='prompt_fp_band4_idx'), models.Index(fields=['diagram_type', 'band5'], name='prompt_fp_band5_idx')],
+            },
+        ),
+    ]
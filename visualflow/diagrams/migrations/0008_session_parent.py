@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0007_prompt_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Session this one was refined from; its prompt is then the edit instruction', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='diagrams.session'),
+        ),
+    ]
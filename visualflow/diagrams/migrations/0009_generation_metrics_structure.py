@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0008_session_parent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationmetrics',
+            name='edge_count',
+            field=models.PositiveIntegerField(default=0, help_text='Edges in the final diagram'),
+        ),
+        migrations.AddField(
+            model_name='generationmetrics',
+            name='node_count',
+            field=models.PositiveIntegerField(default=0, help_text='Nodes in the final diagram'),
+        ),
+    ]
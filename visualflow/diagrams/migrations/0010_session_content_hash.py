@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0009_generation_metrics_structure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the canonical Mermaid code; equal for diagrams that differ only in formatting', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['content_hash'], name='diagrams_se_content_0f23ad_idx'),
+        ),
+    ]
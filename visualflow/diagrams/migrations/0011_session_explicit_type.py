@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0010_session_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='explicit_type',
+            field=models.BooleanField(default=False, help_text='True when the user picked the diagram type; only these sessions train the intent classifier'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+def mark_reused_sessions(apps, schema_editor):
+    """Flag copies served before the field existed and drop them from the prompt index"""
+    Session = apps.get_model('diagrams', 'Session')
+    PromptFingerprint = apps.get_model('diagrams', 'PromptFingerprint')
+    reused = Session.objects.filter(generation_metrics__mode='reuse')
+    reused.update(reused=True)
+    PromptFingerprint.objects.filter(session__reused=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0011_session_explicit_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='reused',
+            field=models.BooleanField(default=False, help_text="True when the diagram was copied from a near-duplicate prompt's session instead of generated"),
+        ),
+        migrations.RunPython(mark_reused_sessions, migrations.RunPython.noop),
+    ]
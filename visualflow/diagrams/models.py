@@ -49,6 +49,17 @@ class Session(models.Model):
         null=True
     )
     
+    explicit_type = models.BooleanField(
+        default=False,
+        help_text="True when the user picked the diagram type; only these sessions train the intent classifier"
+    )
+    
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA-256 of the canonical Mermaid code; equal for diagrams that differ only in formatting"
+    )
+    
     status = models.CharField(
         max_length=20,
         choices=[
@@ -77,6 +88,20 @@ class Session(models.Model):
         help_text="When the session was last updated"
     )
     
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        related_name='revisions',
+        blank=True,
+        null=True,
+        help_text="Session this one was refined from; its prompt is then the edit instruction"
+    )
+    
+    reused = models.BooleanField(
+        default=False,
+        help_text="True when the diagram was copied from a near-duplicate prompt's session instead of generated"
+    )
+    
     # Optional user association (for future user management)
     user_ip = models.GenericIPAddressField(
         help_text="IP address of the user",
@@ -98,6 +123,7 @@ class Session(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['diagram_type']),
             models.Index(fields=['status']),
+            models.Index(fields=['content_hash']),
         ]
     
     def __str__(self):
@@ -110,6 +136,11 @@ class Session(models.Model):
             return f"{self.prompt[:100]}..."
         return self.prompt
     
+    @property
+    def is_revision(self):
+        """Check if the session edits an earlier diagram instead of generating from scratch"""
+        return self.parent_id is not None
+    
     @property
     def is_completed(self):
         """Check if the session is completed successfully"""
@@ -131,3 +162,204 @@ class Session(models.Model):
         
         super().save(*args, **kwargs)
 
+
+
+class LLMCacheEntry(models.Model):
+    """
+    Persistent tier of the LLM response cache, keyed by a content hash of everything
+    that influences the model output
+    """
+    namespace = models.CharField(
+        max_length=32,
+        help_text="Cache namespace (e.g. 'generation')"
+    )
+    
+    key = models.CharField(
+        max_length=64,
+        help_text="SHA-256 of the normalized request"
+    )
+    
+    value = models.TextField(
+        help_text="Cached response payload"
+    )
+    
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="When the entry was stored"
+    )
+    
+    expires_at = models.DateTimeField(
+        help_text="When the entry stops being served"
+    )
+    
+    last_accessed_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Last time the entry was served, used for eviction"
+    )
+    
+    hit_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of times the entry was served"
+    )
+    
+    class Meta:
+        verbose_name = "LLM Cache Entry"
+        verbose_name_plural = "LLM Cache Entries"
+        constraints = [
+            models.UniqueConstraint(fields=['namespace', 'key'], name='unique_llm_cache_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['namespace', 'last_accessed_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.namespace}:{self.key[:12]}"
+    
+    @property
+    def is_expired(self):
+        """Check if the entry is past its TTL"""
+        return self.expires_at <= timezone.now()
+
+
+class LLMRateLimit(models.Model):
+    """
+    Token bucket shared by every worker process, updated with compare-and-swap on `version`
+    """
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        help_text="Bucket name (e.g. 'groq')"
+    )
+    
+    tokens = models.FloatField(
+        help_text="Requests available as of updated_at"
+    )
+    
+    updated_at = models.FloatField(
+        help_text="Unix time of the last refill"
+    )
+    
+    blocked_until = models.FloatField(
+        default=0,
+        help_text="Unix time before which no request may be sent (set from 429s and rate-limit headers)"
+    )
+    
+    version = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Incremented on every update; writers only succeed against the version they read"
+    )
+    
+    class Meta:
+        verbose_name = "LLM Rate Limit"
+        verbose_name_plural = "LLM Rate Limits"
+    
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.1f} tokens"
+
+
+class GenerationMetrics(models.Model):
+    """
+    Per-session timings and LLM usage, kept out of the Session row
+    """
+    session = models.OneToOneField(
+        Session,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='generation_metrics',
+        help_text="Session these metrics belong to"
+    )
+    
+    mode = models.CharField(
+        max_length=20,
+        blank=True,
+        help_text="Generation mode (two_step, fused, speculative)"
+    )
+    
+    model_name = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="LLM that served the generation"
+    )
+    
+    prompt_version = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="System prompt that produced the diagram (name/variant@hash)"
+    )
+    
+    analyzer_ms = models.FloatField(default=0, help_text="Time spent in the analyzer LLM call")
+    generator_ms = models.FloatField(default=0, help_text="Time spent in the generator (or fused) LLM call")
+    fixer_ms = models.FloatField(default=0, help_text="Time spent cleaning and fixing the Mermaid code")
+    db_ms = models.FloatField(default=0, help_text="Time spent saving the session")
+    total_ms = models.FloatField(default=0, help_text="Wall time of the whole generation")
+    
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    llm_calls = models.PositiveSmallIntegerField(default=0, help_text="LLM calls actually made")
+    cache_hits = models.PositiveSmallIntegerField(default=0, help_text="Steps served from the LLM cache")
+    used_fallback = models.BooleanField(default=False, help_text="Served by the offline fallback generator")
+    node_count = models.PositiveIntegerField(default=0, help_text="Nodes in the final diagram")
+    edge_count = models.PositiveIntegerField(default=0, help_text="Edges in the final diagram")
+    
+    steps = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Raw per-call records (step, ms, tokens, model, cached)"
+    )
+    
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = "Generation Metrics"
+        verbose_name_plural = "Generation Metrics"
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Metrics for {self.session_id} - {self.total_ms:.0f}ms"
+    
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+class PromptFingerprint(models.Model):
+    """
+    MinHash LSH bands of a completed session's prompt, for near-duplicate lookups
+    """
+    session = models.OneToOneField(
+        Session,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='prompt_fingerprint',
+        help_text="Completed session this prompt belongs to"
+    )
+    
+    diagram_type = models.CharField(
+        max_length=20,
+        help_text="Diagram type, with aliases folded (erd -> er)"
+    )
+    
+    features = models.TextField(
+        help_text="Space-separated normalized words and word pairs the bands were computed from"
+    )
+    
+    band0 = models.BigIntegerField()
+    band1 = models.BigIntegerField()
+    band2 = models.BigIntegerField()
+    band3 = models.BigIntegerField()
+    band4 = models.BigIntegerField()
+    band5 = models.BigIntegerField()
+    
+    class Meta:
+        verbose_name = "Prompt Fingerprint"
+        verbose_name_plural = "Prompt Fingerprints"
+        indexes = [
+            models.Index(fields=['diagram_type', f'band{band}'], name=f'prompt_fp_band{band}_idx')
+            for band in range(6)
+        ]
+    
+    def __str__(self):
+        return f"Fingerprint of {self.session_id} ({self.diagram_type})"
@@ -0,0 +1,241 @@
+"""
+Two-tier (memory LRU + database) cache for LLM responses
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Optional
+from django.db.models import F
+from django.utils import timezone
+from config.env_config import EnvConfig
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt used in cache keys"""
+    return re.sub(r'\s+', ' ', prompt).strip().lower()
+
+
+def text_version(text: str) -> str:
+    """Short content hash identifying a version of a system prompt"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+
+
+def make_cache_key(**parts) -> str:
+    """
+    Build a content-addressed cache key
+
+    Args:
+        **parts: Every input that influences the cached output
+
+    Returns:
+        str: Hex SHA-256 of the canonical JSON encoding of the parts
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        """Initialize the LRU"""
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the value for key, or None if missing or expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        """Store value for ttl seconds, evicting the least recently used entry if full"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Memory LRU in front of the LLMCacheEntry table.
+
+    Memory hits cost nothing; DB hits are promoted into memory. The DB tier
+    honours the TTL on read and is trimmed to `max_db_entries` (least recently
+    accessed first) every `sweep_every` writes. DB failures are logged and
+    treated as misses - the cache must never break generation.
+    """
+
+    def __init__(self, namespace: str, memory_entries: int, ttl_seconds: int,
+                 max_db_entries: int, sweep_every: int = 50):
+        """Initialize the cache"""
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.sweep_every = sweep_every
+        self.memory = LRUCache(memory_entries)
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _metric(self, event: str) -> str:
+        return f"cache.{self.namespace}.{event}"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached value
+
+        Args:
+            key (str): Key from make_cache_key
+
+        Returns:
+            Optional[str]: Cached value or None on miss
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.incr(self._metric('hit_memory'))
+            return value
+
+        from ..models import LLMCacheEntry
+
+        try:
+            now = timezone.now()
+            entry = LLMCacheEntry.objects.filter(
+                namespace=self.namespace, key=key, expires_at__gt=now
+            ).only('value', 'expires_at').first()
+            if entry is not None:
+                LLMCacheEntry.objects.filter(pk=entry.pk).update(
+                    last_accessed_at=now, hit_count=F('hit_count') + 1
+                )
+                remaining = (entry.expires_at - now).total_seconds()
+                self.memory.set(key, entry.value, remaining)
+                metrics.incr(self._metric('hit_db'))
+                return entry.value
+        except Exception as e:
+            logger.warning(f"Cache lookup failed for {self.namespace}: {e}")
+
+        metrics.incr(self._metric('miss'))
+        return None
+
+    def set(self, key: str, value: str):
+        """
+        Store a value in both tiers
+
+        Args:
+            key (str): Key from make_cache_key
+            value (str): Payload to cache
+        """
+        self.memory.set(key, value, self.ttl_seconds)
+
+        from ..models import LLMCacheEntry
+
+        try:
+            now = timezone.now()
+            LLMCacheEntry.objects.update_or_create(
+                namespace=self.namespace,
+                key=key,
+                defaults={
+                    'value': value,
+                    'created_at': now,
+                    'expires_at': now + timedelta(seconds=self.ttl_seconds),
+                    'last_accessed_at': now,
+                }
+            )
+            metrics.incr(self._metric('store'))
+        except Exception as e:
+            logger.warning(f"Cache store failed for {self.namespace}: {e}")
+            return
+
+        with self._writes_lock:
+            self._writes += 1
+            should_sweep = self._writes % self.sweep_every == 0
+        if should_sweep:
+            self.evict()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this namespace (current process)"""
+        hits_memory = metrics.counter(self._metric('hit_memory'))
+        hits_db = metrics.counter(self._metric('hit_db'))
+        misses = metrics.counter(self._metric('miss'))
+        lookups = hits_memory + hits_db + misses
+        return {
+            'hits_memory': hits_memory,
+            'hits_db': hits_db,
+            'misses': misses,
+            'hit_rate': round((hits_memory + hits_db) / lookups, 4) if lookups else 0.0,
+            'memory_entries': len(self.memory),
+        }
+
+    def evict(self) -> int:
+        """
+        Delete expired rows and trim the namespace to max_db_entries
+
+        Returns:
+            int: Number of rows deleted
+        """
+        from ..models import LLMCacheEntry
+
+        try:
+            deleted, _ = LLMCacheEntry.objects.filter(
+                namespace=self.namespace, expires_at__lte=timezone.now()
+            ).delete()
+
+            overflow_ids = list(
+                LLMCacheEntry.objects.filter(namespace=self.namespace)
+                .order_by('-last_accessed_at')
+                .values_list('pk', flat=True)[self.max_db_entries:]
+            )
+            if overflow_ids:
+                trimmed, _ = LLMCacheEntry.objects.filter(pk__in=overflow_ids).delete()
+                deleted += trimmed
+
+            if deleted:
+                metrics.incr(self._metric('evicted'), deleted)
+                logger.info(f"Evicted {deleted} {self.namespace} cache entries")
+            return deleted
+        except Exception as e:
+            logger.warning(f"Cache eviction failed for {self.namespace}: {e}")
+            return 0
+
+
+generation_cache = TwoTierCache(
+    namespace='generation',
+    memory_entries=EnvConfig.LLM_CACHE_MEMORY_ENTRIES,
+    ttl_seconds=EnvConfig.LLM_CACHE_TTL_SECONDS,
+    max_db_entries=EnvConfig.LLM_CACHE_MAX_DB_ENTRIES,
+)
+
+analysis_cache = TwoTierCache(
+    namespace='analysis',
+    memory_entries=EnvConfig.LLM_CACHE_MEMORY_ENTRIES,
+    ttl_seconds=EnvConfig.LLM_CACHE_TTL_SECONDS,
+    max_db_entries=EnvConfig.LLM_CACHE_MAX_DB_ENTRIES,
+)
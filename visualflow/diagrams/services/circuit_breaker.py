@@ -0,0 +1,110 @@
+"""
+Circuit breaker for the LLM API - fail fast while the upstream is erroring
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from config.constants import AppConstants
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker.
+
+    closed:    calls pass; the last `window_size` outcomes are tracked and the
+               breaker opens once at least `min_calls` were seen and the failure
+               rate reaches `failure_rate`.
+    open:      calls are rejected for `open_seconds`.
+    half_open: one probe call is let through; success closes the breaker,
+               failure re-opens it. A probe that never reports back (e.g. a
+               cancelled call) is replaced after another `open_seconds`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window_size: int, min_calls: int,
+                 failure_rate: float, open_seconds: float):
+        """Initialize a closed breaker"""
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window_size)  # True = failure
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_at = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """True if a call may be made now"""
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN:
+                now = time.monotonic()
+                if self._probe_at is None or now - self._probe_at >= self.open_seconds:
+                    self._probe_at = now
+                    return True
+        metrics.incr(f'breaker.{self.name}.rejected')
+        return False
+
+    def record_success(self):
+        """Report a call that reached the upstream and got an answer"""
+        with self._lock:
+            self._refresh()
+            if self._state == self.HALF_OPEN and self._probe_at is not None:
+                self._transition(self.CLOSED)
+            elif self._state == self.CLOSED:
+                self._outcomes.append(False)
+
+    def record_failure(self):
+        """Report a call that failed because of the upstream (timeout, 429, 5xx, ...)"""
+        with self._lock:
+            self._refresh()
+            if self._state == self.HALF_OPEN and self._probe_at is not None:
+                self._transition(self.OPEN)
+            elif self._state == self.CLOSED:
+                self._outcomes.append(True)
+                failures = sum(self._outcomes)
+                if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                    self._transition(self.OPEN)
+
+    def _refresh(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probe_at = None
+
+    def _transition(self, state: str):
+        self._state = state
+        self._probe_at = None
+        self._outcomes.clear()
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+            logger.warning(f"Circuit '{self.name}' opened, failing fast for {self.open_seconds}s")
+        else:
+            logger.info(f"Circuit '{self.name}' closed")
+        metrics.incr(f'breaker.{self.name}.{state}')
+
+
+llm_breaker = CircuitBreaker(
+    'llm',
+    window_size=AppConstants.AI_MODELS['BREAKER_WINDOW_SIZE'],
+    min_calls=AppConstants.AI_MODELS['BREAKER_MIN_CALLS'],
+    failure_rate=AppConstants.AI_MODELS['BREAKER_FAILURE_RATE'],
+    open_seconds=AppConstants.AI_MODELS['BREAKER_OPEN_SECONDS'],
+)
@@ -0,0 +1,299 @@
+"""
+Offline diagram generator - builds a degraded but valid diagram from the prompt's keywords
+
+Used when the LLM is unavailable (circuit open, errors, no API key). Pure string
+processing, so it answers in well under a millisecond.
+"""
+
+import re
+from datetime import date
+from typing import Callable, Dict, List
+
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'for', 'to', 'in', 'on', 'with', 'by', 'from',
+    'at', 'as', 'is', 'are', 'be', 'that', 'this', 'it', 'its', 'into', 'between',
+    'create', 'make', 'generate', 'design', 'draw', 'show', 'showing', 'build', 'give',
+    'diagram', 'chart', 'flowchart', 'flow', 'graph', 'uml', 'erd', 'er', 'dfd',
+    'sequence', 'class', 'state', 'entity', 'entities', 'relationship', 'relationships',
+    'system', 'simple', 'basic', 'detailed', 'proper', 'including', 'include', 'using',
+    'me', 'my', 'our', 'their', 'all', 'each', 'some', 'how', 'what', 'which', 'when',
+    'then', 'also', 'like', 'such', 'about', 'process', 'steps', 'step', 'please',
+    'where', 'who', 'can', 'will', 'should', 'has', 'have', 'they', 'them', 'while',
+    'via', 'per', 'new', 'want', 'need', 'needs',
+}
+
+STEP_SEPARATORS = re.compile(r'\s*(?:,|;|\.|->|=>|\bthen\b|\band\b|\bafter\b)\s*', re.IGNORECASE)
+WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9']*")
+NAME_RUN_RE = re.compile(r"[A-Z][A-Za-z0-9']*(?:[ \t]+[A-Z][A-Za-z0-9']*)*")
+
+MAX_ENTITIES = 6
+MAX_STEPS = 8
+
+
+def _label(text: str, limit: int = 40) -> str:
+    """Text safe inside Mermaid labels: no quotes, brackets or pipes"""
+    text = re.sub(r'[\"\'`\[\](){}<>|#;:]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) > limit:
+        text = text[:limit].rsplit(' ', 1)[0]
+    return text.strip() or 'Item'
+
+
+def _identifier(text: str) -> str:
+    """PascalCase identifier safe as a Mermaid node, class or entity name"""
+    words = WORD_RE.findall(text)
+    ident = ''.join(w[:1].upper() + w[1:] for w in words).replace("'", '')
+    if not ident or not ident[0].isalpha():
+        ident = f'Item{ident}'
+    return ident[:32]
+
+
+def extract_entities(prompt: str, limit: int = MAX_ENTITIES) -> List[str]:
+    """
+    Likely entity names, in order of first appearance
+
+    Runs of capitalised words are taken as explicit names ("User, Product and
+    Email Service"); otherwise the most frequent content words are used.
+    """
+    words = WORD_RE.findall(prompt)
+    seen = []
+
+    # Explicit names first; stopwords drop sentence-initial verbs like "Create"
+    for run in NAME_RUN_RE.findall(prompt):
+        parts = [w for w in run.split() if w.lower() not in STOPWORDS]
+        if not parts:
+            continue
+        name = _identifier(' '.join(parts))
+        if name not in seen:
+            seen.append(name)
+
+    if len(seen) < 2:
+        counts: Dict[str, int] = {}
+        for word in words:
+            lower = word.lower()
+            if lower in STOPWORDS or len(lower) < 3:
+                continue
+            counts[lower] = counts.get(lower, 0) + 1
+        for word in sorted(counts, key=lambda w: -counts[w]):
+            name = _identifier(word)
+            if name not in seen:
+                seen.append(name)
+            if len(seen) >= limit:
+                break
+
+    return seen[:limit] or ['User', 'System']
+
+
+def extract_steps(prompt: str, limit: int = MAX_STEPS) -> List[str]:
+    """Short step labels from the prompt's clauses"""
+    steps = []
+    for part in STEP_SEPARATORS.split(prompt):
+        words = [w for w in WORD_RE.findall(part) if w.lower() not in STOPWORDS]
+        if not words:
+            continue
+        label = _label(' '.join(words[:5]).capitalize(), 40)
+        if label not in steps:
+            steps.append(label)
+    if len(steps) < 2:
+        steps = [_label(e) for e in extract_entities(prompt)]
+    return steps[:limit]
+
+
+def _title(prompt: str) -> str:
+    return _label(prompt, 60)
+
+
+def build_flowchart(prompt: str) -> str:
+    lines = ['flowchart TD', '    Start([Start])']
+    previous = 'Start'
+    for index, step in enumerate(extract_steps(prompt), 1):
+        lines.append(f'    {previous} --> S{index}[{step}]')
+        previous = f'S{index}'
+    lines.append(f'    {previous} --> End([End])')
+    return '\n'.join(lines)
+
+
+def build_dfd(prompt: str) -> str:
+    entities = extract_entities(prompt)
+    lines = ['flowchart LR', f'    P1(({_label(entities[0])} Processing))']
+    for index, entity in enumerate(entities[1:] or ['User'], 1):
+        lines.append(f'    E{index}[{_label(entity)}] -->|request| P1')
+        lines.append(f'    P1 -->|response| E{index}')
+    lines.append('    P1 --> D1[(Data Store)]')
+    return '\n'.join(lines)
+
+
+def build_system_design(prompt: str) -> str:
+    entities = extract_entities(prompt)
+    lines = ['flowchart LR', '    Client[Client] --> Gateway[API Gateway]']
+    for index, entity in enumerate(entities, 1):
+        lines.append(f'    Gateway --> Svc{index}[{_label(entity)} Service]')
+        lines.append(f'    Svc{index} --> DB{index}[({_label(entity)} DB)]')
+    return '\n'.join(lines)
+
+
+def build_sequence(prompt: str) -> str:
+    participants = extract_entities(prompt)
+    if len(participants) < 2:
+        participants = ['User', 'System'] if participants[0] == 'User' else ['User', participants[0]]
+    steps = extract_steps(prompt)
+    lines = ['sequenceDiagram']
+    lines.extend(f'    participant {p}' for p in participants)
+    for index, step in enumerate(steps):
+        source = participants[index % len(participants)]
+        target = participants[(index + 1) % len(participants)]
+        lines.append(f'    {source}->>{target}: {step}')
+    lines.append(f'    {participants[1]}-->>{participants[0]}: Response')
+    return '\n'.join(lines)
+
+
+def build_class(prompt: str) -> str:
+    entities = extract_entities(prompt)
+    lines = ['classDiagram']
+    for entity in entities:
+        lines.extend([
+            f'    class {entity} {{',
+            '        +int id',
+            '        +String name',
+            '        +save()',
+            '    }',
+        ])
+    for entity in entities[1:]:
+        lines.append(f'    {entities[0]} --> {entity}')
+    return '\n'.join(lines)
+
+
+def build_er(prompt: str) -> str:
+    entities = [e.upper() for e in extract_entities(prompt)]
+    lines = ['erDiagram']
+    for entity in entities[1:]:
+        lines.append(f'    {entities[0]} ||--o{{ {entity} : has')
+    for entity in entities:
+        lines.extend([
+            f'    {entity} {{',
+            '        int id PK',
+            '        string name',
+            '    }',
+        ])
+    return '\n'.join(lines)
+
+
+def build_state(prompt: str) -> str:
+    states = [_identifier(step) for step in extract_steps(prompt)]
+    lines = ['stateDiagram-v2', f'    [*] --> {states[0]}']
+    for current, following in zip(states, states[1:]):
+        lines.append(f'    {current} --> {following}')
+    lines.append(f'    {states[-1]} --> [*]')
+    return '\n'.join(lines)
+
+
+def build_gantt(prompt: str) -> str:
+    lines = [
+        'gantt',
+        f'    title {_title(prompt)}',
+        '    dateFormat YYYY-MM-DD',
+        '    section Plan',
+    ]
+    for index, step in enumerate(extract_steps(prompt), 1):
+        start = date.today().isoformat() if index == 1 else f'after t{index - 1}'
+        lines.append(f'    {step} :t{index}, {start}, 3d')
+    return '\n'.join(lines)
+
+
+def build_pie(prompt: str) -> str:
+    lines = ['pie', f'    title {_title(prompt)}']
+    values = re.findall(r'([A-Za-z][A-Za-z ]{0,30}?)\s*[:=]?\s*(\d+(?:\.\d+)?)\s*%', prompt)
+    if values:
+        lines.extend(f'    "{_label(name)}" : {value}' for name, value in values)
+    else:
+        lines.extend(f'    "{_label(entity)}" : 1' for entity in extract_entities(prompt))
+    return '\n'.join(lines)
+
+
+def build_journey(prompt: str) -> str:
+    actor = extract_entities(prompt)[0]
+    lines = ['journey', f'    title {_title(prompt)}', '    section Journey']
+    lines.extend(f'      {step}: 3: {actor}' for step in extract_steps(prompt))
+    return '\n'.join(lines)
+
+
+def build_git(prompt: str) -> str:
+    branch = _identifier(extract_entities(prompt)[0]).lower() or 'feature'
+    return '\n'.join([
+        'gitGraph',
+        '    commit',
+        f'    branch {branch}',
+        f'    checkout {branch}',
+        '    commit',
+        '    commit',
+        '    checkout main',
+        f'    merge {branch}',
+        '    commit',
+    ])
+
+
+def build_mindmap(prompt: str) -> str:
+    lines = ['mindmap', f'  root(({_label(prompt, 30)}))']
+    lines.extend(f'    {_label(entity)}' for entity in extract_entities(prompt))
+    return '\n'.join(lines)
+
+
+def build_timeline(prompt: str) -> str:
+    lines = ['timeline', f'    title {_title(prompt)}']
+    lines.extend(f'    Phase {index} : {step}' for index, step in enumerate(extract_steps(prompt), 1))
+    return '\n'.join(lines)
+
+
+def build_quadrant(prompt: str) -> str:
+    entities = extract_entities(prompt)
+    lines = [
+        'quadrantChart',
+        f'    title {_title(prompt)}',
+        '    x-axis Low Effort --> High Effort',
+        '    y-axis Low Impact --> High Impact',
+        '    quadrant-1 Plan',
+        '    quadrant-2 Do first',
+        '    quadrant-3 Skip',
+        '    quadrant-4 Delegate',
+    ]
+    count = len(entities)
+    for index, entity in enumerate(entities):
+        x = round(0.15 + 0.7 * index / max(count - 1, 1), 2)
+        y = round(0.8 - 0.6 * ((index * 3) % count) / max(count - 1, 1), 2)
+        lines.append(f'    {entity}: [{x}, {y}]')
+    return '\n'.join(lines)
+
+
+BUILDERS: Dict[str, Callable[[str], str]] = {
+    'flowchart': build_flowchart,
+    'custom': build_flowchart,
+    'dfd': build_dfd,
+    'system_design': build_system_design,
+    'sequence': build_sequence,
+    'class': build_class,
+    'uml': build_class,
+    'er': build_er,
+    'erd': build_er,
+    'state': build_state,
+    'gantt': build_gantt,
+    'pie': build_pie,
+    'journey': build_journey,
+    'git': build_git,
+    'mindmap': build_mindmap,
+    'timeline': build_timeline,
+    'quadrant': build_quadrant,
+}
+
+
+def build_fallback_diagram(prompt: str, diagram_type: str) -> str:
+    """
+    Build Mermaid code for a diagram type without calling the LLM
+
+    Args:
+        prompt (str): User prompt
+        diagram_type (str): Requested diagram type; unknown types get a flowchart
+
+    Returns:
+        str: Mermaid code
+    """
+    return BUILDERS.get(diagram_type, build_flowchart)(prompt)
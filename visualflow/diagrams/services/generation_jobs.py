@@ -0,0 +1,360 @@
+"""
+Background diagram generation - runs the LLM pipeline off the request worker
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from config.env_config import EnvConfig
+from .stream_bus import stream_bus
+from .tracing import generation_trace
+
+logger = logging.getLogger(__name__)
+
+
+def generate_diagram_for_session(session, mode: Optional[str] = None, explicit_type: bool = False):
+    """
+    Generate the Mermaid diagram for a session and persist the result
+
+    Args:
+        session (Session): Session in 'processing' state
+        mode (Optional[str]): Generation mode override ('two_step', 'fused' or 'speculative')
+        explicit_type (bool): True when the user picked the diagram type
+    """
+    with stream_bus.publishing(session.id) as channel:
+        try:
+            _generate_and_save(session, mode, explicit_type)
+        finally:
+            channel.close({'status': session.status})
+
+
+def _generate_and_save(session, mode: Optional[str], explicit_type: bool):
+    """Run the pipeline for a session and persist the outcome"""
+    with generation_trace() as trace:
+        _run_pipeline(session, mode, explicit_type, trace)
+
+
+def _run_pipeline(session, mode: Optional[str], explicit_type: bool, trace):
+    try:
+        from .mermaid_service import mermaid_service
+
+        if session.parent_id:
+            # A revision edits its parent's diagram; its prompt is the edit instruction
+            mermaid_code, error = mermaid_service.refine_mermaid_code(
+                _parent_code(session),
+                session.prompt,
+                session.diagram_type
+            )
+            detected_type = None
+        else:
+            # Generate Mermaid code based on diagram type
+            mermaid_code, error, detected_type = mermaid_service.generate_mermaid_code(
+                session.prompt,
+                session.diagram_type,
+                mode=mode,
+                explicit_type=explicit_type
+            )
+
+        if error:
+            session.status = 'failed'
+            session.error_message = error
+            _save_session(session, trace)
+            return
+
+        # Update diagram type if AI detected a better one
+        if detected_type and detected_type != session.diagram_type:
+            logger.info(f"AI detected diagram type: {detected_type} (original: {session.diagram_type})")
+            session.diagram_type = detected_type
+
+        # Save results - Mermaid renders in frontend, no server-side SVG needed
+        session.generated_uml = mermaid_code
+        session.diagram_svg = mermaid_code  # Store Mermaid code for frontend rendering
+        session.status = 'completed'
+        _save_session(session, trace)
+
+        logger.info(f"Successfully generated Mermaid diagram for session {session.id}")
+
+    except Exception as e:
+        session.status = 'failed'
+        session.error_message = str(e)
+        _save_session(session, trace)
+        logger.error(f"Error generating diagram for session {session.id}: {str(e)}")
+
+
+def _parent_code(session) -> Optional[str]:
+    """Current Mermaid code of the session a revision was made from"""
+    from ..models import Session
+
+    return Session.objects.filter(pk=session.parent_id).values_list('generated_uml', flat=True).first()
+
+
+def _save_session(session, trace):
+    """Save the session outcome, then the generation metrics collected on the trace"""
+    from ..models import GenerationMetrics
+
+    started = time.perf_counter()
+    session.save()
+    db_ms = (time.perf_counter() - started) * 1000
+    try:
+        GenerationMetrics.objects.update_or_create(
+            session=session,
+            defaults={**trace.summary(), 'db_ms': round(db_ms, 2)}
+        )
+    except Exception as e:
+        logger.error(f"Failed to save generation metrics for session {session.id}: {e}")
+
+
+async def agenerate_diagram_for_session(session, mode: Optional[str] = None, explicit_type: bool = False):
+    """Async generate_diagram_for_session, for jobs running on the ASGI event loop"""
+    with stream_bus.publishing(session.id) as channel:
+        try:
+            await _agenerate_and_save(session, mode, explicit_type)
+        finally:
+            channel.close({'status': session.status})
+
+
+async def _agenerate_and_save(session, mode: Optional[str], explicit_type: bool):
+    """Async _generate_and_save"""
+    with generation_trace() as trace:
+        await _arun_pipeline(session, mode, explicit_type, trace)
+
+
+async def _arun_pipeline(session, mode: Optional[str], explicit_type: bool, trace):
+    try:
+        from .mermaid_service import mermaid_service
+
+        if session.parent_id:
+            mermaid_code, error = await mermaid_service.arefine_mermaid_code(
+                await _aparent_code(session),
+                session.prompt,
+                session.diagram_type
+            )
+            detected_type = None
+        else:
+            mermaid_code, error, detected_type = await mermaid_service.agenerate_mermaid_code(
+                session.prompt,
+                session.diagram_type,
+                mode=mode,
+                explicit_type=explicit_type
+            )
+
+        if error:
+            session.status = 'failed'
+            session.error_message = error
+            await _asave_session(session, trace)
+            return
+
+        if detected_type and detected_type != session.diagram_type:
+            logger.info(f"AI detected diagram type: {detected_type} (original: {session.diagram_type})")
+            session.diagram_type = detected_type
+
+        session.generated_uml = mermaid_code
+        session.diagram_svg = mermaid_code
+        session.status = 'completed'
+        await _asave_session(session, trace)
+
+        logger.info(f"Successfully generated Mermaid diagram for session {session.id}")
+
+    except Exception as e:
+        session.status = 'failed'
+        session.error_message = str(e)
+        await _asave_session(session, trace)
+        logger.error(f"Error generating diagram for session {session.id}: {str(e)}")
+
+
+async def _aparent_code(session) -> Optional[str]:
+    """Async _parent_code"""
+    from ..models import Session
+
+    return await Session.objects.filter(pk=session.parent_id).values_list('generated_uml', flat=True).afirst()
+
+
+async def _asave_session(session, trace):
+    """Async _save_session"""
+    from ..models import GenerationMetrics
+
+    started = time.perf_counter()
+    await session.asave()
+    db_ms = (time.perf_counter() - started) * 1000
+    try:
+        await GenerationMetrics.objects.aupdate_or_create(
+            session=session,
+            defaults={**trace.summary(), 'db_ms': round(db_ms, 2)}
+        )
+    except Exception as e:
+        logger.error(f"Failed to save generation metrics for session {session.id}: {e}")
+
+
+class GenerationJobRunner:
+    """
+    Bounded in-process executor for diagram generation jobs.
+
+    At most `max_workers` generations talk to the LLM at once and at most
+    `max_pending` jobs (running + queued) are accepted; beyond that `submit`
+    refuses the job so the caller can fail fast instead of queueing forever.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        """Initialize the job runner"""
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='diagram-gen'
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._session_ids = set()
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently running or waiting for a worker"""
+        with self._lock:
+            return self._pending
+
+    def owns(self, session_id) -> bool:
+        """True if this process accepted the session's job and it has not finished yet"""
+        with self._lock:
+            return str(session_id) in self._session_ids
+
+    def submit(self, session_id, mode: Optional[str] = None, explicit_type: bool = False) -> bool:
+        """
+        Queue generation for a session
+
+        Args:
+            session_id: Primary key of a Session in 'processing' state
+            mode (Optional[str]): Generation mode override
+            explicit_type (bool): True when the user picked the diagram type
+
+        Returns:
+            bool: True if the job was accepted, False if the queue is full
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                logger.warning(f"Generation queue full ({self._pending} pending), rejecting session {session_id}")
+                return False
+            self._pending += 1
+            self._session_ids.add(str(session_id))
+
+        try:
+            self._executor.submit(self._run, session_id, mode, explicit_type)
+        except RuntimeError as e:
+            with self._lock:
+                self._pending -= 1
+                self._session_ids.discard(str(session_id))
+            logger.error(f"Failed to queue generation for session {session_id}: {e}")
+            return False
+
+        logger.info(f"Queued generation for session {session_id}")
+        return True
+
+    def _run(self, session_id, mode, explicit_type):
+        """Worker entry point - owns its own DB connection like a request would"""
+        from ..models import Session
+
+        close_old_connections()
+        try:
+            session = Session.objects.get(id=session_id)
+            if session.status != 'processing':
+                # Expired by the status view while queued; don't pay for a result nobody waits for
+                logger.warning(f"Session {session_id} is {session.status}, skipping its queued generation")
+                return
+            generate_diagram_for_session(session, mode=mode, explicit_type=explicit_type)
+        except Session.DoesNotExist:
+            logger.warning(f"Session {session_id} was deleted before generation started")
+        except Exception as e:
+            logger.error(f"Generation job for session {session_id} crashed: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._session_ids.discard(str(session_id))
+            close_old_connections()
+
+
+
+class AsyncGenerationJobRunner:
+    """
+    Event-loop counterpart of GenerationJobRunner for ASGI deployments.
+
+    Jobs are asyncio tasks on the server's loop, so a generation waiting on the
+    LLM costs a coroutine rather than a thread and `max_concurrency` can be far
+    higher than GENERATION_MAX_WORKERS. Must only be used from async views
+    served by an ASGI server: under WSGI the per-request loop is torn down
+    when the response is returned, taking the task with it.
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        """Initialize the job runner"""
+        self.max_concurrency = max_concurrency
+        self.max_pending = max(max_pending, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        # The loop only keeps weak references to tasks - hold them until they finish
+        self._tasks = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently running or waiting for a slot"""
+        return len(self._tasks)
+
+    def owns(self, session_id) -> bool:
+        """True if this process accepted the session's job and it has not finished yet"""
+        return str(session_id) in self._tasks
+
+    def submit(self, session_id, mode: Optional[str] = None, explicit_type: bool = False) -> bool:
+        """
+        Schedule generation for a session on the running event loop
+
+        Returns:
+            bool: True if the job was accepted, False if the queue is full
+        """
+        if len(self._tasks) >= self.max_pending:
+            logger.warning(f"Generation queue full ({len(self._tasks)} pending), rejecting session {session_id}")
+            return False
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        key = str(session_id)
+        task = loop.create_task(self._run(session_id, mode, explicit_type))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+        logger.info(f"Queued async generation for session {session_id}")
+        return True
+
+    async def _run(self, session_id, mode, explicit_type):
+        """Task entry point"""
+        from ..models import Session
+
+        try:
+            async with self._semaphore:
+                session = await Session.objects.aget(id=session_id)
+                if session.status != 'processing':
+                    logger.warning(f"Session {session_id} is {session.status}, skipping its queued generation")
+                    return
+                await agenerate_diagram_for_session(session, mode=mode, explicit_type=explicit_type)
+        except Session.DoesNotExist:
+            logger.warning(f"Session {session_id} was deleted before generation started")
+        except Exception as e:
+            logger.error(f"Generation job for session {session_id} crashed: {e}")
+        finally:
+            await sync_to_async(close_old_connections)()
+
+
+job_runner = GenerationJobRunner(
+    max_workers=EnvConfig.GENERATION_MAX_WORKERS,
+    max_pending=EnvConfig.GENERATION_MAX_PENDING
+)
+
+async_job_runner = AsyncGenerationJobRunner(
+    max_concurrency=EnvConfig.ASYNC_GENERATION_MAX_CONCURRENCY,
+    max_pending=EnvConfig.GENERATION_MAX_PENDING
+)
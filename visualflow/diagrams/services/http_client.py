@@ -0,0 +1,146 @@
+"""
+Shared HTTP transport for LLM API calls - pooled, kept alive and optionally pre-warmed
+"""
+
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import httpx
+from config.env_config import EnvConfig
+from .metrics import metrics
+from .rate_limiter import llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GROQ_BASE_URL = 'https://api.groq.com'
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])"""
+    return importlib.util.find_spec('h2') is not None
+
+
+def llm_base_url() -> str:
+    """Base URL the Groq SDK will talk to, honouring the same env overrides it does"""
+    return os.getenv('GROQ_API_BASE') or os.getenv('GROQ_BASE_URL') or DEFAULT_GROQ_BASE_URL
+
+
+class LLMHttpClients:
+    """
+    Process-wide httpx clients shared by every LLM client.
+
+    httpx.Client is thread-safe, so one pool serves all generation threads and
+    connections (TLS sessions included) are reused across requests instead of
+    each SDK client opening its own. Every response passes through the rate
+    limiter so 429s and rate-limit headers adjust the request rate.
+    """
+
+    def __init__(self):
+        """Initialize the holder; clients are built on first use"""
+        self._lock = threading.Lock()
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self.http2 = EnvConfig.LLM_HTTP2 and http2_available()
+        self.limits = httpx.Limits(
+            max_connections=EnvConfig.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=EnvConfig.LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=EnvConfig.LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        self.timeout = httpx.Timeout(
+            EnvConfig.LLM_HTTP_TIMEOUT_SECONDS,
+            connect=EnvConfig.LLM_HTTP_CONNECT_TIMEOUT_SECONDS,
+        )
+        if EnvConfig.LLM_HTTP2 and not self.http2:
+            logger.info("HTTP/2 requested for LLM calls but 'h2' is not installed, using HTTP/1.1")
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """Shared blocking client"""
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = self.new_sync_client()
+            return self._sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Shared async client (one event loop per process under ASGI)"""
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = self.new_async_client()
+            return self._async_client
+
+    def new_sync_client(self, transport: Optional[httpx.BaseTransport] = None,
+                        rate_limited: bool = True) -> httpx.Client:
+        """
+        A separate client with the shared limits and timeouts
+
+        Args:
+            transport: Custom transport (e.g. a cassette); pooling is then up to it
+            rate_limited (bool): Feed responses to the rate limiter
+        """
+        hooks = {'response': [llm_rate_limiter.observe_response]} if rate_limited else {}
+        return httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2,
+                            transport=transport, event_hooks=hooks)
+
+    def new_async_client(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                         rate_limited: bool = True) -> httpx.AsyncClient:
+        """Async new_sync_client"""
+        hooks = {'response': [llm_rate_limiter.aobserve_response]} if rate_limited else {}
+        return httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2,
+                                 transport=transport, event_hooks=hooks)
+
+    def warm_up(self, base_url: Optional[str] = None) -> bool:
+        """
+        Open a pooled connection to the LLM API ahead of the first real request
+
+        Any HTTP response counts: the point is the TCP + TLS handshake, and the
+        connection stays in the keep-alive pool afterwards. This warms the sync
+        pool only; see awarm_up for the async one.
+
+        Returns:
+            bool: True if the API was reachable
+        """
+        url = base_url or llm_base_url()
+        started = time.perf_counter()
+        try:
+            response = self.sync_client.get(url)
+        except httpx.HTTPError as e:
+            return self._warm_up_failed(url, e)
+        return self._warmed_up(url, response, started)
+
+    async def awarm_up(self, base_url: Optional[str] = None) -> bool:
+        """
+        Async warm_up for the async pool
+
+        Its connections belong to the event loop that opened them, so this has
+        to run on the loop that serves requests, not on a boot thread.
+        """
+        url = base_url or llm_base_url()
+        started = time.perf_counter()
+        try:
+            response = await self.async_client.get(url)
+        except httpx.HTTPError as e:
+            return self._warm_up_failed(url, e)
+        return self._warmed_up(url, response, started)
+
+    def _warmed_up(self, url: str, response: httpx.Response, started: float) -> bool:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe('http.warmup_ms', elapsed_ms)
+        logger.info(f"Warmed LLM connection to {url} ({response.http_version}, {elapsed_ms:.0f}ms)")
+        return True
+
+    def _warm_up_failed(self, url: str, error: Exception) -> bool:
+        metrics.incr('http.warmup_failed')
+        logger.warning(f"LLM connection warm-up to {url} failed: {error}")
+        return False
+
+    def warm_up_in_background(self, base_url: Optional[str] = None):
+        """Run warm_up on a daemon thread so worker boot is not delayed"""
+        threading.Thread(target=self.warm_up, args=(base_url,), name='llm-http-warmup', daemon=True).start()
+
+
+llm_http = LLMHttpClients()
@@ -0,0 +1,306 @@
+"""
+Local diagram-type classifier - TF-IDF features with a softmax (multinomial logistic) model
+
+Trained from completed Sessions by `manage.py train_intent_classifier` and used to
+skip the LLM analyzer call when it is confident about the diagram type.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL_FORMAT_VERSION = 1
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word unigrams plus adjacent-word bigrams"""
+    words = _WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class IntentClassifier:
+    """
+    Multinomial logistic regression over L2-normalized TF-IDF vectors.
+
+    Probabilities are calibrated with a single softmax temperature fitted on a
+    held-out split, so `confidence` can be compared against a fixed threshold.
+    """
+
+    def __init__(self):
+        """Initialize an untrained classifier"""
+        self.labels: List[str] = []
+        self.vocabulary: Dict[str, int] = {}
+        self.idf: List[float] = []
+        self.weights: List[Dict[int, float]] = []
+        self.bias: List[float] = []
+        self.temperature = 1.0
+        self.metadata: Dict = {}
+
+    @property
+    def is_trained(self) -> bool:
+        return bool(self.labels)
+
+    def _vectorize(self, text: str) -> Dict[int, float]:
+        """Sparse, L2-normalized TF-IDF vector for a text"""
+        counts = Counter(tok for tok in tokenize(text) if tok in self.vocabulary)
+        vector = {
+            self.vocabulary[tok]: (1 + math.log(count)) * self.idf[self.vocabulary[tok]]
+            for tok, count in counts.items()
+        }
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if norm:
+            vector = {k: v / norm for k, v in vector.items()}
+        return vector
+
+    def _scores(self, vector: Dict[int, float]) -> List[float]:
+        return [
+            self.bias[c] + sum(self.weights[c].get(i, 0.0) * v for i, v in vector.items())
+            for c in range(len(self.labels))
+        ]
+
+    @staticmethod
+    def _softmax(scores: List[float], temperature: float = 1.0) -> List[float]:
+        scaled = [s / temperature for s in scores]
+        top = max(scaled)
+        exps = [math.exp(s - top) for s in scaled]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def _fit_vocabulary(self, texts: List[str], min_df: int):
+        doc_freq = Counter()
+        for text in texts:
+            doc_freq.update(set(tokenize(text)))
+        terms = sorted(tok for tok, df in doc_freq.items() if df >= min_df)
+        self.vocabulary = {tok: i for i, tok in enumerate(terms)}
+        n_docs = len(texts)
+        self.idf = [math.log((1 + n_docs) / (1 + doc_freq[tok])) + 1.0 for tok in terms]
+
+    def _fit_weights(self, vectors: List[Dict[int, float]], targets: List[int],
+                     epochs: int, learning_rate: float, l2: float, seed: int):
+        n_classes = len(self.labels)
+        self.weights = [dict() for _ in range(n_classes)]
+        self.bias = [0.0] * n_classes
+        order = list(range(len(vectors)))
+        rng = random.Random(seed)
+
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            rate = learning_rate / (1 + 0.1 * epoch)
+            for idx in order:
+                vector, target = vectors[idx], targets[idx]
+                probs = self._softmax(self._scores(vector))
+                for c in range(n_classes):
+                    grad = probs[c] - (1.0 if c == target else 0.0)
+                    self.bias[c] -= rate * grad
+                    weights = self.weights[c]
+                    for i, v in vector.items():
+                        w = weights.get(i, 0.0)
+                        weights[i] = w - rate * (grad * v + l2 * w)
+
+    def _fit_temperature(self, vectors: List[Dict[int, float]], targets: List[int]) -> float:
+        """Grid-search the softmax temperature minimizing held-out negative log-likelihood"""
+        raw_scores = [self._scores(v) for v in vectors]
+        best_t, best_nll = 1.0, float('inf')
+        for step in range(2, 51):
+            t = step / 10
+            nll = -sum(
+                math.log(max(self._softmax(scores, t)[target], 1e-12))
+                for scores, target in zip(raw_scores, targets)
+            )
+            if nll < best_nll:
+                best_t, best_nll = t, nll
+        return best_t
+
+    def train(self, texts: List[str], labels: List[str], min_df: int = 2, epochs: int = 25,
+              learning_rate: float = 0.5, l2: float = 1e-4, holdout: float = 0.2,
+              seed: int = 13) -> Dict:
+        """
+        Train the classifier
+
+        Args:
+            texts (List[str]): Prompts
+            labels (List[str]): Diagram type for each prompt
+            min_df (int): Minimum document frequency for a term to enter the vocabulary
+            epochs (int): SGD passes over the data
+            learning_rate (float): Initial SGD step size
+            l2 (float): L2 regularization strength
+            holdout (float): Fraction of data used for calibration and evaluation
+            seed (int): Shuffle seed for reproducible training
+
+        Returns:
+            Dict: Training report (sample counts, held-out accuracy, temperature)
+        """
+        if len(texts) != len(labels) or not texts:
+            raise ValueError("texts and labels must be non-empty and the same length")
+
+        self.labels = sorted(set(labels))
+        if len(self.labels) < 2:
+            raise ValueError("Need at least two diagram types to train a classifier")
+        label_index = {label: i for i, label in enumerate(self.labels)}
+
+        indices = list(range(len(texts)))
+        random.Random(seed).shuffle(indices)
+        n_holdout = int(len(indices) * holdout) if len(indices) >= 20 else 0
+        holdout_idx, train_idx = indices[:n_holdout], indices[n_holdout:]
+
+        # Fit on the training split, calibrate and evaluate on the held-out split. The
+        # model that was calibrated and evaluated is the one that ships: refitting on all
+        # data would change the scores the temperature and accuracy were measured for
+        self._fit_vocabulary([texts[i] for i in train_idx], min_df)
+        train_vectors = [self._vectorize(texts[i]) for i in train_idx]
+        self._fit_weights(train_vectors, [label_index[labels[i]] for i in train_idx],
+                          epochs, learning_rate, l2, seed)
+
+        accuracy = None
+        if holdout_idx:
+            holdout_vectors = [self._vectorize(texts[i]) for i in holdout_idx]
+            holdout_targets = [label_index[labels[i]] for i in holdout_idx]
+            self.temperature = self._fit_temperature(holdout_vectors, holdout_targets)
+            correct = sum(
+                1 for v, t in zip(holdout_vectors, holdout_targets)
+                if max(range(len(self.labels)), key=self._scores(v).__getitem__) == t
+            )
+            accuracy = correct / len(holdout_idx)
+        else:
+            self.temperature = 1.0
+
+        self.metadata = {
+            'samples': len(texts),
+            'train_samples': len(train_idx),
+            'holdout_samples': len(holdout_idx),
+            'holdout_accuracy': round(accuracy, 4) if accuracy is not None else None,
+            'class_counts': dict(Counter(labels)),
+            'temperature': self.temperature,
+            'vocabulary_size': len(self.vocabulary),
+        }
+        return self.metadata
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """
+        Predict the diagram type for a prompt
+
+        Returns:
+            Tuple[Optional[str], float]: (diagram_type, calibrated_confidence)
+        """
+        if not self.is_trained:
+            return None, 0.0
+        vector = self._vectorize(text)
+        if not vector:
+            return None, 0.0
+        probs = self._softmax(self._scores(vector), self.temperature)
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.labels[best], probs[best]
+
+    def to_dict(self) -> Dict:
+        """Serializable representation of the trained model"""
+        return {
+            'format_version': MODEL_FORMAT_VERSION,
+            'labels': self.labels,
+            'vocabulary': self.vocabulary,
+            'idf': self.idf,
+            'weights': [{str(k): round(v, 6) for k, v in w.items() if abs(v) > 1e-6} for w in self.weights],
+            'bias': self.bias,
+            'temperature': self.temperature,
+            'metadata': self.metadata,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'IntentClassifier':
+        """Rebuild a classifier from to_dict output"""
+        if data.get('format_version') != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported intent model format: {data.get('format_version')}")
+        model = cls()
+        model.labels = data['labels']
+        model.vocabulary = data['vocabulary']
+        model.idf = data['idf']
+        model.weights = [{int(k): v for k, v in w.items()} for w in data['weights']]
+        model.bias = data['bias']
+        model.temperature = data['temperature']
+        model.metadata = data.get('metadata', {})
+        return model
+
+    def save(self, path):
+        """Write the model to a JSON file atomically"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path) -> 'IntentClassifier':
+        """Read a model saved with save()"""
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class IntentClassifierLoader:
+    """
+    Lazily loads the persisted model and reloads it when the file changes,
+    so retraining takes effect in running workers without a restart.
+    """
+
+    def __init__(self, path, threshold: float):
+        """Initialize the loader"""
+        self.path = str(path)
+        self.threshold = threshold
+        self._model = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _current_model(self) -> Optional[IntentClassifier]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._model = IntentClassifier.load(self.path)
+                        logger.info(f"Loaded intent classifier from {self.path} ({self._model.metadata})")
+                    except Exception as e:
+                        logger.error(f"Failed to load intent classifier from {self.path}: {e}")
+                        self._model = None
+                    self._mtime = mtime
+        return self._model
+
+    def classify(self, prompt: str) -> Tuple[Optional[str], float]:
+        """
+        Predict a diagram type, returning (None, confidence) below the threshold
+
+        Returns:
+            Tuple[Optional[str], float]: (confident_diagram_type or None, confidence)
+        """
+        model = self._current_model()
+        if model is None:
+            return None, 0.0
+        label, confidence = model.predict(prompt)
+        if label is None or confidence < self.threshold:
+            return None, confidence
+        return label, confidence
+
+
+def get_intent_classifier() -> IntentClassifierLoader:
+    """Process-wide classifier loader configured from settings"""
+    global _loader
+    if _loader is None:
+        from django.conf import settings
+        _loader = IntentClassifierLoader(
+            settings.INTENT_CLASSIFIER_PATH,
+            settings.INTENT_CLASSIFIER_THRESHOLD
+        )
+    return _loader
+
+
+_loader = None
@@ -0,0 +1,175 @@
+"""
+LLM backends - where chat completions are served from: the Groq API, the local stub or a cassette
+"""
+
+import logging
+from typing import Dict, Optional, Type
+
+import httpx
+from django.conf import settings
+from langchain_groq import ChatGroq
+
+from config.env_config import EnvConfig
+from .http_client import llm_base_url, llm_http
+from .llm_cassette import CassetteStore, CassetteTransport
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend:
+    """
+    Source of chat models for the generation pipeline
+
+    Every backend speaks the Groq (OpenAI-compatible) HTTP API, so the rest of
+    the pipeline - gateway retries, rate limiting, routing, tracing - runs
+    unchanged whichever one is selected with LLM_BACKEND.
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        """Initialize the backend; subclasses set the endpoint and credentials"""
+        self.api_key = EnvConfig.GROQ_API_KEY
+        self.base_url: Optional[str] = None
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        return llm_http.sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        return llm_http.async_client
+
+    def chat_model(self, model: str, temperature: float, max_tokens: Optional[int]) -> ChatGroq:
+        """
+        A chat client for one model on this backend
+
+        Args:
+            model (str): Model name
+            temperature (float): Sampling temperature
+            max_tokens (Optional[int]): Completion token limit
+
+        Returns:
+            ChatGroq: Client on the backend's HTTP clients, with retries left to llm_gateway
+        """
+        # Only pass a base URL when the backend has its own, so GROQ_API_BASE still applies otherwise
+        endpoint = {'groq_api_base': self.base_url} if self.base_url else {}
+        return ChatGroq(
+            groq_api_key=self.api_key,
+            model_name=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            # Shared keep-alive pool instead of a private client per SDK instance
+            http_client=self.sync_client,
+            http_async_client=self.async_client,
+            request_timeout=llm_http.timeout,
+            # Retries are owned by llm_gateway, which knows the request deadline
+            max_retries=0,
+            **endpoint
+        )
+
+    def warm_up_in_background(self):
+        """Open a pooled connection to the backend before the first request"""
+        llm_http.warm_up_in_background(self.base_url or llm_base_url())
+
+    async def awarm_up(self):
+        """Open a pooled async connection to the backend; run it on the serving event loop"""
+        await llm_http.awarm_up(self.base_url or llm_base_url())
+
+    def describe(self) -> Dict[str, Optional[str]]:
+        return {'name': self.name, 'base_url': self.base_url or llm_base_url()}
+
+
+class GroqBackend(LLMBackend):
+    """The Groq API (default)"""
+
+    name = 'groq'
+
+
+class StubBackend(LLMBackend):
+    """The local stand-in server started with `manage.py llm_stub_server`"""
+
+    name = 'stub'
+
+    def __init__(self, base_url: Optional[str] = None):
+        super().__init__()
+        self.api_key = self.api_key or 'stub'
+        self.base_url = base_url or EnvConfig.LLM_STUB_URL
+
+
+class CassetteBackend(LLMBackend):
+    """
+    Recorded responses from LLM_CASSETTE_DIR
+
+    'record' forwards to the Groq API and saves what comes back; 'replay'
+    never touches the network, so runs are deterministic and free. Replayed
+    responses skip the rate limiter, whose headers would be stale.
+    """
+
+    def __init__(self, mode: str):
+        super().__init__()
+        self.name = mode
+        self.mode = mode
+        self.store = CassetteStore(settings.LLM_CASSETTE_DIR)
+        if mode == 'replay':
+            self.api_key = self.api_key or 'replay'
+        self._transport = CassetteTransport(self.store, mode)
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = llm_http.new_sync_client(transport=self._transport,
+                                                         rate_limited=self.mode == 'record')
+        return self._sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = llm_http.new_async_client(transport=self._transport,
+                                                           rate_limited=self.mode == 'record')
+        return self._async_client
+
+    def warm_up_in_background(self):
+        if self.mode == 'record':
+            super().warm_up_in_background()
+
+    async def awarm_up(self):
+        if self.mode == 'record':
+            await super().awarm_up()
+
+    def describe(self) -> Dict[str, Optional[str]]:
+        return {**super().describe(), 'cassette_dir': str(self.store.path), 'cassettes': len(self.store)}
+
+
+BACKENDS: Dict[str, Type[LLMBackend]] = {
+    'groq': GroqBackend,
+    'stub': StubBackend,
+    'record': CassetteBackend,
+    'replay': CassetteBackend,
+}
+
+
+def create_backend(name: str) -> LLMBackend:
+    """
+    Backend registered as `name`
+
+    Raises:
+        ValueError: Unknown backend name
+    """
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}', use one of {', '.join(BACKENDS)}")
+    return backend_class(name) if backend_class is CassetteBackend else backend_class()
+
+
+def _default_backend() -> LLMBackend:
+    try:
+        return create_backend(EnvConfig.LLM_BACKEND)
+    except ValueError as e:
+        logger.error(f"{e}; using the Groq API")
+        return GroqBackend()
+
+
+llm_backend = _default_backend()
@@ -0,0 +1,169 @@
+"""
+Record/replay of LLM API traffic - real responses captured to disk and served back deterministically
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ('record', 'replay')
+
+# Response headers worth keeping; the rest (dates, request ids, cookies) vary per call
+RECORDED_HEADERS = ('content-type', 'retry-after')
+RECORDED_HEADER_PREFIXES = ('x-ratelimit-',)
+
+
+def request_key(request: httpx.Request) -> str:
+    """
+    Cassette key of a request: method, path and the body with sorted keys
+
+    Host and headers are left out so a cassette recorded against the real API
+    replays under any base URL and API key.
+    """
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        pass  # not JSON, hash the raw bytes
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.url.path}\n".encode('utf-8'))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class CassetteStore:
+    """One JSON file per recorded response, named by request key"""
+
+    def __init__(self, path):
+        """Initialize the store under `path` (created on first write)"""
+        self.path = Path(path)
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._file(key), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable cassette {key}: {e}")
+            return None
+
+    def put(self, key: str, entry: Dict):
+        """Write atomically so concurrent recorders never leave a half-written file"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def __len__(self):
+        return len(list(self.path.glob('*.json'))) if self.path.is_dir() else 0
+
+
+def _kept_headers(headers: httpx.Headers) -> Dict[str, str]:
+    return {
+        name: value for name, value in headers.items()
+        if name in RECORDED_HEADERS or name.startswith(RECORDED_HEADER_PREFIXES)
+    }
+
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    httpx transport serving LLM calls from a cassette store
+
+    In 'replay' mode a request without a recording gets a 400 response
+    (type 'cassette_miss') instead of reaching the network. In 'record' mode
+    misses go to the real API and successful responses are saved; streamed
+    responses are recorded whole and replayed as one body, which the SDK
+    parses as the same server-sent events.
+    """
+
+    def __init__(self, store: CassetteStore, mode: str = 'replay',
+                 inner: Optional[httpx.BaseTransport] = None,
+                 ainner: Optional[httpx.AsyncBaseTransport] = None):
+        """Initialize the transport; `inner`/`ainner` default to pooled HTTP transports"""
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', use one of {', '.join(CASSETTE_MODES)}")
+        self.store = store
+        self.mode = mode
+        self._inner = inner
+        self._ainner = ainner
+
+    def _replay(self, request: httpx.Request) -> Optional[httpx.Response]:
+        key = request_key(request)
+        entry = self.store.get(key)
+        if entry is not None:
+            metrics.incr('cassette.hits')
+            return httpx.Response(entry['status'], headers=entry['headers'],
+                                  content=entry['body'].encode('utf-8'), request=request)
+        if self.mode == 'replay':
+            metrics.incr('cassette.misses')
+            logger.warning(f"No cassette for {request.method} {request.url.path} ({key[:12]})")
+            return httpx.Response(400, json={'error': {
+                'message': f"No recorded response for this request (cassette {key[:12]}) in {self.store.path}",
+                'type': 'cassette_miss',
+            }}, request=request)
+        return None
+
+    def _record(self, request: httpx.Request, response: httpx.Response, body: bytes) -> httpx.Response:
+        if response.status_code < 400:
+            self.store.put(request_key(request), {
+                'request': {'method': request.method, 'path': request.url.path},
+                'status': response.status_code,
+                'headers': _kept_headers(response.headers),
+                'body': body.decode('utf-8'),
+            })
+            metrics.incr('cassette.recorded')
+        headers = [(k, v) for k, v in response.headers.multi_items()
+                   if k not in ('content-encoding', 'content-length', 'transfer-encoding')]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        replayed = self._replay(request)
+        if replayed is not None:
+            return replayed
+        if self._inner is None:
+            self._inner = httpx.HTTPTransport()
+        response = self._inner.handle_request(request)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        return self._record(request, response, body)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        replayed = self._replay(request)
+        if replayed is not None:
+            return replayed
+        if self._ainner is None:
+            self._ainner = httpx.AsyncHTTPTransport()
+        response = await self._ainner.handle_async_request(request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        return self._record(request, response, body)
+
+    def close(self):
+        if self._inner is not None:
+            self._inner.close()
+
+    async def aclose(self):
+        if self._ainner is not None:
+            await self._ainner.aclose()
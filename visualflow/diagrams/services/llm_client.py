@@ -0,0 +1,413 @@
+"""
+Resilient LLM calls - rate-limit admission, per-request deadline budget, jittered retries and hedged requests
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import groq
+import httpx
+from config.constants import AppConstants
+from config.env_config import EnvConfig
+from .circuit_breaker import llm_breaker
+from .metrics import metrics
+from .rate_limiter import llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+_current_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+# Runs primary + hedge requests so the caller can wait on whichever finishes first
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=EnvConfig.GENERATION_MAX_WORKERS * 4,
+    thread_name_prefix='llm-hedge'
+)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class DeadlineExceeded(Exception):
+    """The request's LLM time budget is spent"""
+
+
+class CircuitOpenError(Exception):
+    """The LLM circuit breaker is open; the call was not attempted"""
+
+
+class TruncatedResponse(Exception):
+    """The model stopped at its completion token limit, so the output is cut off"""
+
+
+class Deadline:
+    """Wall-clock budget for all LLM calls made while serving one generation"""
+
+    def __init__(self, seconds: float):
+        """Initialize a deadline `seconds` from now"""
+        self.total = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def step_budget(self, step: str) -> float:
+        """
+        Time a step may use, including its retries
+
+        A step gets its configured share of the total budget, capped by what is
+        left, so a slow analyzer cannot starve the generator.
+        """
+        share = AppConstants.AI_MODELS['STEP_BUDGET_SHARE'].get(step, 1.0)
+        return min(self.remaining(), self.total * share)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the generation running in this context, if any"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float] = None):
+    """
+    Use the active deadline, or start one for the duration of the block
+
+    Yields:
+        Deadline: The deadline LLM calls in this block are bound by
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        yield deadline
+        return
+
+    deadline = Deadline(seconds or AppConstants.AI_MODELS['REQUEST_DEADLINE_SECONDS'])
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx are worth another attempt"""
+    if isinstance(exc, groq.APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(exc, groq.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS_CODES or exc.status_code >= 500
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Server-requested delay from a Retry-After header, in seconds"""
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return None
+    try:
+        return max(0.0, float(response.headers.get('retry-after', '')))
+    except ValueError:
+        return None
+
+
+class ResilientLLMClient:
+    """
+    Wraps LangChain chat model calls with the AI_MODELS resilience policy.
+
+    Every attempt first waits for the shared rate limiter (within the step's
+    budget), must be allowed by the circuit breaker and carries a timeout
+    derived from the step's share of the request deadline. Retryable errors are
+    retried with full-jitter exponential backoff while the budget allows. With
+    HEDGE_ENABLED, a non-streaming call still running after the step's observed
+    p95 latency gets a duplicate request and the first response wins.
+    """
+
+    def __init__(self, policy: Optional[dict] = None):
+        """Initialize the client with a policy (defaults to AppConstants.AI_MODELS)"""
+        self.policy = policy or AppConstants.AI_MODELS
+
+    def invoke(self, client, step: str, messages: list, **kwargs):
+        """Blocking call with deadline, retries and optional hedging"""
+        step_expires = self._step_expires(step)
+        attempt = 0
+        while True:
+            with self._admitted(step, step_expires):
+                timeout = self._attempt_timeout(step, step_expires)
+                started = time.perf_counter()
+                try:
+                    response = self._invoke_hedged(client, step, messages, timeout, kwargs)
+                except Exception as e:
+                    self._record_outcome(e)
+                    delay = self._retry_delay(step, attempt, e, step_expires)
+                    if delay is None:
+                        raise
+                else:
+                    llm_breaker.record_success()
+                    metrics.observe(f'llm.{step}.latency_ms', (time.perf_counter() - started) * 1000)
+                    return response
+            # Back off without holding a concurrency slot
+            time.sleep(delay)
+            attempt += 1
+
+    def stream(self, client, step: str, messages: list, **kwargs):
+        """
+        Streaming call with deadline and retries
+
+        Only failures before the first chunk are retried; once output has been
+        handed to the caller a failure is raised as-is.
+        """
+        step_expires = self._step_expires(step)
+        attempt = 0
+        while True:
+            with self._admitted(step, step_expires):
+                timeout = self._attempt_timeout(step, step_expires)
+                started = time.perf_counter()
+                received = False
+                stream = client.stream(messages, timeout=timeout, **kwargs)
+                try:
+                    for chunk in stream:
+                        if not received:
+                            received = True
+                            llm_breaker.record_success()
+                        if time.monotonic() > step_expires:
+                            metrics.incr('llm.deadline_exceeded')
+                            raise DeadlineExceeded(f"{step} stream exceeded its time budget")
+                        yield chunk
+                    metrics.observe(f'llm.{step}.latency_ms', (time.perf_counter() - started) * 1000)
+                    return
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    if not received:
+                        self._record_outcome(e)
+                    delay = None if received else self._retry_delay(step, attempt, e, step_expires)
+                    if delay is None:
+                        raise
+                finally:
+                    stream.close()
+            time.sleep(delay)
+            attempt += 1
+
+    async def ainvoke(self, client, step: str, messages: list, **kwargs):
+        """Async invoke; the losing hedge request is cancelled, aborting its HTTP call"""
+        step_expires = self._step_expires(step)
+        attempt = 0
+        while True:
+            async with self._aadmitted(step, step_expires):
+                timeout = self._attempt_timeout(step, step_expires)
+                started = time.perf_counter()
+                try:
+                    response = await self._ainvoke_hedged(client, step, messages, timeout, kwargs)
+                except Exception as e:
+                    self._record_outcome(e)
+                    delay = self._retry_delay(step, attempt, e, step_expires)
+                    if delay is None:
+                        raise
+                else:
+                    llm_breaker.record_success()
+                    metrics.observe(f'llm.{step}.latency_ms', (time.perf_counter() - started) * 1000)
+                    return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def astream(self, client, step: str, messages: list, **kwargs):
+        """Async stream; same retry rules as stream()"""
+        step_expires = self._step_expires(step)
+        attempt = 0
+        while True:
+            async with self._aadmitted(step, step_expires):
+                timeout = self._attempt_timeout(step, step_expires)
+                started = time.perf_counter()
+                received = False
+                stream = client.astream(messages, timeout=timeout, **kwargs)
+                try:
+                    async for chunk in stream:
+                        if not received:
+                            received = True
+                            llm_breaker.record_success()
+                        if time.monotonic() > step_expires:
+                            metrics.incr('llm.deadline_exceeded')
+                            raise DeadlineExceeded(f"{step} stream exceeded its time budget")
+                        yield chunk
+                    metrics.observe(f'llm.{step}.latency_ms', (time.perf_counter() - started) * 1000)
+                    return
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    if not received:
+                        self._record_outcome(e)
+                    delay = None if received else self._retry_delay(step, attempt, e, step_expires)
+                    if delay is None:
+                        raise
+                finally:
+                    await stream.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _step_expires(self, step: str) -> float:
+        """Monotonic time by which the step, retries included, must finish"""
+        deadline = current_deadline()
+        if deadline is None:
+            budget = self.policy['REQUEST_DEADLINE_SECONDS']
+        else:
+            budget = deadline.step_budget(step)
+        return time.monotonic() + budget
+
+    def _admission_wait(self, step: str, step_expires: float) -> float:
+        """How long an attempt may wait for the rate limiter and still get a useful timeout"""
+        wait = step_expires - time.monotonic() - self.policy['MIN_ATTEMPT_SECONDS']
+        if wait < 0:
+            metrics.incr('llm.deadline_exceeded')
+            raise DeadlineExceeded(f"No time left for {step} call")
+        return wait
+
+    @contextmanager
+    def _admitted(self, step: str, step_expires: float):
+        """
+        Hold a rate-limiter slot for one attempt
+
+        Raises:
+            DeadlineExceeded: The limiter could not admit the call within the step's budget
+        """
+        if not llm_rate_limiter.acquire(self._admission_wait(step, step_expires)):
+            metrics.incr(f'llm.{step}.rate_limited')
+            raise DeadlineExceeded(f"Rate limit left no time for {step} call")
+        try:
+            yield
+        finally:
+            llm_rate_limiter.release()
+
+    @asynccontextmanager
+    async def _aadmitted(self, step: str, step_expires: float):
+        """Async _admitted"""
+        if not await llm_rate_limiter.aacquire(self._admission_wait(step, step_expires)):
+            metrics.incr(f'llm.{step}.rate_limited')
+            raise DeadlineExceeded(f"Rate limit left no time for {step} call")
+        try:
+            yield
+        finally:
+            llm_rate_limiter.release()
+
+    def _attempt_timeout(self, step: str, step_expires: float) -> float:
+        """
+        Timeout for the next attempt
+
+        Raises:
+            CircuitOpenError: The breaker is rejecting calls
+            DeadlineExceeded: Too little of the step's budget is left
+        """
+        remaining = step_expires - time.monotonic()
+        if remaining < self.policy['MIN_ATTEMPT_SECONDS']:
+            metrics.incr('llm.deadline_exceeded')
+            raise DeadlineExceeded(f"No time left for {step} call")
+        if not llm_breaker.allow_request():
+            raise CircuitOpenError(f"LLM circuit is open, not calling {step}")
+        metrics.incr(f'llm.{step}.attempts')
+        return remaining
+
+    def _record_outcome(self, exc: Exception):
+        """Feed a failed attempt to the breaker - only upstream failures count against it"""
+        if is_retryable(exc):
+            llm_breaker.record_failure()
+        elif isinstance(exc, groq.APIStatusError):
+            # The API answered (e.g. 400): it is up, and a half-open probe must resolve
+            llm_breaker.record_success()
+
+    def _retry_delay(self, step: str, attempt: int, exc: Exception, step_expires: float) -> Optional[float]:
+        """Backoff before the next attempt, or None when the error should be raised"""
+        metrics.incr(f'llm.{step}.errors')
+        if isinstance(exc, groq.APITimeoutError):
+            metrics.incr(f'llm.{step}.timeouts')
+        if isinstance(exc, DeadlineExceeded) or not is_retryable(exc):
+            return None
+        if attempt >= self.policy['MAX_RETRIES']:
+            logger.warning(f"{step} call failed after {attempt + 1} attempts: {exc}")
+            return None
+
+        delay = _retry_after(exc)
+        if delay is None:
+            # Full jitter: spreads retries from many workers hitting the same outage
+            cap = min(self.policy['RETRY_MAX_DELAY_SECONDS'], self.policy['RETRY_BASE_DELAY_SECONDS'] * 2 ** attempt)
+            delay = random.uniform(0, cap)
+
+        if step_expires - time.monotonic() - delay < self.policy['MIN_ATTEMPT_SECONDS']:
+            logger.warning(f"{step} call failed and no budget is left to retry: {exc}")
+            return None
+
+        metrics.incr(f'llm.{step}.retries')
+        logger.info(f"Retrying {step} call in {delay:.2f}s after: {exc}")
+        return delay
+
+    def _hedge_delay(self, step: str, timeout: float) -> Optional[float]:
+        """Seconds after which to send a hedge request, or None to not hedge"""
+        if not self.policy['HEDGE_ENABLED']:
+            return None
+        p95 = metrics.percentile(f'llm.{step}.latency_ms', 95, min_count=self.policy['HEDGE_MIN_SAMPLES'])
+        if p95 is None or p95 / 1000 >= timeout:
+            return None
+        return p95 / 1000
+
+    def _invoke_hedged(self, client, step: str, messages: list, timeout: float, kwargs: dict):
+        hedge_after = self._hedge_delay(step, timeout)
+        if hedge_after is None:
+            return client.invoke(messages, timeout=timeout, **kwargs)
+
+        primary = _hedge_executor.submit(client.invoke, messages, timeout=timeout, **kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # A hedge is an extra request against the quota: only send it if the limiter has room now
+        if not llm_rate_limiter.acquire(0):
+            metrics.incr(f'llm.{step}.hedge_skipped')
+            return primary.result()
+
+        # A blocking call cannot be aborted; the loser finishes within its timeout and is discarded
+        metrics.incr(f'llm.{step}.hedged')
+        hedge = _hedge_executor.submit(client.invoke, messages, timeout=timeout - hedge_after, **kwargs)
+        hedge.add_done_callback(lambda _: llm_rate_limiter.release())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.incr(f'llm.{step}.hedge_won')
+                    return future.result()
+        raise primary.exception()
+
+    async def _ainvoke_hedged(self, client, step: str, messages: list, timeout: float, kwargs: dict):
+        hedge_after = self._hedge_delay(step, timeout)
+        if hedge_after is None:
+            return await client.ainvoke(messages, timeout=timeout, **kwargs)
+
+        primary = asyncio.create_task(client.ainvoke(messages, timeout=timeout, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        if not await llm_rate_limiter.aacquire(0):
+            metrics.incr(f'llm.{step}.hedge_skipped')
+            return await primary
+
+        metrics.incr(f'llm.{step}.hedged')
+        hedge = asyncio.create_task(client.ainvoke(messages, timeout=timeout - hedge_after, **kwargs))
+        hedge.add_done_callback(lambda _: llm_rate_limiter.release())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.incr(f'llm.{step}.hedge_won')
+                        return task.result()
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+llm_gateway = ResilientLLMClient()
@@ -0,0 +1,335 @@
+"""
+Offline stand-in for the Groq (OpenAI-compatible) chat completions API
+
+Answers every pipeline step with plausible output - analyzer JSON, fused JSON or
+Mermaid code built by the offline fallback generator - after a sampled latency,
+optionally streamed and optionally failing, so the full pipeline can be load
+tested without tokens or network access.
+"""
+
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from .fallback_generator import build_fallback_diagram, extract_entities
+from .prompts.registry import count_tokens
+
+logger = logging.getLogger(__name__)
+
+TYPE_RE = re.compile(r'(?:Selected|Suggested) Diagram Type: *([\w-]+)|Generate the ([\w-]+) diagram now')
+PROMPT_RE = re.compile(r'User Prompt: *"(.*)"|User Request: *(.*?)\n\s*\nGenerate the', re.DOTALL)
+REFINE_RE = re.compile(r'```mermaid\n(.*?)\n```\s*Requested change: *(.*?)\n\s*\nReturn the updated diagram now', re.DOTALL)
+
+# Headers like Groq's, reporting plenty of quota so the client's limiter stays idle
+QUOTA_HEADERS = {
+    'x-ratelimit-limit-requests': '14400',
+    'x-ratelimit-remaining-requests': '14399',
+    'x-ratelimit-reset-requests': '6s',
+    'x-ratelimit-limit-tokens': '1000000',
+    'x-ratelimit-remaining-tokens': '999000',
+    'x-ratelimit-reset-tokens': '60ms',
+}
+
+
+class LatencyModel:
+    """
+    Time-to-first-token distribution parsed from a spec string
+
+    'fixed:300', 'uniform:100,500', 'normal:300,80' or 'lognormal:300,0.5'
+    (median ms, sigma); all values in milliseconds except the lognormal sigma.
+    """
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    def __init__(self, spec: str, rng: random.Random):
+        """Initialize from a spec; raises ValueError for malformed specs"""
+        kind, _, args = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', use one of {', '.join(self.KINDS)}")
+        try:
+            self.params = [float(value) for value in args.split(',')] if args else []
+        except ValueError:
+            raise ValueError(f"Latency parameters must be numbers: '{spec}'")
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}[kind]
+        if len(self.params) != expected:
+            raise ValueError(f"'{kind}' latency takes {expected} parameter(s): '{spec}'")
+        self.kind = kind
+        self.spec = spec
+        self.rng = rng
+
+    def sample(self) -> float:
+        """One latency in seconds"""
+        if self.kind == 'fixed':
+            ms = self.params[0]
+        elif self.kind == 'uniform':
+            ms = self.rng.uniform(*self.params)
+        elif self.kind == 'normal':
+            ms = self.rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            ms = self.rng.lognormvariate(math.log(max(median, 1e-3)), sigma)
+        return max(0.0, ms) / 1000
+
+
+class StubConfig:
+    """Behaviour of the stub server"""
+
+    def __init__(self, latency: str = 'lognormal:400,0.4', tokens_per_second: float = 500,
+                 error_rate: float = 0.0, error_status: int = 503, timeout_rate: float = 0.0,
+                 hang_seconds: float = 120.0, seed: Optional[int] = None):
+        """
+        Initialize the config
+
+        Args:
+            latency (str): Time-to-first-token distribution (see LatencyModel)
+            tokens_per_second (float): Output speed after the first token; 0 sends it all at once
+            error_rate (float): Fraction of requests answered with `error_status`
+            error_status (int): HTTP status of injected errors (429 adds Retry-After)
+            timeout_rate (float): Fraction of requests that hang for `hang_seconds`
+            seed (Optional[int]): Seed for reproducible latencies and failures
+        """
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self._lock = threading.Lock()
+
+    def draw(self) -> Tuple[str, float]:
+        """Outcome ('ok', 'error' or 'hang') and time to first token for one request"""
+        with self._lock:
+            roll = self.rng.random()
+            ttft = self.latency.sample()
+        if roll < self.timeout_rate:
+            return 'hang', ttft
+        if roll < self.timeout_rate + self.error_rate:
+            return 'error', ttft
+        return 'ok', ttft
+
+
+def _message_text(message: Dict) -> str:
+    content = message.get('content') or ''
+    if isinstance(content, list):  # content parts
+        content = ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content
+
+
+def build_reply(payload: Dict) -> str:
+    """
+    Assistant content for a chat completion request from the generation pipeline
+
+    The step is recognised from the user message the pipeline sends; the
+    diagram itself comes from the offline generator, so it is valid Mermaid
+    that reflects the prompt's names and steps.
+    """
+    messages = payload.get('messages') or []
+    user = next((_message_text(m) for m in reversed(messages) if m.get('role') == 'user'), '')
+
+    type_match = TYPE_RE.search(user)
+    diagram_type = next((g for g in type_match.groups() if g), 'flowchart') if type_match else 'flowchart'
+    prompt_match = PROMPT_RE.search(user)
+    prompt = next((g for g in prompt_match.groups() if g), user) if prompt_match else user
+    prompt = prompt.strip() or 'diagram'
+
+    if 'Return the JSON object of fixes now' in user:
+        # The stub cannot repair anything; no fixes leaves the diagram as it was
+        return json.dumps({'fixes': []})
+
+    refine_match = REFINE_RE.search(user)
+    if refine_match:
+        # The current diagram back with the change noted, so edits are visible and stay valid
+        code, instruction = refine_match.groups()
+        return f"{code}\n    %% {' '.join(instruction.split())}"
+
+    if 'Analyze this prompt' in user:
+        return json.dumps({
+            'diagram_type': diagram_type,
+            'confidence': 0.9,
+            'level': None,
+            'entities': extract_entities(prompt),
+            'relationships': [],
+            'missing_info': [],
+            'enhanced_prompt': prompt,
+        })
+
+    mermaid_code = build_fallback_diagram(prompt, diagram_type)
+    if 'Return the JSON object now' in user:
+        return json.dumps({
+            'diagram_type': diagram_type,
+            'confidence': 0.9,
+            'entities': extract_entities(prompt),
+            'relationships': [],
+            'enhanced_prompt': prompt,
+            'mermaid_code': mermaid_code,
+        })
+    return mermaid_code
+
+
+def _chunks(text: str, size: int = 16) -> List[str]:
+    """Split text into stream deltas of roughly `size` characters on word boundaries"""
+    pieces = re.findall(r'\S*\s*', text)
+    chunks, current = [], ''
+    for piece in pieces:
+        current += piece
+        if len(current) >= size:
+            chunks.append(current)
+            current = ''
+    if current:
+        chunks.append(current)
+    return chunks or ['']
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """OpenAI/Groq chat completions and model listing"""
+
+    server_version = 'VisualFlowLLMStub/1.0'
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, delayed ACKs add ~40ms per call
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(f"LLM stub: {format % args}")
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'stub', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'not_found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'not_found'}})
+            return
+        try:
+            payload = json.loads(raw or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'Request body is not JSON', 'type': 'invalid_request_error'}})
+            return
+
+        config: StubConfig = self.server.config
+        outcome, ttft = config.draw()
+        if outcome == 'hang':
+            time.sleep(config.hang_seconds)
+            return
+        time.sleep(ttft)
+        if outcome == 'error':
+            headers = {'retry-after': '1'} if config.error_status == 429 else {}
+            self._send_json(config.error_status, {
+                'error': {'message': 'Injected failure from the LLM stub', 'type': 'stub_error'}
+            }, headers)
+            return
+
+        content = build_reply(payload)
+        prompt_tokens = sum(count_tokens(_message_text(m)) for m in payload.get('messages') or [])
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': count_tokens(content),
+            'total_tokens': prompt_tokens + count_tokens(content),
+        }
+        try:
+            if payload.get('stream'):
+                self._stream(payload, content, usage)
+            else:
+                if config.tokens_per_second > 0:
+                    time.sleep(usage['completion_tokens'] / config.tokens_per_second)
+                self._send_json(200, self._completion(payload, content, usage))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away (cancelled speculation, timeout)
+
+    def _base(self, payload: Dict, object_type: str) -> Dict:
+        return {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:24]}',
+            'object': object_type,
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+            'system_fingerprint': 'fp_stub',
+        }
+
+    def _completion(self, payload: Dict, content: str, usage: Dict) -> Dict:
+        return {
+            **self._base(payload, 'chat.completion'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'logprobs': None,
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        }
+
+    def _stream(self, payload: Dict, content: str, usage: Dict):
+        """Server-sent events in the OpenAI chunk format, usage in the last chunk as Groq does"""
+        config: StubConfig = self.server.config
+        base = self._base(payload, 'chat.completion.chunk')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        for name, value in QUOTA_HEADERS.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = _chunks(content)
+        delay = (usage['completion_tokens'] / config.tokens_per_second / len(chunks)
+                 if config.tokens_per_second > 0 else 0)
+        for index, piece in enumerate(chunks):
+            delta = {'role': 'assistant', 'content': piece} if index == 0 else {'content': piece}
+            self._event({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+            if delay:
+                time.sleep(delay)
+        self._event({
+            **base,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            'x_groq': {'id': base['id'], 'usage': usage},
+        })
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+    def _event(self, data: Dict):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in {**QUOTA_HEADERS, **(headers or {})}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """Threaded stub server; one thread per connection, like a real API front end"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, config: Optional[StubConfig] = None):
+        """Bind the server; port 0 picks a free port"""
+        super().__init__((host, port), StubRequestHandler)
+        self.config = config or StubConfig()
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as LLM_STUB_URL"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start_in_background(self) -> threading.Thread:
+        """Serve on a daemon thread (for benchmarks and tests in the same process)"""
+        thread = threading.Thread(target=self.serve_forever, name='llm-stub', daemon=True)
+        thread.start()
+        return thread
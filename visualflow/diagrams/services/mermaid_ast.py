@@ -0,0 +1,958 @@
+"""
+Mermaid AST - diagram text parsed into nodes, edges and blocks, and printed back canonically
+
+Covers the grammars the generator produces: flowchart/graph (also used for the
+dfd, system_design and custom types), classDiagram, erDiagram, sequenceDiagram
+and stateDiagram(-v2). A Diagram keeps its statements in order in `body`, with
+the nodes it mentions in `nodes` and every edge in `edges`:
+
+- flowchart: nodes with shape and label, links, subgraphs
+- class: classes with members and stereotype, relations with multiplicities, namespaces
+- er: entities with attributes, relationships
+- sequence: participants, messages, loop/alt/par... blocks
+- state: states with descriptions, transitions, composite states
+
+Statements the AST doesn't model (styling, notes, comments, anything it can't
+read) are kept verbatim as Directives, so parsing never fails and a round trip
+loses nothing but formatting. `serialize` prints one statement per line with
+four-space indentation; a flowchart chain such as `A --> B & C` becomes one line
+per edge, and node shapes are written where the node first appears.
+
+`canonicalize` is that serialization for any code, and `content_hash` hashes
+it, so the same diagram written with different whitespace or node-definition
+placement gets the same hash.
+"""
+
+import hashlib
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+
+class _Slotted:
+    """Equality and repr from __slots__"""
+
+    __slots__ = ()
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._values() == other._values()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Attribute(_Slotted):
+    """ER attribute: type name [PK, FK] ["comment"]"""
+
+    __slots__ = ('type', 'name', 'keys', 'comment')
+
+    def __init__(self, type: str, name: str, keys: Tuple[str, ...] = (), comment: Optional[str] = None):
+        self.type = type
+        self.name = name
+        self.keys = keys
+        self.comment = comment
+
+    def __str__(self):
+        text = f"{self.type} {self.name}"
+        if self.keys:
+            text += ' ' + ', '.join(self.keys)
+        if self.comment is not None:
+            text += f' "{self.comment}"'
+        return text
+
+
+class Node(_Slotted):
+    """
+    Flowchart node, class, ER entity, sequence participant or state
+
+    `shape` is the flowchart shape ('[]', '()', '{}', ...), the class stereotype
+    ('<<interface>>'), the participant kind ('participant', 'actor') or the state
+    kind ('<<choice>>'). `attributes` holds class members, ER attributes or state
+    description lines.
+    """
+
+    __slots__ = ('id', 'label', 'shape', 'css_class', 'attributes')
+
+    def __init__(self, id: str, label: Optional[str] = None, shape: Optional[str] = None,
+                 css_class: Optional[str] = None, attributes: Optional[List[Union[str, Attribute]]] = None):
+        self.id = id
+        self.label = label
+        self.shape = shape
+        self.css_class = css_class
+        self.attributes = attributes if attributes is not None else []
+
+
+class Edge(_Slotted):
+    """
+    Link, relation, relationship, message or transition
+
+    `source_label`/`target_label` are class multiplicities; a sequence message's
+    activation marker (+/-) is part of its arrow.
+    """
+
+    __slots__ = ('source', 'target', 'arrow', 'label', 'source_label', 'target_label')
+
+    def __init__(self, source: str, target: str, arrow: str, label: Optional[str] = None,
+                 source_label: Optional[str] = None, target_label: Optional[str] = None):
+        self.source = source
+        self.target = target
+        self.arrow = arrow
+        self.label = label
+        self.source_label = source_label
+        self.target_label = target_label
+
+
+class Block(_Slotted):
+    """Flowchart subgraph, composite state, class namespace or sequence loop/alt/par... block"""
+
+    __slots__ = ('kind', 'id', 'title', 'body')
+
+    def __init__(self, kind: str, id: Optional[str] = None, title: Optional[str] = None,
+                 body: Optional[list] = None):
+        self.kind = kind
+        self.id = id
+        self.title = title
+        self.body = body if body is not None else []
+
+
+class Branch(_Slotted):
+    """else/and/option line dividing a sequence block"""
+
+    __slots__ = ('keyword', 'title')
+
+    def __init__(self, keyword: str, title: str = ''):
+        self.keyword = keyword
+        self.title = title
+
+
+class Directive(_Slotted):
+    """A statement kept verbatim (several lines for a note block)"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+Statement = Union[Node, Edge, Block, Branch, Directive]
+
+
+class Diagram(_Slotted):
+    """
+    A parsed diagram; `kind` is 'flowchart', 'class', 'er', 'sequence' or 'state'
+
+    `preamble` holds the comment lines before the header, such as a `%%{init: ...}%%` directive.
+    """
+
+    __slots__ = ('kind', 'header', 'direction', 'preamble', 'body', 'nodes', 'edges')
+
+    def __init__(self, kind: str, header: str, direction: Optional[str] = None,
+                 preamble: Optional[List[str]] = None):
+        self.kind = kind
+        self.header = header
+        self.direction = direction
+        self.preamble = preamble if preamble is not None else []
+        self.body: List[Statement] = []
+        self.nodes: Dict[str, Node] = {}
+        self.edges: List[Edge] = []
+
+    def blocks(self) -> List[Block]:
+        """Every block, outermost first"""
+        found, pending = [], [self.body]
+        while pending:
+            for statement in pending.pop(0):
+                if isinstance(statement, Block):
+                    found.append(statement)
+                    pending.append(statement.body)
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        return {'nodes': len(self.nodes), 'edges': len(self.edges), 'blocks': len(self.blocks())}
+
+
+# Header keyword -> diagram kind
+HEADERS = {
+    'graph': 'flowchart',
+    'flowchart': 'flowchart',
+    'classDiagram': 'class',
+    'classDiagram-v2': 'class',
+    'erDiagram': 'er',
+    'sequenceDiagram': 'sequence',
+    'stateDiagram': 'state',
+    'stateDiagram-v2': 'state',
+}
+
+DIRECTIONS = ('TB', 'TD', 'BT', 'RL', 'LR')
+
+
+class _Parser:
+    """Shared block handling; subclasses parse one grammar's statements"""
+
+    def __init__(self, diagram: Diagram):
+        self.diagram = diagram
+        # (closer, body, node ids already declared in that body)
+        self.stack: List[Tuple[Optional[str], list, set]] = [(None, diagram.body, set())]
+        # Lines of a multi-line statement still being collected (a state note block)
+        self.pending: Optional[List[str]] = None
+
+    @property
+    def body(self) -> list:
+        return self.stack[-1][1]
+
+    def open(self, block: Block, closer: str):
+        self.body.append(block)
+        self.stack.append((closer, block.body, set()))
+
+    def close(self, closer: str) -> bool:
+        if len(self.stack) > 1 and self.stack[-1][0] == closer:
+            self.stack.pop()
+            return True
+        return False
+
+    def node(self, node_id: str) -> Node:
+        node = self.diagram.nodes.get(node_id)
+        if node is None:
+            node = self.diagram.nodes[node_id] = Node(node_id)
+        return node
+
+    def declare(self, node: Node):
+        """Put a node in the current body, once per body"""
+        declared = self.stack[-1][2]
+        if node.id not in declared:
+            declared.add(node.id)
+            self.body.append(node)
+
+    def edge(self, edge: Edge):
+        self.node(edge.source)
+        self.node(edge.target)
+        self.body.append(edge)
+        self.diagram.edges.append(edge)
+
+    def directive(self, text: str):
+        self.body.append(Directive(text))
+
+    def line(self, text: str):
+        if text.startswith('%%') or _ACC_RE.match(text):
+            self.directive(text)
+        elif not self.statement(text):
+            self.directive(text)
+
+    def statement(self, text: str) -> bool:
+        """Parse one stripped line; False keeps it as a Directive"""
+        raise NotImplementedError
+
+    def finish(self):
+        if self.pending:
+            self.directive('\n'.join(self.pending))
+            self.pending = None
+
+
+_ACC_RE = re.compile(r'acc(?:Title|Descr)\b')
+_DIRECTION_RE = re.compile(r'direction\s+(TB|TD|BT|RL|LR)\s*;?$')
+
+# ---------------------------------------------------------------------------
+# flowchart / graph
+# ---------------------------------------------------------------------------
+
+# (opener, closer) longest openers first; shape keys are opener + closer
+_FC_SHAPES = (
+    ('(((', ')))'), ('((', '))'), ('([', '])'), ('[(', ')]'), ('[[', ']]'), ('{{', '}}'),
+    ('[/', '/]'), ('[/', '\\]'), ('[\\', '\\]'), ('[\\', '/]'),
+    ('(', ')'), ('[', ']'), ('{', '}'), ('>', ']'),
+)
+SHAPES = {opener + closer: (opener, closer) for opener, closer in _FC_SHAPES}
+_FC_OPENERS: List[Tuple[str, Tuple[str, ...]]] = []
+for _opener, _closer in _FC_SHAPES:
+    if _FC_OPENERS and _FC_OPENERS[-1][0] == _opener:
+        _FC_OPENERS[-1] = (_opener, _FC_OPENERS[-1][1] + (_closer,))
+    else:
+        _FC_OPENERS.append((_opener, (_closer,)))
+
+_FC_ID = re.compile(r'\w+(?:[.\-]\w+)*')
+_FC_CLASS_SUFFIX = re.compile(r':::([\w-]+)')
+_FC_WS = re.compile(r'[ \t]*')
+_FC_AMP = re.compile(r'[ \t]*&[ \t]*')
+_FC_ARROW = re.compile(r'[<ox]?(?:-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,}|-\.+-[>ox]?|~{3,})')
+_FC_TEXT_OPEN = re.compile(r'[<ox]?(?:--|==|-\.)(?=[ \t]*[^ \t\-=.>])')
+_FC_TEXT_CLOSE = re.compile(r'(?:-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,}|\.-+[>ox]?)')
+_FC_EDGE_LABEL = re.compile(r'[ \t]*\|([^|]*)\|')
+_FC_KEYWORDS = ('classDef', 'class', 'style', 'linkStyle', 'click', 'direction')
+
+
+class _FlowchartParser(_Parser):
+
+    def statement(self, text: str) -> bool:
+        keyword = text.split(None, 1)[0]
+        if keyword == 'subgraph':
+            rest = text[len('subgraph'):].strip()
+            match = re.match(r'([^\s\[]+)\s*\[(.*)\]$', rest)
+            block = Block('subgraph', match.group(1), match.group(2)) if match else Block('subgraph', rest)
+            self.open(block, 'end')
+            return True
+        if text.rstrip(';') == 'end':
+            return self.close('end')
+        if keyword in _FC_KEYWORDS:
+            return False
+        return self._chain(text.rstrip(';').rstrip())
+
+    def _node(self, text: str, pos: int):
+        """(end, (id, shape, label, css_class)) of the node reference at pos, or None"""
+        match = _FC_ID.match(text, pos)
+        if not match:
+            return None
+        node_id, pos = match.group(0), match.end()
+        shape = label = None
+        for opener, closers in _FC_OPENERS:
+            if not text.startswith(opener, pos):
+                continue
+            start = pos + len(opener)
+            if text.startswith('"', start):
+                quote = text.find('"', start + 1)
+                if quote == -1:
+                    return None
+                ends = [quote + 1 if text.startswith(closer, quote + 1) else -1 for closer in closers]
+            else:
+                ends = [text.find(closer, start) for closer in closers]
+            found = [(end, closer) for end, closer in zip(ends, closers) if end != -1]
+            if not found:
+                return None
+            end, closer = min(found)
+            shape, label = opener + closer, text[start:end]
+            pos = end + len(closer)
+            break
+        suffix = _FC_CLASS_SUFFIX.match(text, pos)
+        if suffix:
+            return suffix.end(), (node_id, shape, label, suffix.group(1))
+        return pos, (node_id, shape, label, None)
+
+    def _nodes(self, text: str, pos: int):
+        """(end, [node reference, ...]) of an `A & B` group at pos, or None"""
+        found = self._node(text, pos)
+        if found is None:
+            return None
+        pos, refs = found[0], [found[1]]
+        while True:
+            amp = _FC_AMP.match(text, pos)
+            if not amp:
+                return pos, refs
+            found = self._node(text, amp.end())
+            if found is None:
+                return None
+            pos = found[0]
+            refs.append(found[1])
+
+    def _link(self, text: str, pos: int):
+        """(end, arrow, label) of the link at pos, or None"""
+        match = _FC_ARROW.match(text, pos)
+        if match:
+            label = _FC_EDGE_LABEL.match(text, match.end())
+            if label:
+                return label.end(), match.group(0), label.group(1).strip()
+            return match.end(), match.group(0), None
+        match = _FC_TEXT_OPEN.match(text, pos)
+        if match:
+            close = _FC_TEXT_CLOSE.search(text, match.end())
+            if close:
+                opener, closer = match.group(0), close.group(0)
+                # -- text --> is -->|text|, -. text .-> is -.->|text|
+                arrow = opener[:-1] + closer if opener.endswith('.') else opener[:-2] + closer
+                return close.end(), arrow, text[match.end():close.start()].strip()
+        return None
+
+    def _chain(self, text: str) -> bool:
+        """node [& node] (link node [& node])*; applied only when the whole line parses"""
+        found = self._nodes(text, 0)
+        if found is None:
+            return False
+        pos, group = found
+        refs, edges = list(group), []
+        while True:
+            pos = _FC_WS.match(text, pos).end()
+            if pos == len(text):
+                break
+            link = self._link(text, pos)
+            if link is None:
+                return False
+            pos, arrow, label = link
+            found = self._nodes(text, _FC_WS.match(text, pos).end())
+            if found is None:
+                return False
+            pos, targets = found
+            edges.extend(Edge(source[0], target[0], arrow, label) for source in group for target in targets)
+            refs.extend(targets)
+            group = targets
+
+        for node_id, shape, label, css_class in refs:
+            node = self.node(node_id)
+            if shape is not None:
+                node.shape, node.label = shape, label
+            if css_class is not None:
+                node.css_class = css_class
+        if edges:
+            for edge in edges:
+                self.edge(edge)
+        else:
+            for ref in refs:
+                self.declare(self.diagram.nodes[ref[0]])
+        return True
+
+
+# ---------------------------------------------------------------------------
+# classDiagram
+# ---------------------------------------------------------------------------
+
+_CLS_NAME = r'\w+(?:-\w+)*(?:~[^~\s]+~)?'
+_CLS_DECLARATION = re.compile(
+    rf'class\s+({_CLS_NAME})(?:\s*\["([^"]*)"\])?(?::::([\w-]+))?\s*(\{{\s*\}}|\{{)?\s*;?$')
+_CLS_RELATION = re.compile(
+    rf'({_CLS_NAME})\s*(?:"([^"]*)"\s*)?((?:<\||\*|o|<)?(?:--|\.\.)(?:\|>|\*|o|>)?)\s*(?:"([^"]*)"\s*)?'
+    rf'({_CLS_NAME})(?:\s*:\s*(.*))?$')
+_CLS_MEMBER = re.compile(rf'({_CLS_NAME})\s*:\s*(\S.*)$')
+_CLS_ANNOTATION = re.compile(rf'(<<[^<>]+>>)\s*({_CLS_NAME})\s*$')
+_CLS_NAMESPACE = re.compile(r'namespace\s+([\w.-]+)\s*\{$')
+_CLS_ALONE = re.compile(rf'({_CLS_NAME})(?::::([\w-]+))?\s*;?$')
+
+
+class _ClassParser(_Parser):
+
+    def __init__(self, diagram: Diagram):
+        super().__init__(diagram)
+        self.members: Optional[Node] = None
+
+    def statement(self, text: str) -> bool:
+        if self.members is not None:
+            if text == '}':
+                self.members = None
+            else:
+                self.members.attributes.append(text)
+            return True
+        if text == '}':
+            return self.close('}')
+        if text.startswith('class '):
+            match = _CLS_DECLARATION.match(text)
+            if not match:
+                return False
+            node = self._declare(match.group(1))
+            if match.group(2) is not None:
+                node.label = match.group(2)
+            if match.group(3):
+                node.css_class = match.group(3)
+            if match.group(4) == '{':
+                self.members = node
+            return True
+        match = _CLS_NAMESPACE.match(text)
+        if match:
+            self.open(Block('namespace', match.group(1)), '}')
+            return True
+        match = _CLS_RELATION.match(text)
+        if match:
+            source, source_label, arrow, target_label, target, label = match.groups()
+            self.edge(Edge(source, target, arrow, label.strip() if label else None, source_label, target_label))
+            return True
+        match = _CLS_MEMBER.match(text)
+        if match:
+            self._declare(match.group(1)).attributes.append(match.group(2).strip())
+            return True
+        match = _CLS_ANNOTATION.match(text)
+        if match:
+            self._declare(match.group(2)).shape = match.group(1)
+            return True
+        match = _CLS_ALONE.match(text)
+        if match:
+            node = self._declare(match.group(1))
+            if match.group(2):
+                node.css_class = match.group(2)
+            return True
+        return False
+
+    def _declare(self, node_id: str) -> Node:
+        node = self.node(node_id)
+        self.declare(node)
+        return node
+
+
+# ---------------------------------------------------------------------------
+# erDiagram
+# ---------------------------------------------------------------------------
+
+_ER_NAME = r'(?:[A-Za-z_][\w-]*|"[^"]+")'
+_ER_RELATION = re.compile(
+    rf'({_ER_NAME})\s*((?:\|o|\|\||\}}o|\}}\|)(?:--|\.\.)(?:o\||\|\||o\{{|\|\{{))\s*({_ER_NAME})'
+    r'(?:\s*:\s*(.*))?$')
+_ER_ENTITY = re.compile(rf'({_ER_NAME})(?:\s*\["([^"]*)"\])?\s*(\{{)?$')
+_ER_ATTRIBUTE = re.compile(
+    r'([A-Za-z_][\w()\[\],.-]*)\s+(\*?[A-Za-z_][\w()\[\]-]*)'
+    r'(?:\s+((?:PK|FK|UK)(?:\s*,\s*(?:PK|FK|UK))*))?(?:\s+"([^"]*)")?$')
+
+
+class _ERParser(_Parser):
+
+    def __init__(self, diagram: Diagram):
+        super().__init__(diagram)
+        self.entity: Optional[Node] = None
+
+    def statement(self, text: str) -> bool:
+        if self.entity is not None:
+            if text == '}':
+                self.entity = None
+                return True
+            match = _ER_ATTRIBUTE.match(text)
+            if match:
+                keys = tuple(key.strip() for key in match.group(3).split(',')) if match.group(3) else ()
+                self.entity.attributes.append(Attribute(match.group(1), match.group(2), keys, match.group(4)))
+            else:
+                self.entity.attributes.append(text)
+            return True
+        if _DIRECTION_RE.match(text):
+            return False
+        match = _ER_RELATION.match(text)
+        if match:
+            source, arrow, target, label = match.groups()
+            self.edge(Edge(source, target, arrow, label.strip() if label else None))
+            return True
+        match = _ER_ENTITY.match(text)
+        if match:
+            node = self.node(match.group(1))
+            self.declare(node)
+            if match.group(2) is not None:
+                node.label = match.group(2)
+            if match.group(3):
+                self.entity = node
+            return True
+        return False
+
+
+# ---------------------------------------------------------------------------
+# sequenceDiagram
+# ---------------------------------------------------------------------------
+
+_SEQ_ACTOR = r'[^\s:;,+\-<>]+(?:-(?![->x)])[^\s:;,+\-<>]+)*'
+_SEQ_MESSAGE = re.compile(
+    rf'({_SEQ_ACTOR})\s*((?:<<)?-{{1,2}}(?:>>|>|x|\)))\s*([+-]?)\s*({_SEQ_ACTOR})\s*(?::(.*))?$')
+_SEQ_PARTICIPANT = re.compile(rf'(participant|actor)\s+({_SEQ_ACTOR})(?:\s+as\s+(.+))?$')
+_SEQ_BLOCKS = ('loop', 'alt', 'opt', 'par', 'critical', 'break', 'rect', 'box')
+_SEQ_BRANCHES = ('else', 'and', 'option')
+
+
+class _SequenceParser(_Parser):
+
+    def statement(self, text: str) -> bool:
+        keyword, _, rest = text.partition(' ')
+        if keyword in _SEQ_BLOCKS:
+            self.open(Block(keyword, title=rest.strip()), 'end')
+            return True
+        if text == 'end':
+            return self.close('end')
+        if keyword in _SEQ_BRANCHES and len(self.stack) > 1:
+            self.body.append(Branch(keyword, rest.strip()))
+            return True
+        match = _SEQ_PARTICIPANT.match(text)
+        if match:
+            node = self.node(match.group(2))
+            node.shape = match.group(1)
+            if match.group(3):
+                node.label = match.group(3).strip()
+            self.declare(node)
+            return True
+        match = _SEQ_MESSAGE.match(text)
+        if match and match.group(5) is not None:
+            source, arrow, activation, target, label = match.groups()
+            self.edge(Edge(source, target, arrow + activation, label.strip()))
+            return True
+        return False
+
+
+# ---------------------------------------------------------------------------
+# stateDiagram / stateDiagram-v2
+# ---------------------------------------------------------------------------
+
+_ST_STATE = r'(\[\*\]|\w+(?:-\w+)*)(?::::([\w-]+))?'
+_ST_TRANSITION = re.compile(rf'{_ST_STATE}\s*-->\s*{_ST_STATE}(?:\s*:\s*(.*))?$')
+_ST_ALIAS = re.compile(r'state\s+"([^"]*)"\s+as\s+(\w+)\s*(\{)?$')
+_ST_KIND = re.compile(r'state\s+(\w+)\s+(<<(?:fork|join|choice)>>)$')
+_ST_COMPOSITE = re.compile(r'state\s+(\w+)\s*(\{)?$')
+_ST_DESCRIPTION = re.compile(r'(?:state\s+)?(\w+)\s*:\s*(\S.*)$')
+_ST_NOTE_BLOCK = re.compile(r'note\s+(?:left|right)\s+of\s+\w+\s*$')
+
+
+class _StateParser(_Parser):
+
+    def line(self, text: str):
+        if self.pending is not None:
+            self.pending.append(text)
+            if text == 'end note':
+                self.finish()
+            return
+        super().line(text)
+
+    def statement(self, text: str) -> bool:
+        if text == '}':
+            return self.close('}')
+        if _ST_NOTE_BLOCK.match(text):
+            self.pending = [text]
+            return True
+        match = _ST_TRANSITION.match(text)
+        if match:
+            source, source_class, target, target_class, label = match.groups()
+            self.edge(Edge(source, target, '-->', label.strip() if label else None))
+            for node_id, css_class in ((source, source_class), (target, target_class)):
+                if css_class:
+                    self.diagram.nodes[node_id].css_class = css_class
+            return True
+        if text.startswith('state '):
+            match = _ST_ALIAS.match(text)
+            if match:
+                node = self.node(match.group(2))
+                node.label = match.group(1)
+                self._place(node, match.group(3))
+                return True
+            match = _ST_KIND.match(text)
+            if match:
+                node = self.node(match.group(1))
+                node.shape = match.group(2)
+                self.declare(node)
+                return True
+            match = _ST_COMPOSITE.match(text)
+            if match:
+                self._place(self.node(match.group(1)), match.group(2))
+                return True
+        match = _ST_DESCRIPTION.match(text)
+        if match:
+            node = self.node(match.group(1))
+            node.attributes.append(match.group(2).strip())
+            self.declare(node)
+            return True
+        if re.match(rf'{_ST_STATE}$', text):
+            self.declare(self.node(text))
+            return True
+        return False
+
+    def _place(self, node: Node, opens: Optional[str]):
+        if opens:
+            self.open(Block('state', node.id), '}')
+        else:
+            self.declare(node)
+
+
+_PARSERS = {
+    'flowchart': _FlowchartParser,
+    'class': _ClassParser,
+    'er': _ERParser,
+    'sequence': _SequenceParser,
+    'state': _StateParser,
+}
+
+
+def parse(code: str) -> Optional[Diagram]:
+    """
+    Parse Mermaid code
+
+    Args:
+        code (str): Mermaid code without fences
+
+    Returns:
+        Optional[Diagram]: The diagram, or None when the header names a type the AST doesn't cover
+    """
+    lines = iter(code.split('\n'))
+    preamble = []
+    for line in lines:
+        text = line.strip()
+        if text.startswith('%%'):
+            preamble.append(text)
+        elif text:
+            break
+    else:
+        return None
+
+    keyword, _, args = text.partition(' ')
+    kind = HEADERS.get(keyword.rstrip(';'))
+    if kind is None:
+        return None
+    args = args.strip().rstrip(';').strip()
+    direction = args if kind == 'flowchart' and args in DIRECTIONS else None
+    diagram = Diagram(kind, keyword.rstrip(';'), direction, preamble)
+
+    parser = _PARSERS[kind](diagram)
+    for line in lines:
+        text = line.strip()
+        if text:
+            parser.line(text)
+    parser.finish()
+    return diagram
+
+
+# ---------------------------------------------------------------------------
+# Serializer
+# ---------------------------------------------------------------------------
+
+INDENT = '    '
+
+
+class _Writer:
+    """Prints a Diagram's body; nodes are written in full where they first appear"""
+
+    def __init__(self, diagram: Diagram):
+        self.diagram = diagram
+        self.lines: List[str] = []
+        self.written: set = set()
+
+    def write(self) -> str:
+        header = self.diagram.header
+        if self.diagram.direction:
+            header += ' ' + self.diagram.direction
+        self.lines.extend(self.diagram.preamble)
+        self.lines.append(header)
+        self.body(self.diagram.body, 1)
+        return '\n'.join(self.lines)
+
+    def emit(self, depth: int, text: str):
+        self.lines.append(INDENT * depth + text)
+
+    def body(self, statements: list, depth: int):
+        for statement in statements:
+            if isinstance(statement, Edge):
+                self.edge(statement, depth)
+            elif isinstance(statement, Node):
+                self.node(statement, depth)
+            elif isinstance(statement, Block):
+                self.block(statement, depth)
+            elif isinstance(statement, Branch):
+                self.emit(depth - 1, f"{statement.keyword} {statement.title}".rstrip())
+            else:
+                for line in statement.text.split('\n'):
+                    self.emit(depth, line)
+
+    def first(self, node_id: str) -> bool:
+        if node_id in self.written:
+            return False
+        self.written.add(node_id)
+        return True
+
+
+class _FlowchartWriter(_Writer):
+
+    def ref(self, node_id: str) -> str:
+        if not self.first(node_id):
+            return node_id
+        node = self.diagram.nodes[node_id]
+        text = node_id
+        if node.shape is not None:
+            opener, closer = SHAPES[node.shape]
+            text += f"{opener}{node.label}{closer}"
+        if node.css_class:
+            text += f":::{node.css_class}"
+        return text
+
+    def node(self, node: Node, depth: int):
+        self.emit(depth, self.ref(node.id))
+
+    def edge(self, edge: Edge, depth: int):
+        label = f"|{edge.label}|" if edge.label else ''
+        self.emit(depth, f"{self.ref(edge.source)} {edge.arrow}{label} {self.ref(edge.target)}")
+
+    def block(self, block: Block, depth: int):
+        title = f"[{block.title}]" if block.title is not None else ''
+        self.emit(depth, f"subgraph {block.id}{title}")
+        self.body(block.body, depth + 1)
+        self.emit(depth, 'end')
+
+
+class _ClassWriter(_Writer):
+
+    def node(self, node: Node, depth: int):
+        if not self.first(node.id):
+            self.emit(depth, f"class {node.id}")
+            return
+        label = f'["{node.label}"]' if node.label is not None else ''
+        if node.attributes:
+            self.emit(depth, f"class {node.id}{label} {{")
+            for member in node.attributes:
+                self.emit(depth + 1, member)
+            self.emit(depth, '}')
+        else:
+            self.emit(depth, f"class {node.id}{label}")
+        if node.shape:
+            self.emit(depth, f"{node.shape} {node.id}")
+        if node.css_class:
+            self.emit(depth, f"class {node.id}:::{node.css_class}")
+
+    def edge(self, edge: Edge, depth: int):
+        parts = [edge.source]
+        if edge.source_label is not None:
+            parts.append(f'"{edge.source_label}"')
+        parts.append(edge.arrow)
+        if edge.target_label is not None:
+            parts.append(f'"{edge.target_label}"')
+        parts.append(edge.target)
+        text = ' '.join(parts)
+        self.emit(depth, f"{text} : {edge.label}" if edge.label else text)
+
+    def block(self, block: Block, depth: int):
+        self.emit(depth, f"namespace {block.id} {{")
+        self.body(block.body, depth + 1)
+        self.emit(depth, '}')
+
+
+class _ERWriter(_Writer):
+
+    def node(self, node: Node, depth: int):
+        if not self.first(node.id):
+            return
+        label = f'["{node.label}"]' if node.label is not None else ''
+        if node.attributes:
+            self.emit(depth, f"{node.id}{label} {{")
+            for attribute in node.attributes:
+                self.emit(depth + 1, str(attribute))
+            self.emit(depth, '}')
+        else:
+            self.emit(depth, f"{node.id}{label}")
+
+    def edge(self, edge: Edge, depth: int):
+        text = f"{edge.source} {edge.arrow} {edge.target}"
+        self.emit(depth, f"{text} : {edge.label}" if edge.label is not None else text)
+
+
+class _SequenceWriter(_Writer):
+
+    def node(self, node: Node, depth: int):
+        if not self.first(node.id):
+            return
+        alias = f" as {node.label}" if node.label else ''
+        self.emit(depth, f"{node.shape or 'participant'} {node.id}{alias}")
+
+    def edge(self, edge: Edge, depth: int):
+        self.emit(depth, f"{edge.source}{edge.arrow}{edge.target}: {edge.label}".rstrip())
+
+    def block(self, block: Block, depth: int):
+        self.emit(depth, f"{block.kind} {block.title}".rstrip())
+        self.body(block.body, depth + 1)
+        self.emit(depth, 'end')
+
+
+class _StateWriter(_Writer):
+
+    def ref(self, node_id: str) -> str:
+        node = self.diagram.nodes[node_id]
+        if node.css_class and self.first(f":::{node_id}"):
+            return f"{node_id}:::{node.css_class}"
+        return node_id
+
+    def node(self, node: Node, depth: int):
+        if not self.first(node.id):
+            return
+        if node.label is not None:
+            self.emit(depth, f'state "{node.label}" as {node.id}')
+        if node.shape:
+            self.emit(depth, f"state {node.id} {node.shape}")
+        for description in node.attributes:
+            self.emit(depth, f"{node.id} : {description}")
+        if node.label is None and not node.shape and not node.attributes:
+            self.emit(depth, self.ref(node.id))
+
+    def edge(self, edge: Edge, depth: int):
+        text = f"{self.ref(edge.source)} --> {self.ref(edge.target)}"
+        self.emit(depth, f"{text} : {edge.label}" if edge.label else text)
+
+    def block(self, block: Block, depth: int):
+        node = self.diagram.nodes.get(block.id)
+        if node is not None and node.label is not None and self.first(block.id):
+            self.emit(depth, f'state "{node.label}" as {block.id} {{')
+        else:
+            self.emit(depth, f"state {block.id} {{")
+        self.body(block.body, depth + 1)
+        self.emit(depth, '}')
+
+
+_WRITERS = {
+    'flowchart': _FlowchartWriter,
+    'class': _ClassWriter,
+    'er': _ERWriter,
+    'sequence': _SequenceWriter,
+    'state': _StateWriter,
+}
+
+
+def serialize(diagram: Diagram) -> str:
+    """Canonical Mermaid text of a diagram"""
+    return _WRITERS[diagram.kind](diagram).write()
+
+
+def canonicalize(code: str) -> str:
+    """
+    Canonical text of Mermaid code
+
+    Diagrams the AST covers are parsed and serialized. Other types only lose
+    trailing whitespace and surrounding blank lines, since indentation is
+    meaningful in some of them (mindmap).
+    """
+    diagram = parse(code)
+    if diagram is not None:
+        return serialize(diagram)
+    return '\n'.join(line.rstrip() for line in code.strip().splitlines())
+
+
+def content_hash(code: str) -> str:
+    """SHA-256 hex digest of the canonical text; equal for diagrams that differ only in formatting"""
+    return hashlib.sha256(canonicalize(code).encode('utf-8')).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Structural diff
+# ---------------------------------------------------------------------------
+
+def _edge_key(edge: Edge) -> tuple:
+    return edge._values()
+
+
+class DiagramDiff(NamedTuple):
+    """What changed between two versions of a diagram"""
+    added_nodes: List[str]
+    removed_nodes: List[str]
+    changed_nodes: List[str]
+    added_edges: List[Edge]
+    removed_edges: List[Edge]
+
+    @property
+    def empty(self) -> bool:
+        return not any(self)
+
+    def summary(self) -> str:
+        """Short description such as '+2 nodes, -1 edge, 1 node changed'"""
+        def count(number: int, noun: str) -> str:
+            return f"{number} {noun}{'' if number == 1 else 's'}"
+
+        parts = []
+        if self.added_nodes:
+            parts.append('+' + count(len(self.added_nodes), 'node'))
+        if self.removed_nodes:
+            parts.append('-' + count(len(self.removed_nodes), 'node'))
+        if self.added_edges:
+            parts.append('+' + count(len(self.added_edges), 'edge'))
+        if self.removed_edges:
+            parts.append('-' + count(len(self.removed_edges), 'edge'))
+        if self.changed_nodes:
+            parts.append(count(len(self.changed_nodes), 'node') + ' changed')
+        return ', '.join(parts) or 'no structural changes'
+
+
+def diff_diagrams(old: Diagram, new: Diagram) -> DiagramDiff:
+    """
+    Nodes and edges added, removed or changed from `old` to `new`
+
+    Nodes are matched by ID; an edge whose label or arrow changed counts as
+    removed and added.
+    """
+    old_edges = Counter(_edge_key(edge) for edge in old.edges)
+    new_edges = Counter(_edge_key(edge) for edge in new.edges)
+    return DiagramDiff(
+        added_nodes=[node_id for node_id in new.nodes if node_id not in old.nodes],
+        removed_nodes=[node_id for node_id in old.nodes if node_id not in new.nodes],
+        changed_nodes=[node_id for node_id, node in new.nodes.items()
+                       if node_id in old.nodes and old.nodes[node_id] != node],
+        added_edges=[Edge(*key) for key in (new_edges - old_edges).elements()],
+        removed_edges=[Edge(*key) for key in (old_edges - new_edges).elements()],
+    )
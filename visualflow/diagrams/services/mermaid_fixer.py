@@ -0,0 +1,342 @@
+"""
+Mermaid syntax fixer - precompiled rules for the mistakes LLMs make most often
+
+Rules are registered for the diagram types they apply to and run in one pass
+over the lines of a diagram: every rule of the diagram's type is tried on a
+line, in registration order, before moving to the next line. The type is read
+from the header, so ER and class rules never touch a flowchart; code without a
+recognizable header gets every rule. A rule is tried on a line only when the
+line, as earlier rules left it, contains its trigger text.
+
+Each rule counts its hits in the metrics registry (`fixer.rule.<name>`), and one
+call in PROFILE_EVERY also records per-rule timings (`fixer.rule.<name>.ms`).
+
+Every pattern runs in time linear in the line length: matches of a leading
+run (a word, emojis, whitespace) may only start where the run starts, and
+`SubRule.ends_with` bounds the search for a closing bracket. `manage.py
+benchmark --suites fuzz` checks this on adversarial and random input.
+"""
+
+import itertools
+import re
+import time
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .metrics import metrics
+
+# Header keyword -> diagram type the rules are registered for
+HEADER_TYPES = {
+    'graph': 'flowchart',
+    'flowchart': 'flowchart',
+    'classDiagram': 'class',
+    'classDiagram-v2': 'class',
+    'erDiagram': 'er',
+    'sequenceDiagram': 'sequence',
+    'stateDiagram': 'state',
+    'stateDiagram-v2': 'state',
+}
+DIAGRAM_TYPES = tuple(sorted(set(HEADER_TYPES.values())))
+
+# Record per-rule timings on one call in this many
+PROFILE_EVERY = 50
+
+
+def diagram_type_of(code: str) -> Optional[str]:
+    """Diagram type named by the first non-comment line, or None when it isn't one the rules know"""
+    for line in code.split('\n', 20):
+        text = line.strip()
+        if not text or text.startswith('%%'):
+            continue
+        return HEADER_TYPES.get(text.split(None, 1)[0].rstrip(';'))
+    return None
+
+
+def truncate(code: str, max_chars: int, max_lines: int) -> Tuple[str, bool]:
+    """
+    Cut code to at most `max_chars` characters and `max_lines` lines, at a line boundary
+
+    A single line longer than `max_chars` is cut mid-line. Either limit may be 0 for none.
+
+    Returns:
+        Tuple[str, bool]: (code, whether anything was cut)
+    """
+    truncated = False
+    if max_chars and len(code) > max_chars:
+        cut = code.rfind('\n', 0, max_chars + 1)
+        code = code[:cut if cut > 0 else max_chars]
+        truncated = True
+    if max_lines:
+        lines = code.split('\n', max_lines)
+        if len(lines) > max_lines:
+            code = '\n'.join(lines[:max_lines])
+            truncated = True
+    return code, truncated
+
+
+class Rule:
+    """
+    One fix applied to a single line
+
+    Args:
+        name (str): Metric name of the rule
+        trigger (str): Text a line must contain for the rule to apply; None to always try it
+    """
+
+    def __init__(self, name: str, trigger: Optional[str] = None):
+        self.name = name
+        self.trigger = trigger
+
+    def apply(self, line: str) -> Tuple[Optional[str], int]:
+        """Return the fixed line (None to drop it) and the number of fixes made"""
+        raise NotImplementedError
+
+
+class SubRule(Rule):
+    """
+    Regular expression substitution
+
+    `ends_with` is text every match ends with: the search stops at its last
+    occurrence on the line, so an opener that is never closed can't make each
+    candidate scan to the end of the line.
+    """
+
+    def __init__(self, name: str, pattern: str, replacement: Union[str, Callable], flags: int = 0,
+                 trigger: Optional[str] = None, ends_with: Optional[str] = None):
+        super().__init__(name, trigger)
+        self.pattern = re.compile(pattern, flags)
+        self.replacement = replacement
+        self.ends_with = ends_with
+
+    def apply(self, line: str) -> Tuple[Optional[str], int]:
+        if self.ends_with is None:
+            return self.pattern.subn(self.replacement, line)
+        end = line.rfind(self.ends_with)
+        if end < 0:
+            return line, 0
+        end += len(self.ends_with)
+        head, count = self.pattern.subn(self.replacement, line[:end])
+        return head + line[end:], count
+
+
+class LiteralRule(Rule):
+    """Plain text replacement"""
+
+    def __init__(self, name: str, old: str, new: str):
+        super().__init__(name, trigger=old)
+        self.old = old
+        self.new = new
+
+    def apply(self, line: str) -> Tuple[Optional[str], int]:
+        count = line.count(self.old)
+        return (line.replace(self.old, self.new), count) if count else (line, 0)
+
+
+class DropRule(Rule):
+    """Removes the lines a predicate selects"""
+
+    def __init__(self, name: str, predicate: Callable[[str], bool], trigger: Optional[str] = None):
+        super().__init__(name, trigger)
+        self.predicate = predicate
+
+    def apply(self, line: str) -> Tuple[Optional[str], int]:
+        return (None, 1) if self.predicate(line) else (line, 0)
+
+
+class SyntaxFixer:
+    """Rule registry and the line pass that applies it"""
+
+    def __init__(self, profile_every: int = PROFILE_EVERY):
+        """Initialize an empty fixer; `profile_every` of 0 disables rule timings"""
+        self.profile_every = profile_every
+        self._rules: List[Tuple[Rule, Optional[frozenset]]] = []
+        self._plans: Dict[Optional[str], Tuple[Rule, ...]] = {}
+        self._calls = itertools.count(1)
+
+    def register(self, rule: Rule, types: Optional[Iterable[str]] = None) -> Rule:
+        """
+        Add a rule after the existing ones
+
+        Args:
+            rule (Rule): Rule to add
+            types: Diagram types it applies to (see DIAGRAM_TYPES); None for every type
+        """
+        types = frozenset(types) if types is not None else None
+        unknown = (types or frozenset()) - set(DIAGRAM_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown diagram type(s) for rule {rule.name}: {', '.join(sorted(unknown))}")
+        self._rules.append((rule, types))
+        self._plans.clear()
+        return rule
+
+    def rules_for(self, diagram_type: Optional[str]) -> Tuple[Rule, ...]:
+        """Rules applied to a diagram type, in order; every rule when the type is unknown"""
+        plan = self._plans.get(diagram_type)
+        if plan is None:
+            plan = tuple(rule for rule, types in self._rules
+                         if types is None or diagram_type not in DIAGRAM_TYPES or diagram_type in types)
+            self._plans[diagram_type] = plan
+        return plan
+
+    def fix(self, code: str) -> Tuple[str, Dict[str, int]]:
+        """
+        Apply the rules for the code's diagram type
+
+        Args:
+            code (str): Mermaid code, already cleaned of fences
+
+        Returns:
+            Tuple[str, Dict[str, int]]: (fixed code, hits per rule that fired)
+        """
+        rules = self.rules_for(diagram_type_of(code))
+        profile = self.profile_every and next(self._calls) % self.profile_every == 0
+        if profile:
+            lines, hits, timings = self._run_profiled(rules, code.split('\n'))
+            for name, elapsed in timings.items():
+                metrics.observe(f'fixer.rule.{name}.ms', elapsed * 1000)
+        else:
+            lines, hits = self._run(rules, code.split('\n'))
+
+        self.record(hits)
+        return '\n'.join(lines).strip(), hits
+
+    def fix_lines(self, lines: List[str], diagram_type: Optional[str]) -> Tuple[List[str], Dict[str, int]]:
+        """
+        Apply the rules for `diagram_type` to some lines of a diagram, for callers that see it a few lines at a time
+
+        Hits are not recorded in the metrics registry; pass the caller's running totals to record() once.
+
+        Returns:
+            Tuple[List[str], Dict[str, int]]: (fixed lines less the dropped ones, hits per rule that fired)
+        """
+        return self._run(self.rules_for(diagram_type), lines)
+
+    @staticmethod
+    def record(hits: Dict[str, int]):
+        """Count rule hits in the metrics registry"""
+        for name, count in hits.items():
+            metrics.incr(f'fixer.rule.{name}', count)
+
+    @staticmethod
+    def _run(rules, lines):
+        hits: Dict[str, int] = {}
+        kept = []
+        for line in lines:
+            for rule in rules:
+                if rule.trigger is not None and rule.trigger not in line:
+                    continue
+                line, count = rule.apply(line)
+                if count:
+                    hits[rule.name] = hits.get(rule.name, 0) + count
+                    if line is None:
+                        break
+            else:
+                kept.append(line)
+        return kept, hits
+
+    @staticmethod
+    def _run_profiled(rules, lines):
+        hits: Dict[str, int] = {}
+        timings = dict.fromkeys((rule.name for rule in rules), 0.0)
+        kept = []
+        for line in lines:
+            for rule in rules:
+                started = time.perf_counter()
+                if rule.trigger is None or rule.trigger in line:
+                    line, count = rule.apply(line)
+                else:
+                    count = 0
+                timings[rule.name] += time.perf_counter() - started
+                if count:
+                    hits[rule.name] = hits.get(rule.name, 0) + count
+                    if line is None:
+                        break
+            else:
+                kept.append(line)
+        return kept, hits, timings
+
+
+def _fix_emoji_node(match) -> str:
+    # emoji[label] -> labelId[emoji label]
+    emoji_part, label_part = match.group(1), match.group(2)
+    clean_id = _NON_ID_RE.sub('', label_part)
+    if not clean_id:
+        # crc32 rather than hash(): str hashes are salted per process, and the ID must not change between runs
+        clean_id = f"Node{zlib.crc32(emoji_part.encode('utf-8')) % 10000}"
+    return f"{clean_id}[{emoji_part} {label_part}]"
+
+
+_NON_ID_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+# Mermaid reserved words that cannot be used as node IDs; they get a 'Node' suffix
+RESERVED_KEYWORDS = ['end', 'start', 'subgraph', 'graph', 'classDef', 'class', 'click', 'callback', 'link', 'style']
+_RESERVED = {keyword.lower(): keyword for keyword in RESERVED_KEYWORDS}
+_RESERVED_ALT = '|'.join(RESERVED_KEYWORDS)
+
+_CLASS_ARROWS = r'(-->|<\|--|o--|\.\.>|\*--|\.\.)'
+_MULTIPLICITY = r'(\d+|\*|0\.\.1|1\.\.\*|0\.\.\*)'
+
+
+def _is_styling(line: str) -> bool:
+    stripped = line.strip()
+    if stripped.startswith('classDef '):
+        return True
+    return stripped.startswith('class ') and '{' not in line and '--' not in line
+
+
+syntax_fixer = SyntaxFixer()
+
+# Tilde generics: List~Item~ -> List<Item>. Every type, since flowchart labels and messages use them too
+syntax_fixer.register(SubRule('tilde_generics', r'\b(\w+)~([^~]+)~', r'\1<\2>', trigger='~'))
+# Emojis used as node IDs move into the label: 🏢[Admin] -> Admin[🏢 Admin]. Only non-ASCII
+# runs count as emoji IDs, so shape openers such as the '(' of a stadium node A([Start]) are left alone
+syntax_fixer.register(SubRule('emoji_node_ids', r'(?<![^\x00-\x7f\w\s])([^\x00-\x7f\w\s]+)\[([^\]]+)\]',
+                              _fix_emoji_node, trigger='[', ends_with=']'),
+                      types=['flowchart'])
+# ER attributes need "type name KEY": "PK bookId" -> "string bookId PK"
+syntax_fixer.register(SubRule('er_key_first', r'^(\s+)(PK|FK)\s+(\w+)\s*$', r'\1string \3 \2', trigger='K'),
+                      types=['er'])
+# "PK bookId string" -> "string bookId PK"
+syntax_fixer.register(SubRule('er_key_first_typed', r'^(\s+)(PK|FK)\s+(\w+)\s+(\w+)\s*$', r'\1\4 \3 \2',
+                              trigger='K'),
+                      types=['er'])
+# Mermaid takes one constraint per attribute: "int book_id PK FK" -> "int book_id PK"
+syntax_fixer.register(SubRule('er_composite_key', r'((?:^\s*|(?<!\s)\s+)\w+\s+\w+)\s+(PK|FK)\s+(PK|FK)', r'\1 \2',
+                              trigger='K'),
+                      types=['er'])
+# Many-to-optional-many isn't a valid cardinality pair; use many-to-optional-one
+syntax_fixer.register(LiteralRule('er_many_to_many', '}o--o{', '}o--o|'), types=['er'])
+# Class multiplicities must be quoted: Order 1 --> * Item -> Order "1" --> "*" Item. A leftmost
+# match of a leading (\w+) always starts a word, so \b only saves attempts from inside words
+syntax_fixer.register(SubRule('class_multiplicity_left', rf'\b(\w+)\s+{_MULTIPLICITY}\s+{_CLASS_ARROWS}',
+                              r'\1 "\2" \3'),
+                      types=['class'])
+syntax_fixer.register(SubRule('class_multiplicity_right', rf'{_CLASS_ARROWS}\s+{_MULTIPLICITY}\s+(\w+)',
+                              r'\1 "\2" \3'),
+                      types=['class'])
+# A multiplicity on one side only: Order "*" *-- Cart -> Order "*" *-- "1" Cart
+syntax_fixer.register(SubRule('class_multiplicity_missing_right', r'\b(\w+)\s+"([^"]+)"\s+(\*--|o--|<\|--)\s+(\w+)',
+                              r'\1 "\2" \3 "1" \4', trigger='"'),
+                      types=['class'])
+syntax_fixer.register(SubRule('class_multiplicity_missing_left', r'\b(\w+)\s+(\*--|o--|<\|--)\s+"([^"]+)"\s+(\w+)',
+                              r'\1 "1" \2 "\3" \4', trigger='"'),
+                      types=['class'])
+# Reserved words as flowchart node or state IDs: end[Done] -> endNode[Done], A --> end -> A --> endNode, end --> A -> endNode --> A.
+# Every place an ID can stand is covered, whatever its shape, so a declaration such as Start([Start]) is
+# renamed along with the edges that use it
+syntax_fixer.register(SubRule('reserved_id_node', rf'\b({_RESERVED_ALT})\[',
+                              lambda m: f"{_RESERVED[m.group(1).lower()]}Node[", re.IGNORECASE),
+                      types=['flowchart', 'state'])
+# Round and curly shapes only at the start of a line, so words before a '(' in labels are left alone
+syntax_fixer.register(SubRule('reserved_id_shape', rf'^(\s*)({_RESERVED_ALT})(?=[({{])',
+                              lambda m: f"{m.group(1)}{_RESERVED[m.group(2).lower()]}Node", re.IGNORECASE),
+                      types=['flowchart', 'state'])
+syntax_fixer.register(SubRule('reserved_id_target', rf'(-->|---)\s+({_RESERVED_ALT})(?=[\[({{]|\s|$)',
+                              lambda m: f"{m.group(1)} {_RESERVED[m.group(2).lower()]}Node", re.IGNORECASE,
+                              trigger='--'),
+                      types=['flowchart', 'state'])
+syntax_fixer.register(SubRule('reserved_id_source', rf'\b({_RESERVED_ALT})(?=\s*(?:-->|---))',
+                              lambda m: f"{_RESERVED[m.group(1).lower()]}Node", re.IGNORECASE, trigger='--'),
+                      types=['flowchart', 'state'])
+# Styling directives aren't supported by the renderer setup: drop classDef and "class A styleName" lines
+syntax_fixer.register(DropRule('styling_removed', _is_styling, trigger='class'))
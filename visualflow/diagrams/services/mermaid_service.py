@@ -2,27 +2,53 @@
 Mermaid.js Diagram Service - AI-powered diagram generation with two-step approach
 """
 
+import asyncio
+import contextvars
 import logging
 import json
-from typing import Dict, Any, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, NamedTuple, Optional, Tuple
+from asgiref.sync import sync_to_async
 from config.constants import AppConstants
 from config.env_config import EnvConfig
 from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage, SystemMessage
+from .llm_backends import LLMBackend, llm_backend
+from .intent_classifier import get_intent_classifier
+from .llm_client import TruncatedResponse, llm_gateway, request_deadline
+from .model_router import Route, model_router
+from .circuit_breaker import llm_breaker
+from .fallback_generator import build_fallback_diagram
+from .metrics import metrics
+from .cache_service import analysis_cache, generation_cache, make_cache_key, normalize_prompt
+from .mermaid_validator import ValidationResult, validate_mermaid
+from .mermaid_fixer import syntax_fixer, truncate
+from .mermaid_stream import MermaidStreamProcessor
+from .mermaid_ast import canonicalize, parse as parse_mermaid, serialize
+from .tracing import generation_trace, current_trace
+from .stream_bus import current_channel
 
 # Import specialized prompts
-from .prompts.analyzer_prompt import ANALYZER_PROMPT
-from .prompts.flowchart_prompt import FLOWCHART_PROMPT
-from .prompts.class_diagram_prompt import CLASS_DIAGRAM_PROMPT
-from .prompts.er_diagram_prompt import ER_DIAGRAM_PROMPT
-from .prompts.sequence_diagram_prompt import SEQUENCE_DIAGRAM_PROMPT
-from .prompts.state_diagram_prompt import STATE_DIAGRAM_PROMPT
-from .prompts.dfd_prompt import DFD_PROMPT
-from .prompts.system_design_prompt import SYSTEM_DESIGN_PROMPT
-from .prompts.custom_prompt import CUSTOM_PROMPT
+from .prompts.registry import PromptSpec, prompt_registry
 
 logger = logging.getLogger(__name__)
 
+# Runs the analyzer and the speculative generator side by side in 'speculative' mode
+_speculation_executor = ThreadPoolExecutor(
+    max_workers=EnvConfig.GENERATION_MAX_WORKERS * 2,
+    thread_name_prefix='diagram-spec'
+)
+
+
+class LLMRequest(NamedTuple):
+    """Everything one pipeline step sends to the LLM"""
+    cache_key: str
+    messages: list
+    spec: PromptSpec
+    route: Route
+
 
 class MermaidService:
     """
@@ -50,38 +76,60 @@ class MermaidService:
             'quadrant': 'quadrantChart'
         }
         
-        # Map diagram types to their specialized prompts
-        self.prompt_map = {
-            'flowchart': FLOWCHART_PROMPT,
-            'sequence': SEQUENCE_DIAGRAM_PROMPT,
-            'class': CLASS_DIAGRAM_PROMPT,
-            'uml': CLASS_DIAGRAM_PROMPT,
-            'er': ER_DIAGRAM_PROMPT,
-            'erd': ER_DIAGRAM_PROMPT,
-            'state': STATE_DIAGRAM_PROMPT,
-            'dfd': DFD_PROMPT,
-            'system_design': SYSTEM_DESIGN_PROMPT,
-            'custom': CUSTOM_PROMPT,
-        }
+        # Specialized system prompts per diagram type, in the configured variant
+        self.prompts = prompt_registry
+        
+        # Model, temperature and max_tokens per step and diagram type
+        self.router = model_router
+        default_route = self.router.route('generator')
+        self.model_name = default_route.model
+        self.temperature = default_route.temperature
+        
+        # Where completions come from (Groq API, local stub or cassettes), selected by LLM_BACKEND
+        self.backend = llm_backend
+        
+        # One client per (model, temperature, max_tokens), all on the backend's HTTP pool
+        self._clients: Dict[Tuple[str, float, Optional[int]], ChatGroq] = {}
+        self._clients_lock = threading.Lock()
         
         # Initialize AI client
+        self._init_default_client()
+    
+    def use_backend(self, backend: LLMBackend):
+        """Serve later calls from another backend (benchmarks, tests); cached clients are dropped"""
+        with self._clients_lock:
+            self.backend = backend
+            self._clients.clear()
+        self._init_default_client()
+    
+    def _init_default_client(self):
+        default_route = self.router.route('generator')
         try:
-            self.groq_client = ChatGroq(
-                groq_api_key=EnvConfig.GROQ_API_KEY,
-                model_name="openai/gpt-oss-120b",
-                temperature=0.3
-            )
+            self.groq_client = self._client_for(default_route, default_route.model)
         except Exception as e:
             logger.error(f"Failed to initialize Groq client: {e}")
             self.groq_client = None
     
-    def generate_mermaid_code(self, prompt: str, diagram_type: str = 'flowchart') -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    def _client_for(self, route: Route, model: str) -> ChatGroq:
+        """Chat client for one model of a route, created on first use"""
+        key = (model, route.temperature, route.max_tokens)
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = self.backend.chat_model(model, route.temperature, route.max_tokens)
+            return client
+    
+    def generate_mermaid_code(self, prompt: str, diagram_type: str = 'flowchart',
+                              mode: Optional[str] = None,
+                              explicit_type: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """
         Generate Mermaid.js code using AI based on prompt and diagram type
         
         Args:
             prompt (str): User prompt describing the diagram
             diagram_type (str): Type of diagram to generate
+            mode (Optional[str]): 'two_step', 'fused' or 'speculative'; defaults to the GENERATION_MODE setting
+            explicit_type (bool): True when the user picked the diagram type rather than auto-detect
             
         Returns:
             Tuple[Optional[str], Optional[str], Optional[str]]: (mermaid_code, error_message, detected_diagram_type)
@@ -90,9 +138,24 @@ class MermaidService:
             if not prompt.strip():
                 return None, "Prompt cannot be empty", None
             
-            # Use AI to generate if available
-            if self.groq_client:
-                return self._generate_with_ai(prompt, diagram_type)
+            # Use AI to generate if available (and not failing fast on an open circuit)
+            if self.groq_client and llm_breaker.state != llm_breaker.OPEN:
+                mode = self._resolve_mode(mode)
+                if mode == 'speculative' and not explicit_type:
+                    # Without a picked type there is nothing to speculate on, so this is a two-step run
+                    mode = 'two_step'
+                with generation_trace() as trace, request_deadline():
+                    trace.mode = mode
+                    if mode == 'fused':
+                        result = self._generate_fused(prompt, diagram_type, explicit_type)
+                    elif mode == 'speculative':
+                        result = self._generate_speculative(prompt, diagram_type)
+                    else:
+                        result = self._generate_with_ai(prompt, diagram_type, explicit_type)
+                    result = (self._canonicalize(self._validate_and_repair(result[0], result[2] or diagram_type)),
+                              *result[1:])
+                    self._record_mode_metrics(trace.mode, result[0], trace)
+                return result
             else:
                 # Fallback to templates
                 code, error = self._generate_fallback(prompt, diagram_type)
@@ -102,8 +165,273 @@ class MermaidService:
             error_msg = f"Error generating Mermaid code: {str(e)}"
             logger.error(error_msg)
             return None, error_msg, None
+    
+    def _generate_fallback(self, prompt: str, diagram_type: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Build a degraded diagram locally when the LLM is unavailable or failed
+        
+        Returns:
+            Tuple[Optional[str], Optional[str]]: (mermaid_code, error_message)
+        """
+        started = time.perf_counter()
+        try:
+            mermaid_code = build_fallback_diagram(prompt, diagram_type)
+        except Exception as e:
+            logger.error(f"Fallback generation failed: {e}")
+            return None, f"Fallback generation failed: {str(e)}"
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.incr('fallback.generated')
+        metrics.observe('fallback.latency_ms', elapsed_ms)
+        trace = current_trace()
+        if trace is not None:
+            trace.record('fallback', elapsed_ms, model='offline')
+        logger.warning(f"Served offline fallback {diagram_type} diagram")
+        return mermaid_code, None
+    
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        """Validate a requested generation mode, falling back to the configured default"""
+        if mode in AppConstants.GENERATION_MODES:
+            return mode
+        if EnvConfig.GENERATION_MODE in AppConstants.GENERATION_MODES:
+            return EnvConfig.GENERATION_MODE
+        return 'two_step'
+    
+    def _record_mode_metrics(self, mode: str, mermaid_code: Optional[str], trace):
+        """
+        A/B counters comparing latency, token use and validity across generation modes
+        
+        A diagram served by the offline fallback generator is counted under
+        ab.<mode>.fallback rather than as valid or invalid, so the validity rate
+        only covers diagrams the LLM wrote.
+        """
+        metrics.incr(f'ab.{mode}.requests')
+        metrics.incr(f'ab.{mode}.prompt_tokens', trace.prompt_tokens)
+        metrics.incr(f'ab.{mode}.completion_tokens', trace.completion_tokens)
+        metrics.observe(f'ab.{mode}.latency_ms', trace.elapsed_ms)
+        if any(s['step'] == 'fallback' for s in trace.steps):
+            metrics.incr(f'ab.{mode}.fallback')
+            return
+        
+        valid = self._is_valid(mermaid_code)
+        metrics.incr(f'ab.{mode}.valid' if valid else f'ab.{mode}.invalid')
+        
+        # Validity per route, credited to the call that produced the diagram
+        generated = [s for s in trace.steps if s['step'] in ('generator', 'fused', 'refine')
+                     and s.get('route') and not s['cached']]
+        if generated:
+            self.router.record_validity(generated[-1]['route'], generated[-1]['model'], valid)
+    
+    def _mark_fused_fallback(self):
+        """Record a fused request that fell back to two-step under its own mode, fused_two_step"""
+        trace = current_trace()
+        if trace is not None and trace.mode == 'fused':
+            trace.mode = 'fused_two_step'
+    
+    def _is_valid(self, mermaid_code: Optional[str]) -> bool:
+        """Validator verdict on a final diagram, or the header check for types the validator doesn't cover"""
+        if not mermaid_code:
+            return False
+        result = validate_mermaid(mermaid_code)
+        return result.valid if result.supported else self._looks_valid(mermaid_code)
+    
+    def _canonicalize(self, mermaid_code: Optional[str]) -> Optional[str]:
+        """
+        Parse the final diagram, record its node and edge counts as the 'parser' step,
+        and return it in canonical form (see mermaid_ast.canonicalize)
+        """
+        if not mermaid_code:
+            return mermaid_code
+        started = time.perf_counter()
+        diagram = parse_mermaid(mermaid_code)
+        if diagram is None:
+            metrics.incr('parser.unsupported')
+            return canonicalize(mermaid_code)
+        canonical = serialize(diagram)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe('parser.latency_ms', elapsed_ms)
+        trace = current_trace()
+        if trace is not None:
+            trace.record('parser', elapsed_ms, nodes=len(diagram.nodes), edges=len(diagram.edges))
+        metrics.observe(f'diagram.{diagram.kind}.nodes', len(diagram.nodes))
+        metrics.observe(f'diagram.{diagram.kind}.edges', len(diagram.edges))
+        return canonical
+    
+    def _looks_valid(self, mermaid_code: Optional[str]) -> bool:
+        """Cheap structural check: non-empty code starting with a known diagram header"""
+        if not mermaid_code:
+            return False
+        first_line = next((line.strip() for line in mermaid_code.splitlines() if line.strip()), '')
+        headers = set(self.diagram_types.values()) | {'graph', 'flowchart'}
+        return first_line.split(' ')[0] in {h.split(' ')[0] for h in headers}
+    
+    def _invoke(self, step: str, request: LLMRequest, **kwargs):
+        """Call the LLM down the route's model chain, recording latency and tokens on the active trace"""
+        for model in request.route.models:
+            started = time.perf_counter()
+            try:
+                response = llm_gateway.invoke(self._client_for(request.route, model), step,
+                                              request.messages, **kwargs)
+            except Exception as e:
+                if self.router.should_try_next(request.route, model, e):
+                    continue
+                raise
+            self._record_call(step, request, model, (time.perf_counter() - started) * 1000, response)
+            return self._complete(step, model, response)
+    
+    def _stream_invoke(self, step: str, request: LLMRequest,
+                       processor: Optional[MermaidStreamProcessor] = None, **kwargs):
+        """
+        Stream an LLM call
+        
+        Closing the stream early drops the HTTP response, so output after the diagram
+        stops consuming tokens. A model that fails before its first chunk hands over
+        to the next one in the route.
+        
+        Args:
+            processor: Optional processor fed each chunk; the stream is closed once it
+                has the whole diagram (closing fence or size limit)
+        
+        Returns:
+            The merged message
+        """
+        for model in request.route.models:
+            started = time.perf_counter()
+            merged = None
+            stream = llm_gateway.stream(self._client_for(request.route, model), step,
+                                        request.messages, **kwargs)
+            try:
+                for chunk in stream:
+                    merged = chunk if merged is None else merged + chunk
+                    if processor is not None and chunk.content:
+                        processor.feed(chunk.content)
+                        if processor.done:
+                            metrics.incr(f'stream.{step}.stopped')
+                            break
+            except Exception as e:
+                if merged is None and self.router.should_try_next(request.route, model, e):
+                    continue
+                raise
+            finally:
+                stream.close()
             
-    def _generate_with_ai(self, prompt: str, diagram_type: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+            self._record_call(step, request, model, (time.perf_counter() - started) * 1000, merged)
+            return self._complete(step, model, merged)
+    
+    def _record_call(self, step: str, request: LLMRequest, model: str, elapsed_ms: float, response):
+        """Record a completed LLM call on the active trace and in the per-prompt and per-route metrics"""
+        spec = request.spec
+        trace = current_trace()
+        if trace is not None:
+            trace.record(step, elapsed_ms, response, model=model, prompt=spec.label, route=request.route.key)
+        usage = getattr(response, 'usage_metadata', None) or {}
+        metrics.incr(f'prompt.{spec.name}.{spec.variant}.calls')
+        metrics.incr(f'prompt.{spec.name}.{spec.variant}.prompt_tokens', usage.get('input_tokens', 0))
+        metrics.observe(f'prompt.{spec.name}.{spec.variant}.latency_ms', elapsed_ms)
+        self.router.record_call(request.route, model, elapsed_ms)
+    
+    def _complete(self, step: str, model: str, response):
+        """
+        The response, unless the model stopped at its completion token limit
+        
+        Reasoning models count their reasoning against max_tokens, so a cut-off reply
+        still looks like a normal one. It is raised as a failure so the caller falls
+        back rather than caching and saving a truncated diagram or JSON.
+        """
+        metadata = getattr(response, 'response_metadata', None) or {}
+        if metadata.get('finish_reason') == 'length':
+            metrics.incr(f'llm.{step}.length_limited')
+            raise TruncatedResponse(f"{step} output from {model} stopped at the completion token limit")
+        return response
+    
+    def _record_cache_hit(self, step: str, request: LLMRequest):
+        """Record a step served from cache on the active trace"""
+        trace = current_trace()
+        if trace is not None:
+            trace.record(step, 0.0, model=request.route.model, cached=True,
+                         prompt=request.spec.label, route=request.route.key)
+    
+    def _parse_json_response(self, content: str) -> Dict:
+        """Parse a JSON object from an LLM response, tolerating markdown code fences"""
+        content = content.strip()
+        
+        # Remove markdown code blocks if present
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0].strip()
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0].strip()
+        
+        return json.loads(content)
+    
+    def _fused_request(self, prompt: str, diagram_type: str) -> LLMRequest:
+        """Build the fused-mode cache key, messages, prompt and route"""
+        spec = self.prompts.fused_for_diagram(diagram_type)
+        route = self.router.route('fused', diagram_type)
+        
+        cache_key = make_cache_key(
+            prompt=normalize_prompt(prompt),
+            diagram_type=diagram_type,
+            prompt_version=spec.label,
+            model=route.model,
+            temperature=route.temperature,
+            mode='fused',
+        )
+        user_message = f"""
+User Prompt: "{prompt}"
+Selected Diagram Type: {diagram_type}
+
+Return the JSON object now.
+"""
+        return LLMRequest(cache_key, [
+            SystemMessage(spec.text),
+            HumanMessage(user_message)
+        ], spec, route)
+    
+    def _parse_fused_response(self, content: str) -> str:
+        """Extract, clean and fix the Mermaid code from a fused-mode JSON response"""
+        result = self._parse_json_response(content)
+        mermaid_code = (result.get('mermaid_code') or '').strip()
+        if not mermaid_code:
+            raise ValueError("Fused response did not contain mermaid_code")
+        
+        logger.info(f"Fused analysis: {result.get('diagram_type')} (confidence: {result.get('confidence')})")
+        
+        return self._clean_and_fix(mermaid_code)
+    
+    def _generate_fused(self, prompt: str, diagram_type: str,
+                        explicit_type: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Generate Mermaid code with a SINGLE structured-output call that returns both
+        the analysis fields and the diagram for the user-selected type
+        
+        Returns:
+            Tuple[Optional[str], Optional[str], Optional[str]]: (mermaid_code, error_message, detected_diagram_type)
+        """
+        try:
+            request = self._fused_request(prompt, diagram_type)
+            cached = generation_cache.get(request.cache_key) if EnvConfig.LLM_CACHE_ENABLED else None
+            if cached:
+                logger.info(f"Fused generation cache hit for {diagram_type} diagram")
+                self._record_cache_hit('fused', request)
+                return cached, None, diagram_type
+            
+            logger.info(f"Fused generation: analyzing and generating {diagram_type} diagram in one call")
+            response = self._invoke('fused', request, response_format={'type': 'json_object'})
+            mermaid_code = self._parse_fused_response(response.content)
+            
+            if EnvConfig.LLM_CACHE_ENABLED:
+                generation_cache.set(request.cache_key, mermaid_code)
+            
+            return mermaid_code, None, diagram_type
+            
+        except Exception as e:
+            logger.error(f"Fused generation failed, falling back to two-step: {e}")
+            metrics.incr('ab.fused.fallback_two_step')
+            self._mark_fused_fallback()
+            return self._generate_with_ai(prompt, diagram_type, explicit_type)
+            
+    def _generate_with_ai(self, prompt: str, diagram_type: str,
+                          explicit_type: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """
         Generate Mermaid code using TWO-STEP AI approach:
         Step 1: Analyze and enhance user prompt
@@ -114,78 +442,201 @@ class MermaidService:
         """
         try:
             # STEP 1: Analyze user prompt to understand intent and enhance it
-            logger.info(f"Step 1: Analyzing user prompt for diagram type: {diagram_type}")
-            analysis = self._analyze_prompt(prompt, diagram_type)
-            
-            detected_type = None
-            if not analysis:
-                logger.warning("Analysis failed, using original prompt")
-                enhanced_prompt = prompt
-                final_diagram_type = diagram_type
-            else:
-                enhanced_prompt = analysis.get('enhanced_prompt', prompt)
-                detected_type = analysis.get('diagram_type', diagram_type)
-                
-                # Use analyzed diagram type if confidence is high
-                if analysis.get('confidence', 0) > 0.7:
-                    final_diagram_type = detected_type
-                else:
-                    final_diagram_type = diagram_type
-                
-                logger.info(f"Analysis complete. Final diagram type: {final_diagram_type}")
-                logger.info(f"Enhanced prompt: {enhanced_prompt[:100]}...")
+            # (skipped when the local classifier is already confident about the type)
+            analysis = self._classify_locally(prompt)
+            if analysis is None:
+                logger.info(f"Step 1: Analyzing user prompt for diagram type: {diagram_type}")
+                analysis = self._analyze_prompt(prompt, diagram_type)
+            
+            enhanced_prompt, final_diagram_type, detected_type = self._apply_analysis(analysis, prompt, diagram_type, explicit_type)
             
             # STEP 2: Generate diagram using specialized prompt
             logger.info(f"Step 2: Generating Mermaid code with specialized prompt")
             mermaid_code = self._generate_with_specialized_prompt(enhanced_prompt, final_diagram_type)
             
-            if not mermaid_code:
-                logger.error("Failed to generate with specialized prompt, using fallback")
-                code, error = self._generate_fallback(prompt, diagram_type)
-                return code, error, detected_type
+            return self._finalize_generation(mermaid_code, prompt, diagram_type, final_diagram_type, detected_type)
             
-            # Clean and fix syntax errors
-            mermaid_code = self._clean_ai_response(mermaid_code)
-            mermaid_code = self._fix_syntax_errors(mermaid_code)
+        except Exception as e:
+            logger.error(f"AI generation failed: {e}")
+            code, error = self._generate_fallback(prompt, diagram_type)
+            return code, error, None
+    
+    def _apply_analysis(self, analysis: Optional[Dict], prompt: str, diagram_type: str,
+                        explicit_type: bool = False) -> Tuple[str, str, Optional[str]]:
+        """
+        Decide the enhanced prompt and final diagram type from a step 1 analysis
+        
+        Args:
+            explicit_type (bool): True when the user picked the diagram type; the analysis
+                then only enhances the prompt and never changes the type
+        
+        Returns:
+            Tuple[str, str, Optional[str]]: (enhanced_prompt, final_diagram_type, detected_diagram_type)
+        """
+        if not analysis:
+            logger.warning("Analysis failed, using original prompt")
+            return prompt, diagram_type, None
+        
+        enhanced_prompt = analysis.get('enhanced_prompt', prompt)
+        if explicit_type:
+            logger.info(f"Keeping the user's diagram type: {diagram_type}")
+            return enhanced_prompt, diagram_type, None
+        detected_type = analysis.get('diagram_type', diagram_type)
+        
+        # Use analyzed diagram type if confidence is high
+        if analysis.get('confidence', 0) > 0.7:
+            final_diagram_type = detected_type
+        else:
+            final_diagram_type = diagram_type
+        
+        logger.info(f"Analysis complete. Final diagram type: {final_diagram_type}")
+        logger.info(f"Enhanced prompt: {enhanced_prompt[:100]}...")
+        return enhanced_prompt, final_diagram_type, detected_type
+    
+    def _finalize_generation(self, mermaid_code: Optional[str], prompt: str, diagram_type: str,
+                             final_diagram_type: str, detected_type: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Return step 2 output (already cleaned and fixed), or fall back when generation produced nothing"""
+        if not mermaid_code:
+            logger.error("Failed to generate with specialized prompt, using fallback")
+            code, error = self._generate_fallback(prompt, diagram_type)
+            return code, error, detected_type
+        
+        logger.info(f"Successfully generated Mermaid code for {final_diagram_type} diagram")
+        return mermaid_code, None, final_diagram_type
+    
+    def _generate_speculative(self, prompt: str, diagram_type: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Run step 1 and step 2 concurrently for a user-selected diagram type
+        
+        Step 2 starts immediately with the raw prompt. The user picked the type, so the
+        analysis can't change it and the speculative result is kept; the enhanced prompt
+        is only used if the speculative call fails.
+        
+        Returns:
+            Tuple[Optional[str], Optional[str], Optional[str]]: (mermaid_code, error_message, detected_diagram_type)
+        """
+        try:
+            # A confident local classification makes step 1 free - nothing to overlap
+            analysis = self._classify_locally(prompt)
+            if analysis is not None:
+                metrics.incr('speculation.skipped_local')
+                enhanced_prompt, final_diagram_type, detected_type = self._apply_analysis(analysis, prompt, diagram_type, explicit_type=True)
+                mermaid_code = self._generate_with_specialized_prompt(enhanced_prompt, final_diagram_type)
+                return self._finalize_generation(mermaid_code, prompt, diagram_type, final_diagram_type, detected_type)
+            
+            logger.info(f"Speculative: analyzing and generating {diagram_type} diagram in parallel")
+            analysis_future = _speculation_executor.submit(
+                contextvars.copy_context().run, self._analyze_prompt, prompt, diagram_type
+            )
+            speculative_future = _speculation_executor.submit(
+                contextvars.copy_context().run, self._generate_with_specialized_prompt, prompt, diagram_type
+            )
+            
+            analysis = analysis_future.result()
+            enhanced_prompt, final_diagram_type, detected_type = self._apply_analysis(analysis, prompt, diagram_type, explicit_type=True)
+            
+            mermaid_code = speculative_future.result()
+            if not mermaid_code:
+                metrics.incr('speculation.failed')
+                logger.warning("Speculative generation failed, retrying with enhanced prompt")
+                mermaid_code = self._generate_with_specialized_prompt(enhanced_prompt, final_diagram_type)
+            else:
+                metrics.incr('speculation.won')
             
-            logger.info(f"Successfully generated Mermaid code for {final_diagram_type} diagram")
-            return mermaid_code, None, final_diagram_type
+            return self._finalize_generation(mermaid_code, prompt, diagram_type, final_diagram_type, detected_type)
             
         except Exception as e:
-            logger.error(f"AI generation failed: {e}")
+            logger.error(f"Speculative generation failed: {e}")
             code, error = self._generate_fallback(prompt, diagram_type)
             return code, error, None
     
-    def _analyze_prompt(self, prompt: str, diagram_type: str) -> Optional[Dict]:
+    def _classify_locally(self, prompt: str) -> Optional[Dict]:
         """
-        STEP 1: Analyze user prompt to understand requirements
-        Returns analysis with enhanced prompt
+        Fast path for step 1: use the locally trained classifier instead of the LLM analyzer
+        
+        Returns:
+            Optional[Dict]: Analysis-shaped dict when the classifier is confident, else None
         """
+        from django.conf import settings
+        
+        if not settings.INTENT_CLASSIFIER_ENABLED:
+            return None
+        
         try:
-            user_message = f"""
+            detected_type, confidence = get_intent_classifier().classify(prompt)
+        except Exception as e:
+            logger.error(f"Local intent classification failed: {e}")
+            return None
+        
+        if detected_type is None:
+            metrics.incr('intent.deferred_to_llm')
+            return None
+        
+        metrics.incr('intent.local_hit')
+        logger.info(f"Local classifier: {detected_type} (confidence: {confidence:.2f}), skipping LLM analyzer")
+        return {
+            'diagram_type': detected_type,
+            'confidence': confidence,
+            'enhanced_prompt': prompt,
+            'entities': [],
+            'source': 'local_classifier',
+        }
+    
+    def _analysis_request(self, prompt: str, diagram_type: str) -> LLMRequest:
+        """
+        Build the step 1 cache key and messages
+        
+        Step 1 output depends only on the prompt, the suggested type and the analyzer
+        route's settings, so it is reused across retries and re-renders of the same request.
+        
+        Returns:
+            LLMRequest: Cache key, messages, prompt and route
+        """
+        spec = self.prompts.get('analyzer')
+        route = self.router.route('analyzer')
+        cache_key = make_cache_key(
+            prompt=normalize_prompt(prompt),
+            suggested_type=diagram_type,
+            prompt_version=spec.label,
+            model=route.model,
+            temperature=route.temperature,
+            max_tokens=route.max_tokens,
+        )
+        user_message = f"""
 User Prompt: "{prompt}"
 Suggested Diagram Type: {diagram_type}
 
 Analyze this prompt and return the JSON response.
 """
+        return LLMRequest(cache_key, [
+            SystemMessage(spec.text),
+            HumanMessage(user_message)
+        ], spec, route)
+    
+    def _analyze_prompt(self, prompt: str, diagram_type: str) -> Optional[Dict]:
+        """
+        STEP 1: Analyze user prompt to understand requirements
+        Returns analysis with enhanced prompt
+        """
+        try:
+            request = self._analysis_request(prompt, diagram_type)
+            if EnvConfig.LLM_CACHE_ENABLED:
+                cached = analysis_cache.get(request.cache_key)
+                if cached:
+                    analysis = json.loads(cached)
+                    self._record_cache_hit('analyzer', request)
+                    logger.info(f"Analysis cache hit: {analysis.get('diagram_type')} (confidence: {analysis.get('confidence')})")
+                    return analysis
             
-            response = self.groq_client.invoke([
-                SystemMessage(ANALYZER_PROMPT),
-                HumanMessage(user_message)
-            ])
+            response = self._invoke('analyzer', request)
             
             # Parse JSON response
-            content = response.content.strip()
-            
-            # Remove markdown code blocks if present
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0].strip()
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0].strip()
-            
-            analysis = json.loads(content)
+            analysis = self._parse_json_response(response.content)
             logger.info(f"Prompt analysis successful: {analysis.get('diagram_type')} (confidence: {analysis.get('confidence')})")
             
+            if isinstance(analysis, dict) and EnvConfig.LLM_CACHE_ENABLED:
+                analysis_cache.set(request.cache_key, json.dumps(analysis))
+            
             return analysis
             
         except json.JSONDecodeError as e:
@@ -195,227 +646,689 @@ Analyze this prompt and return the JSON response.
             logger.error(f"Prompt analysis failed: {e}")
             return None
     
-    def _generate_with_specialized_prompt(self, prompt: str, diagram_type: str) -> Optional[str]:
+    def _generation_request(self, prompt: str, diagram_type: str) -> LLMRequest:
         """
-        STEP 2: Generate diagram using specialized system prompt for the diagram type
+        Build the step 2 request for the diagram type's specialized prompt
+        
+        Returns:
+            LLMRequest: Cache key, messages, prompt and route
         """
-        try:
-            # Get the specialized prompt for this diagram type
-            system_prompt = self.prompt_map.get(diagram_type)
-            
-            if not system_prompt:
-                logger.warning(f"No specialized prompt for {diagram_type}, using generic approach")
-                system_prompt = FLOWCHART_PROMPT  # Default fallback
-            
-            user_message = f"""
+        # Specialized prompt for this diagram type (flowchart prompt if there is none)
+        spec = self.prompts.for_diagram(diagram_type)
+        route = self.router.route('generator', diagram_type)
+        
+        # Identical requests produce interchangeable output, so serve them from cache
+        cache_key = make_cache_key(
+            prompt=normalize_prompt(prompt),
+            diagram_type=diagram_type,
+            prompt_version=spec.label,
+            model=route.model,
+            temperature=route.temperature,
+        )
+        user_message = f"""
 User Request: {prompt}
 
 Generate the {diagram_type} diagram now.
 """
+        return LLMRequest(cache_key, [
+            SystemMessage(spec.text),
+            HumanMessage(user_message)
+        ], spec, route)
+    
+    def _generate_with_specialized_prompt(self, prompt: str, diagram_type: str) -> Optional[str]:
+        """
+        STEP 2: Generate diagram using specialized system prompt for the diagram type
+        
+        Streamed when a browser is watching the session's channel.
+        """
+        try:
+            request = self._generation_request(prompt, diagram_type)
+            if EnvConfig.LLM_CACHE_ENABLED:
+                cached = generation_cache.get(request.cache_key)
+                if cached:
+                    logger.info(f"Generation cache hit for {diagram_type} diagram")
+                    self._record_cache_hit('generator', request)
+                    return self._clean_and_fix(cached)
             
-            response = self.groq_client.invoke([
-                SystemMessage(system_prompt),
-                HumanMessage(user_message)
-            ])
+            channel = current_channel()
+            if channel is not None:
+                # Fixed line by line as it streams; a browser watching the channel gets each new line
+                processor = self._stream_processor(channel)
+                response = self._stream_invoke('generator', request, processor)
+                mermaid_code = self._finish_stream(processor)
+            else:
+                response = self._invoke('generator', request)
+                mermaid_code = self._clean_and_fix(response.content.strip())
             
-            mermaid_code = response.content.strip()
             logger.info(f"Generated Mermaid code using specialized {diagram_type} prompt")
             
+            raw = response.content.strip()
+            if raw and EnvConfig.LLM_CACHE_ENABLED:
+                generation_cache.set(request.cache_key, raw)
+            
             return mermaid_code
             
         except Exception as e:
             logger.error(f"Specialized prompt generation failed: {e}")
             return None
             
-    def _clean_ai_response(self, response: str) -> str:
-        """Clean AI response to extract only Mermaid code"""
-        # Remove code blocks if present
-        if "```mermaid" in response:
-            start = response.find("```mermaid") + 10
-            end = response.find("```", start)
-            if end != -1:
-                response = response[start:end].strip()
-        elif "```" in response:
-            start = response.find("```") + 3
-            end = response.rfind("```")
-            if end != -1 and end > start:
-                response = response[start:end].strip()
-        
-        return response.strip()
-    
-    def _fix_syntax_errors(self, mermaid_code: str) -> str:
+    def refine_mermaid_code(self, mermaid_code: str, instruction: str,
+                            diagram_type: str = 'flowchart') -> Tuple[Optional[str], Optional[str]]:
         """
-        Fix common Mermaid syntax errors
-        
-        This method fixes:
-        1. Emojis in node IDs (moves them to labels only)
-        2. ER diagram attribute syntax (type name PK/FK format)
-        3. ER diagram invalid relationship cardinality
-        4. Reserved keywords as node IDs (adds 'Node' suffix)
-        5. Class diagram tilde syntax for generics
-        6. Removes unsupported styling directives
-        """
-        import re
-        
-        mermaid_code = re.sub(r'(\w+)~([^~]+)~', r'\1<\2>', mermaid_code)
-        
-        # Fix emojis in node IDs (move them to labels)
-        # Pattern: emoji[label] should become nodeId[emoji label]
-        def fix_emoji_nodes(match):
-            full_match = match.group(0)
-            emoji_part = match.group(1)
-            label_part = match.group(2)
-            
-            # Generate a clean node ID from the label
-            clean_id = re.sub(r'[^a-zA-Z0-9_]', '', label_part)
-            if not clean_id:
-                clean_id = f"Node{hash(emoji_part) % 10000}"
-            
-            # Return the corrected format: nodeId[emoji label]
-            return f"{clean_id}[{emoji_part} {label_part}]"
-        
-        # Match patterns like: 🧑‍🎓[Student] or 🏢[Admin]
-        mermaid_code = re.sub(r'([^\w\s\[\]]+)\[([^\]]+)\]', fix_emoji_nodes, mermaid_code)
-        
-        # Fix ER Diagram attribute syntax
-        # Incorrect: PK attributeName or FK attributeName
-        # Correct: type attributeName PK or type attributeName FK
-        def fix_er_attribute(match):
-            indent = match.group(1)
-            key_type = match.group(2)  # PK or FK
-            attr_name = match.group(3)
-            
-            # Default to string type, append key constraint
-            return f"{indent}string {attr_name} {key_type}"
-        
-        # Match patterns like: "        PK bookId" or "        FK authorId"
-        mermaid_code = re.sub(
-            r'^(\s+)(PK|FK)\s+(\w+)\s*$',
-            fix_er_attribute,
-            mermaid_code,
-            flags=re.MULTILINE
-        )
+        Edit an existing diagram according to a short instruction
+        
+        Only the current code and the instruction are sent, with the small 'refine'
+        system prompt and no analyzer step, so an edit costs one short call instead
+        of a full regeneration. There is no offline fallback: a failed edit leaves
+        the original diagram as it is.
         
-        # Also fix patterns like "        PK bookId string" (reversed order)
-        def fix_er_attribute_reversed(match):
-            indent = match.group(1)
-            key_type = match.group(2)  # PK or FK
-            attr_name = match.group(3)
-            attr_type = match.group(4)
+        Args:
+            mermaid_code (str): Current Mermaid code
+            instruction (str): Requested change, e.g. "add a logout step after dashboard"
+            diagram_type (str): Type of the current diagram
+            
+        Returns:
+            Tuple[Optional[str], Optional[str]]: (mermaid_code, error_message)
+        """
+        try:
+            if not instruction.strip():
+                return None, "Refinement instruction cannot be empty"
+            if not mermaid_code or not mermaid_code.strip():
+                return None, "There is no diagram to refine"
+            if not self.groq_client or llm_breaker.state == llm_breaker.OPEN:
+                return None, AppConstants.MESSAGES['ERROR']['API_ERROR']
+            
+            with generation_trace() as trace, request_deadline():
+                trace.mode = 'refine'
+                result = self._refine(mermaid_code, instruction, diagram_type)
+                result = (self._canonicalize(self._validate_and_repair(result[0], diagram_type)), result[1])
+                self._record_mode_metrics('refine', result[0], trace)
+            return result
             
-            return f"{indent}{attr_type} {attr_name} {key_type}"
+        except Exception as e:
+            error_msg = f"Error refining Mermaid code: {str(e)}"
+            logger.error(error_msg)
+            return None, error_msg
+    
+    def _refine_request(self, mermaid_code: str, instruction: str, diagram_type: str) -> LLMRequest:
+        """Build the refine-step cache key, messages, prompt and route"""
+        spec = self.prompts.get('refine')
+        route = self.router.route('refine', diagram_type)
         
-        mermaid_code = re.sub(
-            r'^(\s+)(PK|FK)\s+(\w+)\s+(\w+)\s*$',
-            fix_er_attribute_reversed,
-            mermaid_code,
-            flags=re.MULTILINE
+        cache_key = make_cache_key(
+            code=mermaid_code.strip(),
+            instruction=normalize_prompt(instruction),
+            diagram_type=diagram_type,
+            prompt_version=spec.label,
+            model=route.model,
+            temperature=route.temperature,
+            mode='refine',
         )
+        user_message = f"""
+Current {diagram_type} diagram:
+```mermaid
+{mermaid_code.strip()}
+```
+Requested change: {instruction.strip()}
+
+Return the updated diagram now.
+"""
+        return LLMRequest(cache_key, [
+            SystemMessage(spec.text),
+            HumanMessage(user_message)
+        ], spec, route)
+    
+    def _refine(self, mermaid_code: str, instruction: str, diagram_type: str) -> Tuple[Optional[str], Optional[str]]:
+        """Run the refine call (from cache when possible), then clean, fix and check the result"""
+        request = self._refine_request(mermaid_code, instruction, diagram_type)
+        cached = generation_cache.get(request.cache_key) if EnvConfig.LLM_CACHE_ENABLED else None
+        if cached:
+            logger.info(f"Refine cache hit for {diagram_type} diagram")
+            self._record_cache_hit('refine', request)
+            return cached, None
         
-        # Fix composite keys: int book_id PK FK -> int book_id PK (remove duplicate constraints)
-        # Mermaid doesn't support multiple constraints on one attribute
-        mermaid_code = re.sub(
-            r'(\s+\w+\s+\w+)\s+(PK|FK)\s+(PK|FK)',
-            r'\1 \2',  # Keep only first constraint
-            mermaid_code
-        )
+        channel = current_channel()
+        if channel is not None:
+            processor = self._stream_processor(channel)
+            self._stream_invoke('refine', request, processor=processor)
+            refined = self._finish_stream(processor)
+        else:
+            refined = self._clean_and_fix(self._invoke('refine', request).content.strip())
+        refined, error = self._finalize_refinement(refined)
+        if refined and EnvConfig.LLM_CACHE_ENABLED:
+            generation_cache.set(request.cache_key, refined)
+        return refined, error
+    
+    def _finalize_refinement(self, refined: str) -> Tuple[Optional[str], Optional[str]]:
+        """Check a cleaned and fixed refine response; an edit that broke the diagram is an error, not a result"""
+        if not self._looks_valid(refined):
+            logger.error("Refinement did not return a valid diagram")
+            return None, "The requested change did not produce a valid diagram. Please rephrase it."
+        logger.info("Refined Mermaid code")
+        return refined, None
+    
+    def _validate_and_repair(self, mermaid_code: Optional[str], diagram_type: str) -> Optional[str]:
+        """
+        Validate the final diagram locally and send only its rejected lines for repair
         
-        # Fix ER Diagram invalid relationship syntax
-        # Valid Mermaid ER relationships: ||--||, ||--o{, }o--||, }|--||, ||--|{, }o--o|, etc.
-        # Invalid patterns like }o--o{ need to be fixed
-        # Replace invalid combinations with valid ones
-        er_relationship_fixes = {
-            r'\}o--o\{': '}o--o|',  # many-to-optional-many -> many-to-optional-one
-            r'\}\|--\|\{': '}|--|{',  # Fix malformed many-to-many
-        }
+        Returns:
+            Optional[str]: The repaired code, or the code as it was when it is valid, of a type
+            the validator doesn't cover, past line-level repair, or the repair didn't help
+        """
+        mermaid_code, request, result = self._repair_plan(mermaid_code, diagram_type)
+        if request is None:
+            return mermaid_code
+        try:
+            content = generation_cache.get(request.cache_key) if EnvConfig.LLM_CACHE_ENABLED else None
+            if content:
+                self._record_cache_hit('repair', request)
+            else:
+                content = self._invoke('repair', request, response_format={'type': 'json_object'}).content
+                if EnvConfig.LLM_CACHE_ENABLED:
+                    generation_cache.set(request.cache_key, content)
+        except Exception as e:
+            logger.error(f"Line repair failed: {e}")
+            metrics.incr('repair.failed')
+            return mermaid_code
+        return self._apply_repairs(mermaid_code, result, content)
+    
+    def _validate(self, mermaid_code: str) -> ValidationResult:
+        """Validate Mermaid code, timing it as the 'validator' step on the active trace"""
+        started = time.perf_counter()
+        result = validate_mermaid(mermaid_code)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        trace = current_trace()
+        if trace is not None:
+            trace.record('validator', elapsed_ms, errors=len(result.errors))
+        if not result.supported:
+            metrics.incr('validator.unsupported')
+        else:
+            metrics.incr(f"validator.{result.diagram_type}.{'valid' if result.valid else 'invalid'}")
+            metrics.incr('validator.errors', len(result.errors))
+        metrics.observe('validator.latency_ms', elapsed_ms)
+        return result
+    
+    def _repair_plan(self, mermaid_code: Optional[str],
+                     diagram_type: str) -> Tuple[Optional[str], Optional[LLMRequest], Optional[ValidationResult]]:
+        """
+        Local part of validate-and-repair: validate, close blocks left open, and decide on an LLM repair
         
-        for invalid_pattern, valid_replacement in er_relationship_fixes.items():
-            mermaid_code = re.sub(invalid_pattern, valid_replacement, mermaid_code)
+        Returns:
+            Tuple: (mermaid_code, repair request or None when no call is worth making, validation result)
+        """
+        if not mermaid_code:
+            return mermaid_code, None, None
+        result = self._validate(mermaid_code)
+        if result.closers:
+            # An unclosed subgraph/block/alt at the end only needs its closing lines
+            depth = len(result.closers)
+            closed = mermaid_code + '\n' + '\n'.join(
+                '    ' * (depth - i) + closer for i, closer in enumerate(result.closers))
+            closed_result = validate_mermaid(closed)
+            if len(closed_result.errors) < len(result.errors):
+                metrics.incr('repair.blocks_closed', depth)
+                mermaid_code, result = closed, closed_result
         
-        # Fix Class Diagram relationship multiplicity syntax
-        # Incorrect: Order "*--" ShoppingCart or Customer "1" --> "*" Order
-        # Correct: Order "1" *-- "1" ShoppingCart or Customer "1" --> "0..*" Order
+        if result.valid or not result.supported:
+            return mermaid_code, None, result
+        if not EnvConfig.MERMAID_REPAIR_ENABLED or not self.groq_client or llm_breaker.state == llm_breaker.OPEN:
+            return mermaid_code, None, result
+        if len(result.errors) > AppConstants.REPAIR_MAX_LINES:
+            logger.warning(f"{len(result.errors)} invalid lines is past line-level repair, leaving the diagram as is")
+            metrics.incr('repair.skipped_too_many')
+            return mermaid_code, None, result
+        metrics.incr('repair.attempted')
+        return mermaid_code, self._repair_request(mermaid_code, result, diagram_type), result
+    
+    def _repair_request(self, mermaid_code: str, result: ValidationResult, diagram_type: str) -> LLMRequest:
+        """Build the repair request: each rejected line with the validator's message and its neighbours"""
+        spec = self.prompts.get('repair')
+        route = self.router.route('repair', diagram_type)
+        lines = mermaid_code.split('\n')
+        context = AppConstants.REPAIR_CONTEXT_LINES
         
-        # Fix missing quotes around multiplicity on LEFT side of relationship
-        # Pattern: ClassName multiplicity relationship (without quotes)
-        mermaid_code = re.sub(
-            r'(\w+)\s+(\d+|\*|0\.\.1|1\.\.\*|0\.\.\*)\s+(-->|<\|--|o--|\.\.>|\*--|\.\.)',
-            r'\1 "\2" \3',
-            mermaid_code
+        fragments = []
+        for error in result.errors:
+            neighbours = [
+                f"{n}: {lines[n - 1].strip()}"
+                for n in range(max(1, error.line - context), min(len(lines), error.line + context) + 1)
+                if n != error.line and lines[n - 1].strip()
+            ]
+            fragments.append(
+                f"Line {error.line}: {error.text.strip()}\n"
+                f"Problem: {error.message}\n"
+                f"Context:\n" + ('\n'.join(neighbours) or '(none)')
+            )
+        header = next((line.strip() for line in lines if line.strip()), '')
+        user_message = (
+            f"Diagram type: {result.diagram_type} (header: {header})\n\n"
+            + '\n\n'.join(fragments)
+            + "\n\nReturn the JSON object of fixes now.\n"
         )
-        
-        # Fix missing quotes around multiplicity on RIGHT side before second class
-        # Pattern: relationship multiplicity ClassName (without quotes)
-        mermaid_code = re.sub(
-            r'(-->|<\|--|o--|\.\.>|\*--|\.\.)\s+(\d+|\*|0\.\.1|1\.\.\*|0\.\.\*)\s+(\w+)',
-            r'\1 "\2" \3',
-            mermaid_code
+        # Keyed by the fragment, not the whole diagram: the same broken lines get the same fixes
+        cache_key = make_cache_key(
+            fragment=user_message,
+            prompt_version=spec.label,
+            model=route.model,
+            temperature=route.temperature,
+            mode='repair',
         )
+        return LLMRequest(cache_key, [
+            SystemMessage(spec.text),
+            HumanMessage(user_message)
+        ], spec, route)
+    
+    def _apply_repairs(self, mermaid_code: str, result: ValidationResult, content: str) -> str:
+        """
+        Splice repaired lines into the diagram, keeping each fix only if it reduces the errors
         
-        # Fix patterns like: Order "*--" ShoppingCart : contains
-        # Should be: Order "1" *-- "*" ShoppingCart : contains
-        # Match: ClassName "*--" ClassName (missing multiplicity on one side)
-        mermaid_code = re.sub(
-            r'(\w+)\s+"([^"]+)"\s+(\*--|o--|<\|--)\s+(\w+)',
-            r'\1 "\2" \3 "1" \4',
-            mermaid_code
-        )
+        Fixes are applied from the bottom up so the line numbers of the others still hold.
+        """
+        try:
+            fixes = self._parse_json_response(content).get('fixes') or []
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Unreadable repair response: {e}")
+            metrics.incr('repair.failed')
+            return mermaid_code
         
-        # Reverse case: ClassName *-- "*" ClassName (missing left multiplicity)
-        mermaid_code = re.sub(
-            r'(\w+)\s+(\*--|o--|<\|--)\s+"([^"]+)"\s+(\w+)',
-            r'\1 "1" \2 "\3" \4',
-            mermaid_code
-        )
+        broken = {error.line for error in result.errors}
+        fixes = [fix for fix in fixes if isinstance(fix, dict) and fix.get('line') in broken
+                 and isinstance(fix.get('code'), str)]
+        lines = mermaid_code.split('\n')
+        remaining = len(result.errors)
+        for fix in sorted(fixes, key=lambda fix: fix['line'], reverse=True):
+            index = fix['line'] - 1
+            indent = lines[index][:len(lines[index]) - len(lines[index].lstrip())]
+            replacement = [indent + line.strip() for line in fix['code'].split('\n') if line.strip()]
+            candidate = lines[:index] + replacement + lines[index + 1:]
+            errors = len(validate_mermaid('\n'.join(candidate)).errors)
+            if errors < remaining:
+                lines, remaining = candidate, errors
+                metrics.incr('repair.lines_fixed')
+            else:
+                metrics.incr('repair.lines_rejected')
         
-        # Fix reserved keywords in node IDs
-        # Mermaid reserved words that cannot be used as node IDs
-        reserved_keywords = ['end', 'start', 'subgraph', 'graph', 'classDef', 'class', 'click', 'callback', 'link', 'style']
-        
-        for keyword in reserved_keywords:
-            # Replace reserved keyword as standalone node ID: end[label] -> endNode[label]
-            mermaid_code = re.sub(
-                rf'\b{keyword}\[',
-                f'{keyword}Node[',
-                mermaid_code,
-                flags=re.IGNORECASE
-            )
-            # Also fix in connections: --> end or --> end[label]
-            mermaid_code = re.sub(
-                rf'(-->|---)\s+{keyword}(?=\[|\s|$)',
-                rf'\1 {keyword}Node',
-                mermaid_code,
-                flags=re.IGNORECASE
-            )
-            # Fix source nodes: end --> or end[label] -->
-            mermaid_code = re.sub(
-                rf'\b{keyword}(?=\s*(?:-->|---))',
-                f'{keyword}Node',
-                mermaid_code,
-                flags=re.IGNORECASE
-            )
+        logger.info(f"Line repair: {len(result.errors) - remaining} of {len(result.errors)} invalid lines fixed")
+        if remaining == 0:
+            metrics.incr('repair.succeeded')
+        else:
+            metrics.incr('repair.partial' if remaining < len(result.errors) else 'repair.unrepaired')
+        return '\n'.join(lines)
+    
+    def _stream_processor(self, channel=None) -> MermaidStreamProcessor:
+        """
+        Build a processor that cleans and fixes a streamed response line by line
+
+        With a channel, the fixed diagram so far is published each time a chunk completes lines.
+        """
+        def publish(lines):
+            channel.publish_partial(processor.code)
         
-        lines = mermaid_code.split('\n')
-        clean_lines = []
+        processor = MermaidStreamProcessor(syntax_fixer, EnvConfig.MERMAID_MAX_CHARS, EnvConfig.MERMAID_MAX_LINES,
+                                           on_lines=publish if channel is not None else None)
+        return processor
+    
+    def _finish_stream(self, processor: MermaidStreamProcessor) -> str:
+        """Flush a streamed response's processor, logged and timed like _clean_and_fix"""
+        mermaid_code = processor.finish()
+        if processor.truncated:
+            logger.warning(f"Truncated streamed LLM output at {len(mermaid_code)} characters")
+            metrics.incr('fixer.truncated')
+        if processor.hits:
+            applied = ', '.join(f"{name} x{count}" for name, count in processor.hits.items())
+            logger.info(f"Applied syntax fixes to Mermaid code: {applied}")
+        trace = current_trace()
+        if trace is not None:
+            trace.record('fixer', processor.elapsed_ms, streamed=True)
+        return mermaid_code
+    
+    async def agenerate_mermaid_code(self, prompt: str, diagram_type: str = 'flowchart',
+                                     mode: Optional[str] = None,
+                                     explicit_type: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Async counterpart of generate_mermaid_code for ASGI deployments
+        
+        LLM calls use the client's native async API, so a generation waiting on the
+        network holds no thread. Cache lookups touch the database and go through
+        sync_to_async.
+        
+        Returns:
+            Tuple[Optional[str], Optional[str], Optional[str]]: (mermaid_code, error_message, detected_diagram_type)
+        """
+        try:
+            if not prompt.strip():
+                return None, "Prompt cannot be empty", None
+            
+            if self.groq_client and llm_breaker.state != llm_breaker.OPEN:
+                mode = self._resolve_mode(mode)
+                if mode == 'speculative' and not explicit_type:
+                    # Without a picked type there is nothing to speculate on, so this is a two-step run
+                    mode = 'two_step'
+                with generation_trace() as trace, request_deadline():
+                    trace.mode = mode
+                    if mode == 'fused':
+                        result = await self._agenerate_fused(prompt, diagram_type, explicit_type)
+                    elif mode == 'speculative':
+                        result = await self._agenerate_speculative(prompt, diagram_type)
+                    else:
+                        result = await self._agenerate_with_ai(prompt, diagram_type, explicit_type)
+                    result = (self._canonicalize(await self._avalidate_and_repair(result[0], result[2] or diagram_type)),
+                              *result[1:])
+                    self._record_mode_metrics(trace.mode, result[0], trace)
+                return result
+            else:
+                # Fallback to templates
+                code, error = self._generate_fallback(prompt, diagram_type)
+                return code, error, None
+            
+        except Exception as e:
+            error_msg = f"Error generating Mermaid code: {str(e)}"
+            logger.error(error_msg)
+            return None, error_msg, None
+    
+    async def _ainvoke(self, step: str, request: LLMRequest, **kwargs):
+        """Async _invoke - cancelling the awaiting task aborts the HTTP request"""
+        for model in request.route.models:
+            started = time.perf_counter()
+            try:
+                response = await llm_gateway.ainvoke(self._client_for(request.route, model), step,
+                                                     request.messages, **kwargs)
+            except Exception as e:
+                if self.router.should_try_next(request.route, model, e):
+                    continue
+                raise
+            self._record_call(step, request, model, (time.perf_counter() - started) * 1000, response)
+            return self._complete(step, model, response)
+    
+    async def _astream_invoke(self, step: str, request: LLMRequest,
+                              processor: Optional[MermaidStreamProcessor] = None, **kwargs):
+        """Async _stream_invoke; cancellation is task cancellation, so no event is needed"""
+        for model in request.route.models:
+            started = time.perf_counter()
+            merged = None
+            stream = llm_gateway.astream(self._client_for(request.route, model), step,
+                                         request.messages, **kwargs)
+            try:
+                async for chunk in stream:
+                    merged = chunk if merged is None else merged + chunk
+                    if processor is not None and chunk.content:
+                        processor.feed(chunk.content)
+                        if processor.done:
+                            metrics.incr(f'stream.{step}.stopped')
+                            break
+            except Exception as e:
+                if merged is None and self.router.should_try_next(request.route, model, e):
+                    continue
+                raise
+            finally:
+                await stream.aclose()
+            
+            self._record_call(step, request, model, (time.perf_counter() - started) * 1000, merged)
+            return self._complete(step, model, merged)
+    
+    async def _acache_get(self, cache, key: str) -> Optional[str]:
+        """Read an LLM cache without blocking the event loop"""
+        if not EnvConfig.LLM_CACHE_ENABLED:
+            return None
+        return await sync_to_async(cache.get)(key)
+    
+    async def _acache_set(self, cache, key: str, value: str):
+        """Write an LLM cache without blocking the event loop"""
+        if EnvConfig.LLM_CACHE_ENABLED:
+            await sync_to_async(cache.set)(key, value)
+    
+    async def _agenerate_fused(self, prompt: str, diagram_type: str,
+                               explicit_type: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Async _generate_fused"""
+        try:
+            request = self._fused_request(prompt, diagram_type)
+            cached = await self._acache_get(generation_cache, request.cache_key)
+            if cached:
+                logger.info(f"Fused generation cache hit for {diagram_type} diagram")
+                self._record_cache_hit('fused', request)
+                return cached, None, diagram_type
+            
+            logger.info(f"Fused generation: analyzing and generating {diagram_type} diagram in one call")
+            response = await self._ainvoke('fused', request, response_format={'type': 'json_object'})
+            mermaid_code = self._parse_fused_response(response.content)
+            await self._acache_set(generation_cache, request.cache_key, mermaid_code)
+            
+            return mermaid_code, None, diagram_type
+            
+        except Exception as e:
+            logger.error(f"Fused generation failed, falling back to two-step: {e}")
+            metrics.incr('ab.fused.fallback_two_step')
+            self._mark_fused_fallback()
+            return await self._agenerate_with_ai(prompt, diagram_type, explicit_type)
+    
+    async def _agenerate_with_ai(self, prompt: str, diagram_type: str,
+                                 explicit_type: bool = False) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Async _generate_with_ai"""
+        try:
+            analysis = self._classify_locally(prompt)
+            if analysis is None:
+                logger.info(f"Step 1: Analyzing user prompt for diagram type: {diagram_type}")
+                analysis = await self._aanalyze_prompt(prompt, diagram_type)
+            
+            enhanced_prompt, final_diagram_type, detected_type = self._apply_analysis(analysis, prompt, diagram_type, explicit_type)
+            
+            logger.info(f"Step 2: Generating Mermaid code with specialized prompt")
+            mermaid_code = await self._agenerate_with_specialized_prompt(enhanced_prompt, final_diagram_type)
+            
+            return self._finalize_generation(mermaid_code, prompt, diagram_type, final_diagram_type, detected_type)
+            
+        except Exception as e:
+            logger.error(f"AI generation failed: {e}")
+            code, error = self._generate_fallback(prompt, diagram_type)
+            return code, error, None
+    
+    async def _agenerate_speculative(self, prompt: str, diagram_type: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Async _generate_speculative - both steps run as tasks on the event loop
         
-        for line in lines:
-            stripped = line.strip()
+        If the analysis raises, the speculative task is cancelled with Task.cancel(),
+        which aborts its in-flight request.
+        """
+        try:
+            analysis = self._classify_locally(prompt)
+            if analysis is not None:
+                metrics.incr('speculation.skipped_local')
+                enhanced_prompt, final_diagram_type, detected_type = self._apply_analysis(analysis, prompt, diagram_type, explicit_type=True)
+                mermaid_code = await self._agenerate_with_specialized_prompt(enhanced_prompt, final_diagram_type)
+                return self._finalize_generation(mermaid_code, prompt, diagram_type, final_diagram_type, detected_type)
+            
+            logger.info(f"Speculative: analyzing and generating {diagram_type} diagram in parallel")
+            speculative_task = asyncio.create_task(
+                self._agenerate_with_specialized_prompt(prompt, diagram_type)
+            )
+            try:
+                analysis = await self._aanalyze_prompt(prompt, diagram_type)
+            except BaseException:
+                speculative_task.cancel()
+                raise
+            enhanced_prompt, final_diagram_type, detected_type = self._apply_analysis(analysis, prompt, diagram_type, explicit_type=True)
+            
+            mermaid_code = await speculative_task
+            if not mermaid_code:
+                metrics.incr('speculation.failed')
+                logger.warning("Speculative generation failed, retrying with enhanced prompt")
+                mermaid_code = await self._agenerate_with_specialized_prompt(enhanced_prompt, final_diagram_type)
+            else:
+                metrics.incr('speculation.won')
+            
+            return self._finalize_generation(mermaid_code, prompt, diagram_type, final_diagram_type, detected_type)
+            
+        except Exception as e:
+            logger.error(f"Speculative generation failed: {e}")
+            code, error = self._generate_fallback(prompt, diagram_type)
+            return code, error, None
+    
+    async def _aanalyze_prompt(self, prompt: str, diagram_type: str) -> Optional[Dict]:
+        """Async _analyze_prompt"""
+        try:
+            request = self._analysis_request(prompt, diagram_type)
+            cached = await self._acache_get(analysis_cache, request.cache_key)
+            if cached:
+                analysis = json.loads(cached)
+                self._record_cache_hit('analyzer', request)
+                logger.info(f"Analysis cache hit: {analysis.get('diagram_type')} (confidence: {analysis.get('confidence')})")
+                return analysis
+            
+            response = await self._ainvoke('analyzer', request)
+            analysis = self._parse_json_response(response.content)
+            logger.info(f"Prompt analysis successful: {analysis.get('diagram_type')} (confidence: {analysis.get('confidence')})")
+            
+            if isinstance(analysis, dict):
+                await self._acache_set(analysis_cache, request.cache_key, json.dumps(analysis))
+            
+            return analysis
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse analysis JSON: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Prompt analysis failed: {e}")
+            return None
+    
+    async def _agenerate_with_specialized_prompt(self, prompt: str, diagram_type: str) -> Optional[str]:
+        """Async _generate_with_specialized_prompt; streams to the session channel when one is set"""
+        try:
+            request = self._generation_request(prompt, diagram_type)
+            cached = await self._acache_get(generation_cache, request.cache_key)
+            if cached:
+                logger.info(f"Generation cache hit for {diagram_type} diagram")
+                self._record_cache_hit('generator', request)
+                return self._clean_and_fix(cached)
             
-            if stripped.startswith('classDef '):
-                logger.debug(f"Removed classDef line: {stripped}")
-                continue
+            channel = current_channel()
+            if channel is not None:
+                processor = self._stream_processor(channel)
+                response = await self._astream_invoke('generator', request, processor)
+                mermaid_code = self._finish_stream(processor)
+            else:
+                response = await self._ainvoke('generator', request)
+                mermaid_code = self._clean_and_fix(response.content.strip())
+            
+            logger.info(f"Generated Mermaid code using specialized {diagram_type} prompt")
+            
+            raw = response.content.strip()
+            if raw:
+                await self._acache_set(generation_cache, request.cache_key, raw)
+            
+            return mermaid_code
+            
+        except Exception as e:
+            logger.error(f"Specialized prompt generation failed: {e}")
+            return None
+    
+    async def arefine_mermaid_code(self, mermaid_code: str, instruction: str,
+                                   diagram_type: str = 'flowchart') -> Tuple[Optional[str], Optional[str]]:
+        """Async refine_mermaid_code"""
+        try:
+            if not instruction.strip():
+                return None, "Refinement instruction cannot be empty"
+            if not mermaid_code or not mermaid_code.strip():
+                return None, "There is no diagram to refine"
+            if not self.groq_client or llm_breaker.state == llm_breaker.OPEN:
+                return None, AppConstants.MESSAGES['ERROR']['API_ERROR']
             
-            if stripped.startswith('class ') and '{' not in line and '--' not in line:
-                logger.debug(f"Removed class styling: {stripped}")
-                continue
+            with generation_trace() as trace, request_deadline():
+                trace.mode = 'refine'
+                result = await self._arefine(mermaid_code, instruction, diagram_type)
+                result = (self._canonicalize(await self._avalidate_and_repair(result[0], diagram_type)), result[1])
+                self._record_mode_metrics('refine', result[0], trace)
+            return result
             
-            # Keep all other lines
-            clean_lines.append(line)
+        except Exception as e:
+            error_msg = f"Error refining Mermaid code: {str(e)}"
+            logger.error(error_msg)
+            return None, error_msg
+    
+    async def _arefine(self, mermaid_code: str, instruction: str, diagram_type: str) -> Tuple[Optional[str], Optional[str]]:
+        """Async _refine"""
+        request = self._refine_request(mermaid_code, instruction, diagram_type)
+        cached = await self._acache_get(generation_cache, request.cache_key)
+        if cached:
+            logger.info(f"Refine cache hit for {diagram_type} diagram")
+            self._record_cache_hit('refine', request)
+            return cached, None
         
-        mermaid_code = '\n'.join(clean_lines)
+        channel = current_channel()
+        if channel is not None:
+            processor = self._stream_processor(channel)
+            await self._astream_invoke('refine', request, processor)
+            refined = self._finish_stream(processor)
+        else:
+            refined = self._clean_and_fix((await self._ainvoke('refine', request)).content.strip())
+        refined, error = self._finalize_refinement(refined)
+        if refined:
+            await self._acache_set(generation_cache, request.cache_key, refined)
+        return refined, error
+    
+    async def _avalidate_and_repair(self, mermaid_code: Optional[str], diagram_type: str) -> Optional[str]:
+        """Async _validate_and_repair"""
+        mermaid_code, request, result = self._repair_plan(mermaid_code, diagram_type)
+        if request is None:
+            return mermaid_code
+        try:
+            content = await self._acache_get(generation_cache, request.cache_key)
+            if content:
+                self._record_cache_hit('repair', request)
+            else:
+                content = (await self._ainvoke('repair', request, response_format={'type': 'json_object'})).content
+                await self._acache_set(generation_cache, request.cache_key, content)
+        except Exception as e:
+            logger.error(f"Line repair failed: {e}")
+            metrics.incr('repair.failed')
+            return mermaid_code
+        return self._apply_repairs(mermaid_code, result, content)
+    
+    def _clean_and_fix(self, mermaid_code: str) -> str:
+        """Clean and fix an LLM response, timing it as the 'fixer' step on the active trace"""
+        started = time.perf_counter()
+        mermaid_code = self._fix_syntax_errors(self._limit_size(self._clean_ai_response(mermaid_code)))
+        trace = current_trace()
+        if trace is not None:
+            trace.record('fixer', (time.perf_counter() - started) * 1000)
+        return mermaid_code
+    
+    def _limit_size(self, mermaid_code: str) -> str:
+        """Truncate cleaned output past MERMAID_MAX_CHARS / MERMAID_MAX_LINES before it is fixed"""
+        limited, truncated = truncate(mermaid_code, EnvConfig.MERMAID_MAX_CHARS, EnvConfig.MERMAID_MAX_LINES)
+        if truncated:
+            logger.warning(f"Truncated LLM output from {len(mermaid_code)} to {len(limited)} characters")
+            metrics.incr('fixer.truncated')
+        return limited
+    
+    def _clean_ai_response(self, response: str) -> str:
+        """Clean AI response to extract only Mermaid code"""
+        # Remove code blocks if present
+        if "```mermaid" in response:
+            start = response.find("```mermaid") + 10
+            end = response.find("```", start)
+            if end != -1:
+                response = response[start:end].strip()
+        elif "```" in response:
+            start = response.find("```") + 3
+            end = response.rfind("```")
+            if end != -1 and end > start:
+                response = response[start:end].strip()
         
-        logger.info("Applied syntax fixes to Mermaid code (removed styling, fixed emoji nodes, ER attributes, ER relationships, and reserved keywords)")
-        return mermaid_code.strip()
+        return response.strip()
+    
+    def _fix_syntax_errors(self, mermaid_code: str) -> str:
+        """
+        Fix common Mermaid syntax errors with the rules for the code's diagram type
+
+        See diagrams/services/mermaid_fixer.py for the rules: emojis in node IDs,
+        tilde generics, ER attribute order and cardinality, class multiplicity
+        quotes, reserved keywords as node IDs and unsupported styling directives.
+        """
+        mermaid_code, hits = syntax_fixer.fix(mermaid_code)
+        if hits:
+            applied = ', '.join(f"{name} x{count}" for name, count in hits.items())
+            logger.info(f"Applied syntax fixes to Mermaid code: {applied}")
+        return mermaid_code
     
     def test_service(self) -> Tuple[bool, Optional[str]]:
         """
@@ -0,0 +1,239 @@
+"""
+Incremental cleaner and fixer for LLM responses that arrive as a token stream
+
+MermaidStreamProcessor does what _clean_ai_response, truncate and the syntax
+fixer do to a complete response, but a line at a time as chunks arrive: prose
+before an opening code fence is dropped, each line is fixed with the rules for
+the diagram's type as soon as it is complete, and the closing fence (or the
+size limit) marks the processor done so the caller can stop reading the
+stream. The fixed lines are the result; nothing is re-run over the whole
+response at the end.
+"""
+
+import time
+from typing import Callable, Dict, List, Optional
+
+from .mermaid_fixer import HEADER_TYPES, SyntaxFixer, diagram_type_of, syntax_fixer
+
+FENCE = '```'
+
+# First words of Mermaid diagrams the fixer has no rules for; output starting with one is a bare diagram
+OTHER_HEADERS = frozenset({
+    'pie', 'gantt', 'journey', 'gitGraph', 'mindmap', 'timeline', 'quadrantChart',
+    'requirementDiagram', 'C4Context', 'C4Container', 'C4Component', 'C4Dynamic', 'C4Deployment',
+    'sankey-beta', 'xychart-beta', 'block-beta',
+})
+
+# Where the processor is in the response
+_START = 'start'          # nothing but blank lines yet
+_PREAMBLE = 'preamble'    # text that is the diagram only if no fence follows
+_FENCED = 'fenced'        # inside ``` ... ```
+_BARE = 'bare'            # an unfenced diagram
+
+
+def _is_header(text: str) -> bool:
+    word = text.split(None, 1)[0].rstrip(';') if text else ''
+    return word in HEADER_TYPES or word in OTHER_HEADERS
+
+
+class MermaidStreamProcessor:
+    """
+    Turns chunks of a streamed LLM response into cleaned and fixed Mermaid lines
+
+    Args:
+        fixer (SyntaxFixer): Rules applied to each completed line
+        max_chars (int): MERMAID_MAX_CHARS; the diagram ends at the last line that fits (0 for no limit)
+        max_lines (int): MERMAID_MAX_LINES; the diagram ends after this many lines (0 for no limit)
+        on_lines: Optional callback receiving the fixed lines each chunk completed
+    """
+
+    def __init__(self, fixer: SyntaxFixer = syntax_fixer, max_chars: int = 0, max_lines: int = 0,
+                 on_lines: Optional[Callable[[List[str]], None]] = None):
+        self.fixer = fixer
+        self.max_chars = max_chars
+        self.max_lines = max_lines
+        self.on_lines = on_lines
+        self.lines: List[str] = []
+        self.hits: Dict[str, int] = {}
+        self.done = False
+        self.truncated = False
+        self.elapsed_ms = 0.0
+        self._state = _START
+        self._tail = ''
+        self._preamble: List[str] = []
+        # Cleaned lines seen so far and their length, for the size limits
+        self._count = 0
+        self._chars = 0
+        # Leading comment lines wait for the header that decides which rules apply
+        self._typed = False
+        self._type: Optional[str] = None
+        self._untyped: List[str] = []
+        # Cleaned lines of the current chunk, fixed together when the chunk is done
+        self._batch: List[str] = []
+        # Whitespace-only fixed lines are emitted only once a non-blank line follows them
+        self._blank: List[str] = []
+
+    @property
+    def code(self) -> str:
+        """The fixed diagram so far"""
+        return '\n'.join(self.lines)
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Add the next chunk of the response
+
+        Returns:
+            List[str]: Fixed lines completed by this chunk (possibly none)
+        """
+        if self.done or not chunk:
+            return []
+        started = time.perf_counter()
+        parts = (self._tail + chunk).split('\n')
+        self._tail = parts.pop()
+        for line in parts:
+            self._line(line)
+            if self.done:
+                break
+        # A line longer than the whole limit can't be kept; stop waiting for its end
+        if not self.done and self.max_chars and len(self._tail) > self.max_chars and self._state in (_FENCED, _BARE):
+            self._line(self._tail)
+            self.done = True
+        if self.done:
+            self._tail = ''
+        return self._flush(started)
+
+    def finish(self) -> str:
+        """
+        End the response: process the last line and whatever was held back
+
+        Returns:
+            str: The cleaned and fixed diagram
+        """
+        started = time.perf_counter()
+        if not self.done:
+            if self._tail:
+                self._line(self._tail)
+                self._tail = ''
+            if self._state == _PREAMBLE:
+                # No fence ever came, so the held text is the diagram
+                self._state = _BARE
+                for line in self._preamble:
+                    if self.done:
+                        break
+                    self._accept(line)
+            self.done = True
+        if not self._typed:
+            self._batch.extend(self._untyped)
+            self._untyped = []
+        new = self._fix()
+        self._blank = []
+        if self.lines:
+            self.lines[-1] = self.lines[-1].rstrip()
+        self.fixer.record(self.hits)
+        self._flush(started, new)
+        return self.code
+
+    def _flush(self, started: float, new: Optional[List[str]] = None) -> List[str]:
+        if new is None:
+            new = self._fix()
+        self.elapsed_ms += (time.perf_counter() - started) * 1000
+        if new and self.on_lines is not None:
+            self.on_lines(new)
+        return new
+
+    def _line(self, line: str):
+        """Route one complete line of the raw response"""
+        if self._state in (_FENCED, _BARE):
+            fence = line.find(FENCE)
+            if fence == -1:
+                self._accept(line)
+                return
+            if line[:fence].strip():
+                self._accept(line[:fence])
+            self.done = True
+            return
+
+        text = line.strip()
+        fence = line.find(FENCE)
+        if fence != -1:
+            # Opening fence: anything before it was prose
+            self._preamble = []
+            self._state = _FENCED
+            rest = line[fence + len(FENCE):]
+            if rest.startswith('mermaid'):
+                rest = rest[len('mermaid'):]
+            if rest.strip():
+                self._line(rest)
+            return
+        if self._state == _START:
+            if not text:
+                return
+            if _is_header(text):
+                self._state = _BARE
+                self._accept(line)
+                return
+            self._state = _PREAMBLE
+            self._preamble.append(line)
+            return
+        # Preamble: comments (%%{init}%% directives) followed by a header are a bare diagram
+        self._preamble.append(line)
+        if _is_header(text) and all(not held.strip() or held.strip().startswith('%%') for held in self._preamble):
+            held, self._preamble = self._preamble, []
+            self._state = _BARE
+            for held_line in held:
+                self._accept(held_line)
+
+    def _accept(self, line: str):
+        """Take one cleaned line of the diagram, within the size limits"""
+        if self._count == 0:
+            if not line.strip():
+                return
+            line = line.lstrip()
+        if self.max_lines and self._count >= self.max_lines:
+            self.truncated = self.done = True
+            return
+        chars = self._chars + (1 if self._count else 0) + len(line)
+        if self.max_chars and chars > self.max_chars:
+            self.truncated = self.done = True
+            if self._count:
+                return
+            line = line[:self.max_chars]
+            chars = len(line)
+        self._count += 1
+        self._chars = chars
+
+        if not self._typed:
+            text = line.strip()
+            if not text or text.startswith('%%'):
+                self._untyped.append(line)
+                return
+            self._typed = True
+            self._type = diagram_type_of(text)
+            self._batch.extend(self._untyped)
+            self._untyped = []
+        self._batch.append(line)
+
+    def _fix(self) -> List[str]:
+        """Fix the batched lines and append them; returns the lines emitted"""
+        if not self._batch:
+            return []
+        fixed, hits = self.fixer.fix_lines(self._batch, self._type)
+        self._batch = []
+        for name, count in hits.items():
+            self.hits[name] = self.hits.get(name, 0) + count
+        new = []
+        for line in fixed:
+            if not self.lines:
+                line = line.lstrip()
+                if not line:
+                    continue
+            if not line.strip():
+                self._blank.append(line)
+                continue
+            if self._blank:
+                self.lines.extend(self._blank)
+                new.extend(self._blank)
+                self._blank = []
+            self.lines.append(line)
+            new.append(line)
+        return new
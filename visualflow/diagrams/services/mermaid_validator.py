@@ -0,0 +1,467 @@
+"""
+Mermaid validator - line-level checks of the grammars the generator produces
+
+Covers flowchart/graph, classDiagram, erDiagram, sequenceDiagram and
+stateDiagram(-v2). Each line is scanned on its own with small anchored
+patterns (plus a stack for subgraph/class/entity/alt... blocks), so a broken
+diagram is reported as the exact lines Mermaid would reject and those lines
+alone can be repaired. Other diagram types are reported as unsupported and
+left to the browser.
+"""
+
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class LineError(NamedTuple):
+    """One line Mermaid would reject"""
+    line: int  # 1-based line number
+    text: str
+    message: str
+
+
+class ValidationResult(NamedTuple):
+    """
+    Outcome of validating one diagram
+
+    `diagram_type` is the grammar that was applied, or None when the header
+    names a type this validator doesn't cover. `closers` are the lines that
+    would close blocks still open at the end, innermost first.
+    """
+    diagram_type: Optional[str]
+    errors: List[LineError]
+    closers: Tuple[str, ...] = ()
+
+    @property
+    def supported(self) -> bool:
+        return self.diagram_type is not None
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+DIRECTIONS = ('TB', 'TD', 'BT', 'RL', 'LR')
+
+_DIRECTION_RE = re.compile(r'direction\s+(?:TB|TD|BT|RL|LR)\s*;?$')
+_ACC_RE = re.compile(r'acc(?:Title|Descr)\s*:')
+_ACC_BLOCK_RE = re.compile(r'accDescr\s*\{')
+
+
+class Grammar:
+    """Per-diagram line checker; subclasses implement `statement`"""
+
+    name = ''
+
+    def __init__(self):
+        """Initialize with no open blocks"""
+        # (kind, closer, line number, text) of every block still open
+        self.blocks: List[Tuple[str, str, int, str]] = []
+
+    def header(self, args: str) -> Optional[str]:
+        """Check the arguments after the header keyword; returns an error message or None"""
+        return None if not args else f"Unexpected '{args}' after the diagram header"
+
+    def check(self, number: int, text: str) -> Optional[str]:
+        """Check one stripped, non-empty, non-comment line; returns an error message or None"""
+        return self.statement(text, number)
+
+    def statement(self, text: str, number: int) -> Optional[str]:
+        raise NotImplementedError
+
+    def open(self, kind: str, closer: str, number: int, text: str):
+        self.blocks.append((kind, closer, number, text))
+
+    def close(self, closer: str) -> Optional[str]:
+        """Close the innermost block if `closer` ends it"""
+        if not self.blocks:
+            return f"'{closer}' without an open block"
+        kind, expected, _, _ = self.blocks[-1]
+        if expected != closer:
+            return f"'{closer}' cannot close the open {kind} (expected '{expected}')"
+        self.blocks.pop()
+        return None
+
+    @property
+    def inside(self) -> Optional[str]:
+        return self.blocks[-1][0] if self.blocks else None
+
+
+# ---------------------------------------------------------------------------
+# flowchart / graph
+# ---------------------------------------------------------------------------
+
+_FC_ID = re.compile(r'\w+(?:[.\-]\w+)*')
+_FC_CLASS_SUFFIX = re.compile(r':::[\w-]+')
+_FC_WS = re.compile(r'[ \t]*')
+_FC_AMP = re.compile(r'[ \t]*&[ \t]*')
+_FC_ARROW = re.compile(r'[<ox]?(?:-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,}|-\.+-[>ox]?|~{3,})')
+_FC_TEXT_OPEN = re.compile(r'[<ox]?(?:--|==|-\.)(?=[ \t]*[^ \t\-=.>])')
+_FC_TEXT_CLOSE = re.compile(r'(?:-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,}|\.-+[>ox]?)')
+_FC_EDGE_LABEL = re.compile(r'[ \t]*\|[^|]*\|')
+_FC_LABEL_BRACKETS = re.compile(r'[()\[\]{}]')
+
+# Longest openers first; some shapes have two valid closers
+_FC_SHAPES = (
+    ('(((', (')))',)), ('((', ('))',)), ('([', ('])',)), ('[(', (')]',)), ('[[', (']]',)),
+    ('{{', ('}}',)), ('[/', ('/]', '\\]')), ('[\\', ('\\]', '/]')),
+    ('(', (')',)), ('[', (']',)), ('{', ('}',)), ('>', (']',)),
+)
+
+_FC_KEYWORD_RES = (
+    re.compile(r'classDef\s+\S+\s+\S'),
+    re.compile(r'class\s+\S+\s+\S+\s*;?$'),
+    re.compile(r'style\s+\S+\s+\S'),
+    re.compile(r'linkStyle\s+\S+\s+\S'),
+    re.compile(r'click\s+\S+\s+\S'),
+)
+
+
+class FlowchartGrammar(Grammar):
+    name = 'flowchart'
+
+    def header(self, args: str) -> Optional[str]:
+        args = args.rstrip(';').strip()
+        if args and args not in DIRECTIONS:
+            return f"Unknown flowchart direction '{args}' (use TD, TB, BT, LR or RL)"
+        return None
+
+    def statement(self, text: str, number: int) -> Optional[str]:
+        keyword = text.split(None, 1)[0]
+        if keyword == 'subgraph':
+            if len(text.split()) < 2:
+                return "subgraph needs an ID or title"
+            self.open('subgraph', 'end', number, text)
+            return None
+        if text.rstrip(';') == 'end':
+            return self.close('end')
+        if keyword == 'direction':
+            return None if _DIRECTION_RE.match(text) else "direction must be one of TB, TD, BT, RL, LR"
+        if keyword in ('classDef', 'class', 'style', 'linkStyle', 'click'):
+            if any(pattern.match(text) for pattern in _FC_KEYWORD_RES):
+                return None
+            return f"Incomplete {keyword} statement"
+        return self._chain(text)
+
+    def _node(self, text: str, pos: int) -> Tuple[int, Optional[str]]:
+        """Scan one node reference (ID, optional shape and :::class) starting at pos"""
+        match = _FC_ID.match(text, pos)
+        if not match:
+            return pos, f"Expected a node ID at '{text[pos:pos + 20]}'"
+        node_id = match.group(0)
+        if node_id == 'end':
+            return pos, "'end' is reserved and cannot be a node ID (use endNode)"
+        pos = match.end()
+        for opener, closers in _FC_SHAPES:
+            if not text.startswith(opener, pos):
+                continue
+            start = pos + len(opener)
+            if text.startswith('"', start):
+                quote = text.find('"', start + 1)
+                if quote == -1:
+                    return pos, f"Unterminated quoted label on node '{node_id}'"
+                ends = [quote + 1 if text.startswith(closer, quote + 1) else -1 for closer in closers]
+            else:
+                ends = [text.find(closer, start) for closer in closers]
+            found = [(end, closer) for end, closer in zip(ends, closers) if end != -1]
+            if not found:
+                return pos, f"Label of node '{node_id}' is not closed with '{closers[0]}'"
+            end, closer = min(found)
+            if not text.startswith('"', start) and _FC_LABEL_BRACKETS.search(text, start, end):
+                return pos, f"Quote labels that contain brackets: {node_id}{opener}\"...\"{closer}"
+            pos = end + len(closer)
+            break
+        suffix = _FC_CLASS_SUFFIX.match(text, pos)
+        return (suffix.end() if suffix else pos), None
+
+    def _nodes(self, text: str, pos: int) -> Tuple[int, Optional[str]]:
+        pos, error = self._node(text, pos)
+        while error is None:
+            amp = _FC_AMP.match(text, pos)
+            if not amp:
+                break
+            pos, error = self._node(text, amp.end())
+        return pos, error
+
+    def _link(self, text: str, pos: int) -> Optional[int]:
+        """End of the link starting at pos, or None if there is no link there"""
+        match = _FC_ARROW.match(text, pos)
+        if match:
+            label = _FC_EDGE_LABEL.match(text, match.end())
+            return label.end() if label else match.end()
+        match = _FC_TEXT_OPEN.match(text, pos)
+        if match:
+            close = _FC_TEXT_CLOSE.search(text, match.end())
+            return close.end() if close else None
+        return None
+
+    def _chain(self, text: str) -> Optional[str]:
+        """node [& node] (link node [& node])* [;]"""
+        pos, error = self._nodes(text, 0)
+        while error is None:
+            pos = _FC_WS.match(text, pos).end()
+            if pos == len(text) or text[pos:].strip() == ';':
+                return None
+            end = self._link(text, pos)
+            if end is None:
+                return f"Unexpected '{text[pos:pos + 20]}' (expected a link such as --> or the end of the line)"
+            pos = _FC_WS.match(text, end).end()
+            if pos == len(text):
+                return "Link has no target node"
+            pos, error = self._nodes(text, pos)
+        return error
+
+
+# ---------------------------------------------------------------------------
+# classDiagram
+# ---------------------------------------------------------------------------
+
+_CLS_NAME = r'\w+(?:-\w+)*(?:~[^~\s]+~)?'
+_CLS_ARROW = r'(?:<\||\*|o|<)?(?:--|\.\.)(?:\|>|\*|o|>)?'
+_CLS_CARDINALITY = r'(?:"[^"]*"\s*)?'
+_CLS_DECLARATION = re.compile(
+    rf'class\s+{_CLS_NAME}(?:\s*\["[^"]*"\])?(?:\s*:::[\w-]+)?\s*(\{{\s*\}}|\{{)?\s*;?$')
+_CLS_RELATION = re.compile(
+    rf'{_CLS_NAME}\s*{_CLS_CARDINALITY}{_CLS_ARROW}\s*{_CLS_CARDINALITY}{_CLS_NAME}(?:\s*:\s*.*)?$')
+_CLS_MEMBER = re.compile(rf'{_CLS_NAME}\s*:\s*\S')
+_CLS_ANNOTATION = re.compile(rf'<<[^<>]+>>\s*{_CLS_NAME}\s*$')
+_CLS_NOTE = re.compile(rf'note\s+(?:for\s+{_CLS_NAME}\s+)?"[^"]*"\s*$')
+_CLS_NAMESPACE = re.compile(r'namespace\s+[\w.-]+\s*\{$')
+_CLS_STYLE = re.compile(rf'(?:cssClass\s+"[^"]*"\s+\S+|classDef\s+\S+\s+\S.*|style\s+\S+\s+\S.*|'
+                        rf'(?:click|link|callback)\s+\S+\s+\S.*|class\s+[\w,]+\s*:::[\w-]+)\s*;?$')
+_CLS_ALONE = re.compile(rf'{_CLS_NAME}(?:\s*:::[\w-]+)?\s*;?$')
+
+
+class ClassGrammar(Grammar):
+    name = 'class'
+
+    def statement(self, text: str, number: int) -> Optional[str]:
+        if self.inside == 'class':
+            # Member lines are free text; only the closing brace matters
+            if text == '}':
+                return self.close('}')
+            if '{' in text or '}' in text:
+                return "Braces are not allowed inside a class body"
+            return None
+        if text == '}':
+            return self.close('}')
+        if _DIRECTION_RE.match(text):
+            return None
+        if text.startswith('class '):
+            match = _CLS_DECLARATION.match(text)
+            if match:
+                if match.group(1) == '{':
+                    self.open('class', '}', number, text)
+                return None
+            if _CLS_STYLE.match(text):
+                return None
+            if text.endswith('{'):
+                # Check the members anyway rather than reporting each of them
+                self.open('class', '}', number, text)
+            if '<' in text.split('{')[0]:
+                return "Generic class names use tildes (class Box~T~), not angle brackets"
+            return "Invalid class declaration"
+        if _CLS_NAMESPACE.match(text):
+            self.open('namespace', '}', number, text)
+            return None
+        for pattern in (_CLS_RELATION, _CLS_MEMBER, _CLS_ANNOTATION, _CLS_NOTE, _CLS_STYLE, _CLS_ALONE):
+            if pattern.match(text):
+                return None
+        if re.search(r'(?:--|\.\.)', text):
+            return ("Invalid relationship (quote multiplicities and put them next to the class: "
+                    "A \"1\" --> \"*\" B : label)")
+        return "Unrecognized class diagram statement"
+
+
+# ---------------------------------------------------------------------------
+# erDiagram
+# ---------------------------------------------------------------------------
+
+_ER_NAME = r'(?:[A-Za-z_][\w-]*|"[^"]+")'
+_ER_RELATION = re.compile(
+    rf'{_ER_NAME}\s*(?:\|o|\|\||\}}o|\}}\|)(?:--|\.\.)(?:o\||\|\||o\{{|\|\{{)\s*{_ER_NAME}\s*:\s*(.*)$')
+_ER_LABEL = re.compile(r'"[^"]*"|[\w-]+$')
+_ER_ENTITY = re.compile(rf'{_ER_NAME}(?:\s*\["[^"]*"\])?\s*(\{{)?$')
+_ER_ATTRIBUTE = re.compile(
+    r'[A-Za-z_][\w()\[\],.-]*\s+\*?[A-Za-z_][\w()\[\]-]*'
+    r'(?:\s+(?:PK|FK|UK)(?:\s*,\s*(?:PK|FK|UK))*)?(?:\s+"[^"]*")?$')
+
+
+class ERGrammar(Grammar):
+    name = 'er'
+
+    def statement(self, text: str, number: int) -> Optional[str]:
+        if self.inside == 'entity':
+            if text == '}':
+                return self.close('}')
+            if _ER_ATTRIBUTE.match(text):
+                return None
+            if re.match(r'\S+\s+\S+\s+(?:PK|FK|UK)\s+(?:PK|FK|UK)\b', text):
+                return "Separate multiple keys with a comma (PK, FK)"
+            return "Attributes are 'type name' with an optional PK/FK/UK and \"comment\""
+        if text == '}':
+            return self.close('}')
+        if _DIRECTION_RE.match(text):
+            return None
+        match = _ER_RELATION.match(text)
+        if match:
+            if _ER_LABEL.match(match.group(1).strip()):
+                return None
+            return "Relationship labels with spaces must be quoted (: \"places order\")"
+        match = _ER_ENTITY.match(text)
+        if match:
+            if match.group(1):
+                self.open('entity', '}', number, text)
+            return None
+        if re.search(r'[|}{o][-.]{2}[|{}o]', text):
+            return "Invalid relationship; cardinalities are |o, ||, }o, }| on the left and o|, ||, o{, |{ on the right"
+        return "Unrecognized ER diagram statement"
+
+
+# ---------------------------------------------------------------------------
+# sequenceDiagram
+# ---------------------------------------------------------------------------
+
+_SEQ_ACTOR = r'[^\s:;,+\-<>]+(?:-(?![->x)])[^\s:;,+\-<>]+)*'
+_SEQ_MESSAGE = re.compile(rf'{_SEQ_ACTOR}\s*(?:<<)?-{{1,2}}(?:>>|>|x|\))\s*[+-]?\s*{_SEQ_ACTOR}\s*(:.*)?$')
+_SEQ_PARTICIPANT = re.compile(rf'(?:create\s+)?(?:participant|actor)\s+{_SEQ_ACTOR}(?:\s+as\s+.+)?$')
+_SEQ_NOTE = re.compile(rf'[Nn]ote\s+(?:left of|right of|over)\s+{_SEQ_ACTOR}(?:\s*,\s*{_SEQ_ACTOR})?\s*:.*$')
+_SEQ_SIMPLE = re.compile(
+    rf'(?:autonumber(?:\s+\d+(?:\s+\d+)?)?|(?:activate|deactivate|destroy)\s+{_SEQ_ACTOR}|'
+    rf'title\s*:?\s*.+|(?:link|links|properties|details)\s+{_SEQ_ACTOR}\s*:.*)$')
+_SEQ_BLOCKS = ('loop', 'alt', 'opt', 'par', 'critical', 'break', 'rect', 'box')
+_SEQ_BRANCHES = {'else': ('alt',), 'and': ('par',), 'option': ('critical',)}
+
+
+class SequenceGrammar(Grammar):
+    name = 'sequence'
+
+    def statement(self, text: str, number: int) -> Optional[str]:
+        keyword = text.split(None, 1)[0]
+        if keyword in _SEQ_BLOCKS:
+            self.open(keyword, 'end', number, text)
+            return None
+        if text == 'end':
+            return self.close('end')
+        if keyword in _SEQ_BRANCHES:
+            if self.inside not in _SEQ_BRANCHES[keyword]:
+                return f"'{keyword}' is only valid inside {' or '.join(_SEQ_BRANCHES[keyword])}"
+            return None
+        for pattern in (_SEQ_PARTICIPANT, _SEQ_NOTE, _SEQ_SIMPLE):
+            if pattern.match(text):
+                return None
+        match = _SEQ_MESSAGE.match(text)
+        if match:
+            return None if match.group(1) is not None else "Messages need text after a colon (A->>B: text)"
+        return "Unrecognized sequence diagram statement"
+
+
+# ---------------------------------------------------------------------------
+# stateDiagram / stateDiagram-v2
+# ---------------------------------------------------------------------------
+
+_ST_STATE = r'(?:\[\*\]|\w+(?:-\w+)*)(?::::[\w-]+)?'
+_ST_TRANSITION = re.compile(rf'{_ST_STATE}\s*-->\s*{_ST_STATE}(?:\s*:.*)?$')
+_ST_DECLARATION = re.compile(
+    r'state\s+(?:"[^"]*"\s+as\s+\w+|\w+(?:\s+<<(?:fork|join|choice)>>)?|\w+\s*:\s*.+)\s*(\{)?$')
+_ST_DESCRIPTION = re.compile(r'\w+\s*:\s*\S')
+_ST_NOTE_INLINE = re.compile(r'note\s+(?:left|right)\s+of\s+\w+\s*:\s*.+$')
+_ST_NOTE_BLOCK = re.compile(r'note\s+(?:left|right)\s+of\s+\w+\s*$')
+_ST_STYLE = re.compile(r'(?:classDef\s+\S+\s+\S.*|class\s+[\w,]+\s+\S+|style\s+\S+\s+\S.*)$')
+_ST_ALONE = re.compile(rf'{_ST_STATE}$')
+
+
+class StateGrammar(Grammar):
+    name = 'state'
+
+    def statement(self, text: str, number: int) -> Optional[str]:
+        if self.inside == 'note':
+            return self.close('end note') if text == 'end note' else None
+        if text == '}':
+            return self.close('}')
+        if text == '--':
+            return None if self.inside == 'state' else "'--' only separates regions inside a composite state"
+        if _DIRECTION_RE.match(text):
+            return None
+        if text.startswith('state '):
+            match = _ST_DECLARATION.match(text)
+            if not match:
+                return "Invalid state declaration"
+            if match.group(1):
+                self.open('state', '}', number, text)
+            return None
+        if _ST_NOTE_BLOCK.match(text):
+            self.open('note', 'end note', number, text)
+            return None
+        for pattern in (_ST_TRANSITION, _ST_NOTE_INLINE, _ST_STYLE, _ST_DESCRIPTION, _ST_ALONE):
+            if pattern.match(text):
+                return None
+        if '->' in text and '-->' not in text:
+            return "Transitions use --> (A --> B : event)"
+        return "Unrecognized state diagram statement"
+
+
+GRAMMARS = {
+    'graph': FlowchartGrammar,
+    'flowchart': FlowchartGrammar,
+    'classDiagram': ClassGrammar,
+    'classDiagram-v2': ClassGrammar,
+    'erDiagram': ERGrammar,
+    'sequenceDiagram': SequenceGrammar,
+    'stateDiagram': StateGrammar,
+    'stateDiagram-v2': StateGrammar,
+}
+
+
+def _is_skippable(text: str) -> bool:
+    return not text or text.startswith('%%')
+
+
+def validate_mermaid(code: str) -> ValidationResult:
+    """
+    Validate Mermaid code line by line
+
+    Args:
+        code (str): Cleaned and fixed Mermaid code
+
+    Returns:
+        ValidationResult: Grammar applied, rejected lines and any blocks left open
+    """
+    lines = code.split('\n')
+    index = 0
+    while index < len(lines) and _is_skippable(lines[index].strip()):
+        index += 1
+    if index == len(lines):
+        return ValidationResult('empty', [LineError(1, '', "The diagram is empty")])
+
+    keyword, _, args = lines[index].strip().partition(' ')
+    grammar_class = GRAMMARS.get(keyword.rstrip(';'))
+    if grammar_class is None:
+        return ValidationResult(None, [])
+
+    grammar = grammar_class()
+    errors = []
+    message = grammar.header(args.strip())
+    if message:
+        errors.append(LineError(index + 1, lines[index], message))
+
+    in_description = False
+    for number, line in enumerate(lines[index + 1:], start=index + 2):
+        text = line.strip()
+        if in_description:
+            in_description = '}' not in text
+            continue
+        if _is_skippable(text) or _ACC_RE.match(text):
+            continue
+        if _ACC_BLOCK_RE.match(text):
+            in_description = '}' not in text
+            continue
+        message = grammar.check(number, text)
+        if message:
+            errors.append(LineError(number, line, message))
+
+    for kind, closer, number, text in grammar.blocks:
+        errors.append(LineError(number, text, f"This {kind} is never closed with '{closer}'"))
+    closers = tuple(closer for _, closer, _, _ in reversed(grammar.blocks))
+    errors.sort(key=lambda error: error.line)
+    return ValidationResult(grammar.name, errors, closers)
@@ -0,0 +1,92 @@
+"""
+In-process metrics registry - counters and latency summaries for the generation pipeline
+"""
+
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any, Optional
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and sample windows.
+
+    Counters are monotonically increasing totals; observations keep the most
+    recent `window` samples per name so percentiles follow current behaviour.
+    Values are per process - each worker reports its own numbers.
+    """
+
+    def __init__(self, window: int = 500):
+        """Initialize the registry"""
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def incr(self, name: str, amount: int = 1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, value: float):
+        """Record a sample (e.g. latency in milliseconds)"""
+        with self._lock:
+            self._samples[name].append(value)
+
+    def counter(self, name: str) -> int:
+        """Current value of a counter"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def percentile(self, name: str, pct: float, min_count: int = 1) -> Optional[float]:
+        """Percentile of a sample window, or None with fewer than min_count samples"""
+        with self._lock:
+            values = list(self._samples.get(name, ()))
+        if not values or len(values) < min_count:
+            return None
+        return _percentile(sorted(values), pct)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return all counters and sample summaries
+
+        Returns:
+            Dict[str, Any]: {'counters': {...}, 'summaries': {name: {count, mean, p50, p95, max}}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: list(values) for name, values in self._samples.items()}
+
+        summaries = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            summaries[name] = {
+                'count': len(ordered),
+                'mean': round(sum(ordered) / len(ordered), 2),
+                'p50': round(_percentile(ordered, 50), 2),
+                'p95': round(_percentile(ordered, 95), 2),
+                'max': round(ordered[-1], 2),
+            }
+
+        return {'counters': counters, 'summaries': summaries}
+
+    def reset(self):
+        """Clear all counters and samples"""
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+
+
+def _percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    # The smallest value with at least pct% of the samples at or below it
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+metrics = MetricsRegistry()
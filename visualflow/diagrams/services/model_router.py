@@ -0,0 +1,176 @@
+"""
+Model routing - which model, temperature and token limit serve each pipeline step and diagram type
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import groq
+from config.constants import AppConstants
+from config.env_config import EnvConfig
+from .llm_client import CircuitOpenError, DeadlineExceeded, is_retryable
+from .metrics import metrics
+from .prompts.registry import PROMPT_ALIASES
+
+logger = logging.getLogger(__name__)
+
+ROUTE_FIELDS = ('model', 'temperature', 'max_tokens', 'fallbacks', 'latency_target_ms')
+
+# Errors specific to one model that another model may not hit:
+# 404 (model unknown or decommissioned) and 413 (request too large for it)
+MODEL_SPECIFIC_STATUS_CODES = {404, 413}
+
+
+def should_fall_back(exc: BaseException) -> bool:
+    """
+    True if the next model in a route's chain is worth trying after `exc`
+
+    Upstream failures left over after the gateway's retries, and errors tied to
+    the model, qualify. An exhausted deadline or an open circuit do not: the next
+    model would hit the same wall.
+    """
+    if isinstance(exc, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    if isinstance(exc, groq.APIStatusError) and exc.status_code in MODEL_SPECIFIC_STATUS_CODES:
+        return True
+    return is_retryable(exc)
+
+
+class Route:
+    """Resolved settings for one (step, diagram type) pair"""
+
+    def __init__(self, key: str, model: str, temperature: float, max_tokens: Optional[int],
+                 fallbacks: List[str], latency_target_ms: Optional[float]):
+        """Initialize the route; `key` names it in metrics, e.g. 'generator:flowchart'"""
+        self.key = key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.fallbacks = fallbacks
+        self.latency_target_ms = latency_target_ms
+
+    @property
+    def models(self) -> List[str]:
+        """The primary model followed by its fallbacks, without repeats"""
+        chain = []
+        for model in [self.model, *self.fallbacks]:
+            if model not in chain:
+                chain.append(model)
+        return chain
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'fallbacks': list(self.fallbacks),
+            'latency_target_ms': self.latency_target_ms,
+        }
+
+    def __repr__(self):
+        return f"<Route {self.key} -> {' > '.join(self.models)}>"
+
+
+def parse_route_overrides(raw: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse the LLM_ROUTES setting
+
+    Raises:
+        ValueError: Not a JSON object of route objects with known fields
+    """
+    if not raw.strip():
+        return {}
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"LLM_ROUTES is not valid JSON: {e}")
+    if not isinstance(overrides, dict) or not all(isinstance(v, dict) for v in overrides.values()):
+        raise ValueError("LLM_ROUTES must be a JSON object mapping route keys to objects")
+    for key, fields in overrides.items():
+        unknown = set(fields) - set(ROUTE_FIELDS)
+        if unknown:
+            raise ValueError(f"LLM_ROUTES['{key}'] has unknown fields: {', '.join(sorted(unknown))}")
+    return overrides
+
+
+class ModelRouter:
+    """
+    Routing table for LLM calls
+
+    Keys are 'default', a step ('analyzer', 'generator', 'fused', 'refine', 'repair') or
+    'step:diagram_type'. A call takes each field from the most specific key that
+    sets it: 'generator:pie', then 'generator', then 'default'. Aliased types
+    share a route ('erd' uses 'generator:er').
+    """
+
+    def __init__(self, routes: Dict[str, Dict[str, Any]], overrides: str = ''):
+        """Initialize the table from AI_MODELS['MODEL_ROUTES'] plus LLM_ROUTES overrides"""
+        self.routes = {key: dict(fields) for key, fields in routes.items()}
+        self.errors: List[str] = []
+        try:
+            for key, fields in parse_route_overrides(overrides).items():
+                self.routes.setdefault(key, {}).update(fields)
+        except ValueError as e:
+            self.errors.append(str(e))
+            logger.error(f"Ignoring LLM_ROUTES: {e}")
+        self._resolved: Dict[Tuple[str, Optional[str]], Route] = {}
+        self._lock = threading.Lock()
+
+    def route(self, step: str, diagram_type: Optional[str] = None) -> Route:
+        """Resolved route for a step, optionally for one diagram type"""
+        with self._lock:
+            route = self._resolved.get((step, diagram_type))
+            if route is None:
+                route = self._resolved[(step, diagram_type)] = self._resolve(step, diagram_type)
+            return route
+
+    def _resolve(self, step: str, diagram_type: Optional[str]) -> Route:
+        diagram_type = PROMPT_ALIASES.get(diagram_type, diagram_type)
+        key = f"{step}:{diagram_type}" if diagram_type else step
+        fields = {
+            'model': AppConstants.AI_MODELS['GROQ_MODEL'],
+            'temperature': AppConstants.AI_MODELS['TEMPERATURE'],
+            'max_tokens': AppConstants.AI_MODELS['MAX_TOKENS'],
+            'fallbacks': [],
+            'latency_target_ms': None,
+        }
+        for name in ('default', step, key):
+            fields.update(self.routes.get(name, {}))
+        return Route(key, **fields)
+
+    def table(self, steps=('analyzer', 'generator', 'fused', 'refine', 'repair'), diagram_types=()) -> Dict[str, Dict[str, Any]]:
+        """Resolved routes for the given steps and types, for /api/metrics/"""
+        table = {}
+        for step in steps:
+            for diagram_type in (None, *diagram_types) if step != 'analyzer' else (None,):
+                route = self.route(step, diagram_type)
+                table[route.key] = route.as_dict()
+        return table
+
+    def record_call(self, route: Route, model: str, elapsed_ms: float):
+        """Latency of a successful call, and whether it met the route's target"""
+        prefix = f'route.{route.key}.{model}'
+        metrics.incr(f'{prefix}.calls')
+        metrics.observe(f'{prefix}.latency_ms', elapsed_ms)
+        if route.latency_target_ms and elapsed_ms > route.latency_target_ms:
+            metrics.incr(f'{prefix}.over_target')
+
+    def record_validity(self, route_key: str, model: str, valid: bool):
+        """Whether the route's output passed the structural check"""
+        metrics.incr(f"route.{route_key}.{model}.{'valid' if valid else 'invalid'}")
+
+    def should_try_next(self, route: Route, model: str, exc: BaseException) -> bool:
+        """Record a failed call and decide whether the next model in the chain gets a turn"""
+        metrics.incr(f'route.{route.key}.{model}.errors')
+        chain = route.models
+        if chain.index(model) == len(chain) - 1 or not should_fall_back(exc):
+            return False
+        metrics.incr(f'route.{route.key}.fallbacks')
+        logger.warning(f"{route.key} call to {model} failed, falling back to "
+                       f"{chain[chain.index(model) + 1]}: {exc}")
+        return True
+
+
+model_router = ModelRouter(AppConstants.AI_MODELS['MODEL_ROUTES'], EnvConfig.LLM_ROUTES)
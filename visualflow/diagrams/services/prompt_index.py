@@ -0,0 +1,220 @@
+"""
+Near-duplicate prompt index - MinHash LSH over the prompts of completed sessions
+
+Prompts are reduced to a set of content words and word pairs, so rewordings
+such as "ERD for library management system" and "library management ERD" end up
+with the same features. Each set gets a MinHash signature split into bands; a
+band's hash is stored in an indexed column, so finding candidates is one
+indexed lookup per band no matter how many sessions exist. Candidates are then
+scored by exact Jaccard similarity on their stored features.
+"""
+
+import hashlib
+import logging
+import operator
+import re
+import struct
+from functools import reduce
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from django.db.models import Case, Q, When
+
+from config.env_config import EnvConfig
+from .fallback_generator import STOPWORDS
+from .metrics import metrics
+from .prompts.registry import PROMPT_ALIASES
+
+logger = logging.getLogger(__name__)
+
+BANDS = 6
+ROWS_PER_BAND = 3
+# With 6 bands of 3 rows a pair with Jaccard 0.8 becomes a candidate 99% of the
+# time, 0.6 77% and 0.3 15%
+MIN_FEATURES = 2
+MAX_CANDIDATES = 200
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+# Fixed (a, b) pairs for the universal hashes h(x) = (a*x + b) mod p; changing
+# them invalidates every stored band, so they are derived from constants
+_PERMUTATIONS = [
+    (_hash64(f'a{i}'.encode()) % (_MERSENNE_PRIME - 1) + 1, _hash64(f'b{i}'.encode()) % _MERSENNE_PRIME)
+    for i in range(BANDS * ROWS_PER_BAND)
+]
+
+
+def _stem(word: str) -> str:
+    """Plural-insensitive form of a word ('libraries' -> 'library', 'books' -> 'book')"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def prompt_features(prompt: str) -> List[str]:
+    """
+    Sorted feature set of a prompt: content words plus adjacent word pairs within a phrase
+
+    Diagram-type words and filler ("create", "diagram", "system") are dropped and
+    split phrases, so "books and members" and "members and books" agree while
+    "library management" keeps its pair. The diagram type is matched separately.
+    """
+    features = set()
+    phrase: List[str] = []
+    for word in _WORD_RE.findall(prompt.lower()) + ['']:
+        word = _stem(word)
+        if word and word not in STOPWORDS and len(word) > 1:
+            phrase.append(word)
+            continue
+        features.update(phrase)
+        features.update(f"{a}_{b}" for a, b in zip(phrase, phrase[1:]) if a != b)
+        phrase = []
+    return sorted(features)
+
+
+def minhash_bands(features: Sequence[str]) -> List[int]:
+    """One signed 64-bit hash per band of the features' MinHash signature"""
+    values = [_hash64(f.encode('utf-8')) % _MERSENNE_PRIME for f in features]
+    signature = [min((a * x + b) % _MERSENNE_PRIME for x in values) for a, b in _PERMUTATIONS]
+    bands = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'>{ROWS_PER_BAND}Q', *rows), digest_size=8,
+                                 person=f'band{band}'.encode()).digest()
+        bands.append(int.from_bytes(digest, 'big', signed=True))
+    return bands
+
+
+def jaccard(a: Sequence[str], b: Sequence[str]) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class PromptMatch(NamedTuple):
+    """An earlier completed session whose prompt is close to the new one"""
+    session_id: object
+    similarity: float
+
+
+class PromptIndex:
+    """
+    Lookup of completed sessions by prompt similarity
+
+    Kept up to date by a post_save signal on Session (see diagrams/signals.py);
+    `manage.py index_prompts` fills it for sessions created before it existed.
+    """
+
+    def __init__(self, threshold: float):
+        """Initialize the index; matches need at least `threshold` Jaccard similarity"""
+        self.threshold = threshold
+
+    @staticmethod
+    def _type_key(diagram_type: str) -> str:
+        return PROMPT_ALIASES.get(diagram_type, diagram_type)
+
+    def fingerprint(self, session):
+        """Unsaved PromptFingerprint for a session, or None when its prompt has too few features"""
+        from ..models import PromptFingerprint
+
+        features = prompt_features(session.prompt)
+        if len(features) < MIN_FEATURES:
+            return None
+        fingerprint = PromptFingerprint(session_id=session.pk, diagram_type=self._type_key(session.diagram_type),
+                                        features=' '.join(features))
+        for band, value in enumerate(minhash_bands(features)):
+            setattr(fingerprint, f'band{band}', value)
+        return fingerprint
+
+    def update(self, session):
+        """Index a completed session, or drop it from the index otherwise"""
+        from ..models import PromptFingerprint
+
+        # A revision's prompt is an edit instruction, which says nothing about the whole diagram,
+        # and a reused copy would only add a second entry pointing at the same diagram
+        indexable = (session.status == 'completed' and session.generated_uml
+                     and not session.parent_id and not session.reused)
+        fingerprint = self.fingerprint(session) if indexable else None
+        if fingerprint is None:
+            PromptFingerprint.objects.filter(session_id=session.pk).delete()
+            return
+        fingerprint.save()
+        metrics.incr('prompt_index.updates')
+
+    def find(self, prompt: str, diagram_type: str, exclude=None) -> Optional[PromptMatch]:
+        """
+        Most similar indexed session with the same diagram type
+
+        Args:
+            prompt (str): New prompt
+            diagram_type (str): Its diagram type
+            exclude: Session id to leave out (the session being displayed)
+
+        Returns:
+            Optional[PromptMatch]: Best match at or above the threshold
+        """
+        from ..models import PromptFingerprint
+
+        features = prompt_features(prompt)
+        if len(features) < MIN_FEATURES:
+            return None
+
+        matches = [Q(**{f'band{band}': value}) for band, value in enumerate(minhash_bands(features))]
+        candidates = (
+            PromptFingerprint.objects
+            .filter(reduce(operator.or_, matches), diagram_type=self._type_key(diagram_type))
+            # Offline fallback diagrams are too generic to hand out again
+            .exclude(session__generation_metrics__used_fallback=True)
+            # More shared bands means more likely similar; score those first when there are many
+            .annotate(shared_bands=sum(Case(When(match, then=1), default=0) for match in matches))
+            .order_by('-shared_bands')
+        )
+        if exclude is not None:
+            candidates = candidates.exclude(session_id=exclude)
+
+        best: Optional[PromptMatch] = None
+        for session_id, stored in candidates.values_list('session_id', 'features')[:MAX_CANDIDATES]:
+            similarity = jaccard(features, stored.split())
+            if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                best = PromptMatch(session_id, similarity)
+
+        metrics.incr('prompt_index.hits' if best else 'prompt_index.misses')
+        return best
+
+    def rebuild(self, sessions, batch_size: int = 1000) -> Tuple[int, int]:
+        """
+        Index many sessions with bulk writes
+
+        Returns:
+            Tuple[int, int]: (sessions seen, fingerprints written)
+        """
+        from ..models import PromptFingerprint
+
+        seen = written = 0
+        batch = []
+        for session in sessions.iterator(chunk_size=batch_size):
+            seen += 1
+            fingerprint = self.fingerprint(session)
+            if fingerprint is not None:
+                batch.append(fingerprint)
+            if len(batch) >= batch_size:
+                written += self._write(PromptFingerprint, batch)
+                batch = []
+        if batch:
+            written += self._write(PromptFingerprint, batch)
+        return seen, written
+
+    @staticmethod
+    def _write(model, batch) -> int:
+        fields = ['diagram_type', 'features', *(f'band{band}' for band in range(BANDS))]
+        model.objects.bulk_create(batch, update_conflicts=True, unique_fields=['session'], update_fields=fields)
+        return len(batch)
+
+
+prompt_index = PromptIndex(threshold=EnvConfig.PROMPT_REUSE_THRESHOLD)
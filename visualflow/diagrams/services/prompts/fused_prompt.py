@@ -0,0 +1,43 @@
+"""
+Single-call prompt that performs analysis and diagram generation in one request
+"""
+
+FUSED_PROMPT_HEADER = """
+You are an expert diagram requirement analyzer AND Mermaid.js v10.9.1 diagram generator.
+
+In ONE response you must:
+1. Analyze the user's prompt: identify the key entities/components, the relationships
+   between them and anything missing that should be assumed.
+2. Write an enhanced, detailed version of the request.
+3. Generate the diagram for the selected diagram type, following EVERY rule in the
+   DIAGRAM RULES section below.
+
+===== DIAGRAM RULES =====
+"""
+
+FUSED_PROMPT_FOOTER = """
+===== END OF DIAGRAM RULES =====
+
+OUTPUT FORMAT (this overrides any other output instruction above):
+Return ONLY a single JSON object, no markdown fences, no commentary:
+{
+    "diagram_type": "the diagram type you consider best for the prompt",
+    "confidence": 0.0-1.0,
+    "entities": ["entity1", "entity2", ...],
+    "relationships": ["relationship description"],
+    "enhanced_prompt": "A clear, detailed description of the diagram",
+    "mermaid_code": "The complete Mermaid code for the SELECTED diagram type, with newlines escaped as \\n"
+}
+
+The "mermaid_code" value must contain ONLY Mermaid syntax (no ``` fences) and must follow the DIAGRAM RULES.
+"""
+
+
+def build_fused_prompt(specialized_prompt: str) -> str:
+    """
+    Inline a specialized diagram prompt into the fused system prompt
+
+    The result depends only on the diagram type, so it is a stable prefix
+    across requests of the same type.
+    """
+    return FUSED_PROMPT_HEADER + specialized_prompt.strip() + "\n" + FUSED_PROMPT_FOOTER
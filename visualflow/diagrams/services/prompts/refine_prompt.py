@@ -0,0 +1,19 @@
+"""
+Edit prompt for refining an existing diagram instead of regenerating it
+
+The user message carries the current Mermaid code and a short instruction, so
+this prompt only needs the rules that keep an edit valid. It deliberately
+shares COMPACT_COMMON_RULES as its prefix with the compact generator prompts.
+"""
+
+from .compact_prompts import COMPACT_COMMON_RULES
+
+REFINE_PROMPT = COMPACT_COMMON_RULES + """
+TASK: edit an existing diagram.
+You receive the current Mermaid code and a requested change.
+- Apply ONLY the requested change; keep every other node, edge, label and ID exactly as it is.
+- Keep the diagram type and header line unless the change asks for a different layout direction.
+- New IDs follow the same naming style as the existing ones.
+- If the change cannot be applied, return the current code unchanged.
+Return the complete updated Mermaid code.
+"""
@@ -0,0 +1,190 @@
+"""
+Prompt registry - content-hash versions, offline token counts and per-type token budgets
+"""
+
+import hashlib
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config.constants import AppConstants
+from config.env_config import EnvConfig
+
+from .analyzer_prompt import ANALYZER_PROMPT
+from .flowchart_prompt import FLOWCHART_PROMPT
+from .class_diagram_prompt import CLASS_DIAGRAM_PROMPT
+from .er_diagram_prompt import ER_DIAGRAM_PROMPT
+from .sequence_diagram_prompt import SEQUENCE_DIAGRAM_PROMPT
+from .state_diagram_prompt import STATE_DIAGRAM_PROMPT
+from .dfd_prompt import DFD_PROMPT
+from .system_design_prompt import SYSTEM_DESIGN_PROMPT
+from .custom_prompt import CUSTOM_PROMPT
+from .refine_prompt import REFINE_PROMPT
+from .repair_prompt import REPAIR_PROMPT
+from .fused_prompt import build_fused_prompt
+from . import compact_prompts
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('o200k_base')
+except Exception:  # tiktoken is optional; fall back to the estimate below
+    _ENCODING = None
+
+# GPT-style pre-tokenization: contractions, words with their leading space, short
+# digit groups, punctuation runs and whitespace
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+
+# Diagram types that share a prompt
+PROMPT_ALIASES = {
+    'uml': 'class',
+    'erd': 'er',
+}
+
+DEFAULT_PROMPT = 'flowchart'
+
+# Registered prompts that serve a pipeline step rather than a diagram type
+STEP_PROMPTS = {'analyzer', 'refine', 'repair'}
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count of a prompt without calling the API
+
+    Exact when tiktoken is installed (o200k_base, the gpt-oss encoding);
+    otherwise a BPE-shaped estimate: each pre-tokenized word costs one token
+    per ~6 letters, punctuation one per character and non-ASCII one per
+    UTF-8 byte pair, which errs on the high side for budget checks.
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece.isspace():
+            tokens += 1 if '\n' in piece or len(piece) > 1 else 0
+            continue
+        stripped = piece.lstrip(' ')
+        if stripped.isascii() and stripped.isalpha():
+            tokens += math.ceil(len(stripped) / 6)
+        elif stripped.isdigit():
+            tokens += 1
+        elif stripped.isascii():
+            tokens += len(stripped)
+        else:
+            tokens += math.ceil(len(stripped.encode('utf-8')) / 2)
+    return tokens
+
+
+class PromptSpec:
+    """One registered system prompt and its derived version and token count"""
+
+    def __init__(self, name: str, variant: str, text: str):
+        """Initialize the spec; version is a hash of the exact text sent to the model"""
+        self.name = name
+        self.variant = variant
+        self.text = text
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        self.tokens = count_tokens(text)
+
+    @property
+    def label(self) -> str:
+        """Stable identifier for cache keys and metrics, e.g. 'er/compact@1a2b3c4d5e6f'"""
+        return f"{self.name}/{self.variant}@{self.version}"
+
+    def __repr__(self):
+        return f"<PromptSpec {self.label} {self.tokens} tokens>"
+
+
+class PromptRegistry:
+    """
+    Named system prompts in one or more variants
+
+    The deployment picks a variant (PROMPT_VARIANT); prompts without that
+    variant fall back to 'full'. System prompts never contain per-request data,
+    so each one is a byte-identical prefix across calls and provider-side
+    prefix caching can apply.
+    """
+
+    def __init__(self, variant: str = 'full'):
+        """Initialize an empty registry serving `variant`"""
+        self.variant = variant
+        self._specs: Dict[Tuple[str, str], PromptSpec] = {}
+        self._fused: Dict[str, PromptSpec] = {}
+
+    def register(self, name: str, text: str, variant: str = 'full') -> PromptSpec:
+        spec = PromptSpec(name, variant, text)
+        self._specs[(name, variant)] = spec
+        return spec
+
+    def get(self, name: str) -> PromptSpec:
+        """The prompt in the active variant, or its full variant"""
+        spec = self._specs.get((name, self.variant)) or self._specs.get((name, 'full'))
+        if spec is None:
+            raise KeyError(f"No prompt registered as '{name}'")
+        return spec
+
+    def for_diagram(self, diagram_type: str) -> PromptSpec:
+        """Generator prompt for a diagram type, falling back to the flowchart prompt"""
+        name = PROMPT_ALIASES.get(diagram_type, diagram_type)
+        if (name, 'full') not in self._specs:
+            logger.warning(f"No specialized prompt for {diagram_type}, using generic approach")
+            name = DEFAULT_PROMPT
+        return self.get(name)
+
+    def fused_for_diagram(self, diagram_type: str) -> PromptSpec:
+        """Fused analyze+generate prompt wrapping the diagram type's generator prompt"""
+        base = self.for_diagram(diagram_type)
+        spec = self._fused.get(base.label)
+        if spec is None:
+            spec = self._fused[base.label] = PromptSpec(f"fused_{base.name}", base.variant,
+                                                        build_fused_prompt(base.text))
+        return spec
+
+    def diagram_types(self) -> List[str]:
+        """Diagram types with a specialized generator prompt"""
+        return sorted({name for name, _ in self._specs if name not in STEP_PROMPTS})
+
+    def active(self) -> List[PromptSpec]:
+        """The prompt actually served for every registered name"""
+        names = sorted({name for name, _ in self._specs})
+        return [self.get(name) for name in names]
+
+    def budget_for(self, spec: PromptSpec) -> Optional[int]:
+        budgets = AppConstants.PROMPT_TOKEN_BUDGETS.get(spec.variant, {})
+        return budgets.get(spec.name, budgets.get('default'))
+
+    def over_budget(self) -> List[Tuple[PromptSpec, int]]:
+        """Registered prompts (all variants) whose token count exceeds their budget"""
+        result = []
+        for spec in self._specs.values():
+            budget = self.budget_for(spec)
+            if budget is not None and spec.tokens > budget:
+                result.append((spec, budget))
+        return result
+
+
+def _build_registry() -> PromptRegistry:
+    registry = PromptRegistry(variant=EnvConfig.PROMPT_VARIANT)
+    for name, text in (
+        ('analyzer', ANALYZER_PROMPT),
+        ('flowchart', FLOWCHART_PROMPT),
+        ('sequence', SEQUENCE_DIAGRAM_PROMPT),
+        ('class', CLASS_DIAGRAM_PROMPT),
+        ('er', ER_DIAGRAM_PROMPT),
+        ('state', STATE_DIAGRAM_PROMPT),
+        ('dfd', DFD_PROMPT),
+        ('system_design', SYSTEM_DESIGN_PROMPT),
+        ('custom', CUSTOM_PROMPT),
+        ('refine', REFINE_PROMPT),
+        ('repair', REPAIR_PROMPT),
+    ):
+        registry.register(name, text)
+    for name, text in compact_prompts.COMPACT_PROMPTS.items():
+        registry.register(name, text, variant='compact')
+    return registry
+
+
+prompt_registry = _build_registry()
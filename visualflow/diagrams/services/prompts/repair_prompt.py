@@ -0,0 +1,17 @@
+"""
+Repair prompt for the few lines of a diagram that failed local validation
+
+Only the broken lines, their neighbours and the validator's message are sent,
+so a repair costs a fraction of regenerating the diagram.
+"""
+
+REPAIR_PROMPT = """
+You fix individual lines of Mermaid.js v10.9.1 diagrams.
+You receive the diagram type, then numbered broken lines, each with the parser's complaint and its neighbouring lines for context.
+- Fix ONLY the syntax of each broken line; keep its meaning, node/entity/class IDs and label text.
+- A fix may span several lines (separated by \\n) when the statement must be split.
+- Use "" as the code to drop a line that cannot be fixed.
+- Do not repeat the context lines.
+Return ONLY this JSON object, no markdown fences, no commentary:
+{"fixes": [{"line": <broken line number>, "code": "<corrected line(s)>"}]}
+"""
@@ -0,0 +1,363 @@
+"""
+LLM rate limiting - a token bucket shared by all worker processes plus AIMD concurrency per process
+"""
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db.models import F
+
+from config.constants import AppConstants
+from config.env_config import EnvConfig
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Groq reports resets as durations like '2m59.56s', '7.66s' or '120ms'
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+# Longest single sleep while waiting for a bucket token, so pauses set by other
+# processes are noticed
+MAX_WAIT_STEP_SECONDS = 1.0
+ASYNC_POLL_SECONDS = 0.05
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in a rate-limit header value ('1m30s', '7.66s', '250ms' or plain seconds)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_float(headers: httpx.Headers, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class SharedTokenBucket:
+    """
+    Requests-per-minute token bucket stored in the LLMRateLimit table.
+
+    Every worker process refills and takes from the same row. Updates are
+    compare-and-swap on the row's version column (a single UPDATE ... WHERE
+    version = n), so it needs no row locks and behaves the same on SQLite and
+    PostgreSQL. Database errors fail open: an unreachable limiter must not stop
+    generation.
+    """
+
+    MAX_CAS_ATTEMPTS = 8
+
+    def __init__(self, name: str, requests_per_minute: float, burst: int):
+        """Initialize the bucket; rpm <= 0 disables it"""
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def try_acquire(self) -> float:
+        """
+        Take one request from the bucket if available
+
+        Returns:
+            float: 0 when a request was taken, otherwise seconds until one may be
+        """
+        if not self.enabled:
+            return 0.0
+
+        from ..models import LLMRateLimit
+
+        try:
+            for _ in range(self.MAX_CAS_ATTEMPTS):
+                now = time.time()
+                row = LLMRateLimit.objects.filter(name=self.name).values(
+                    'tokens', 'updated_at', 'blocked_until', 'version'
+                ).first()
+                if row is None:
+                    LLMRateLimit.objects.get_or_create(
+                        name=self.name, defaults={'tokens': self.capacity, 'updated_at': now}
+                    )
+                    continue
+
+                if row['blocked_until'] > now:
+                    return row['blocked_until'] - now
+                tokens = min(self.capacity, row['tokens'] + max(0.0, now - row['updated_at']) * self.rate)
+                if tokens < 1:
+                    return (1 - tokens) / self.rate
+
+                swapped = LLMRateLimit.objects.filter(name=self.name, version=row['version']).update(
+                    tokens=tokens - 1, updated_at=now, version=F('version') + 1
+                )
+                if swapped:
+                    return 0.0
+                metrics.incr('ratelimit.cas_conflicts')
+        except Exception as e:
+            metrics.incr('ratelimit.errors')
+            logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+            return 0.0
+
+        # Heavily contended; let the caller retry shortly
+        return random.uniform(0.01, 0.05)
+
+    def pause(self, seconds: float):
+        """Block every process from sending for `seconds`; the bucket restarts empty afterwards"""
+        if not self.enabled or seconds <= 0:
+            return
+
+        from ..models import LLMRateLimit
+
+        until = time.time() + seconds
+        try:
+            LLMRateLimit.objects.filter(name=self.name, blocked_until__lt=until).update(
+                blocked_until=until, tokens=0, updated_at=until, version=F('version') + 1
+            )
+        except Exception as e:
+            metrics.incr('ratelimit.errors')
+            logger.warning(f"Could not pause rate limiter '{self.name}': {e}")
+            return
+        metrics.incr('ratelimit.paused')
+        logger.info(f"LLM requests paused for {seconds:.1f}s by rate limit")
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Per-process cap on in-flight LLM calls, adjusted AIMD-style.
+
+    Each unthrottled response raises the limit by 1/limit (about +1 per round
+    trip of `limit` calls); a 429 or a nearly spent quota multiplies it by
+    `decrease_factor`. Decreases are spaced by `cooldown_seconds` so one burst
+    of 429s from calls already in flight only counts once.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 decrease_factor: float, cooldown_seconds: float):
+        """Initialize the limiter at `initial` concurrent calls"""
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._last_decrease = 0.0
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a slot; False if none freed up"""
+        expires = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    async def aacquire(self, timeout: float) -> bool:
+        """Async acquire; polls so the event loop is never blocked"""
+        expires = time.monotonic() + timeout
+        while not self.acquire(0):
+            if time.monotonic() >= expires:
+                return False
+            await asyncio.sleep(ASYNC_POLL_SECONDS)
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        """Additive increase"""
+        with self._cond:
+            if self.limit >= self.max_limit:
+                return
+            before = int(self.limit)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if int(self.limit) > before:
+                self._cond.notify()
+
+    def on_overload(self):
+        """Multiplicative decrease"""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown_seconds:
+                return
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        metrics.incr('ratelimit.concurrency_decreased')
+        logger.info(f"LLM concurrency limit lowered to {int(self.limit)}")
+
+
+class LLMRateLimiter:
+    """
+    Admission control for LLM calls: a concurrency slot, then a bucket token.
+
+    Response headers from the shared HTTP clients feed it back: 429s and a
+    nearly spent token quota lower the concurrency and pause the bucket until
+    the provider's reset, other responses let the concurrency grow again.
+    """
+
+    def __init__(self, bucket: SharedTokenBucket, concurrency: AdaptiveConcurrencyLimiter,
+                 low_watermark: float):
+        """Initialize the limiter from its two parts"""
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.low_watermark = low_watermark
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds to be allowed to send one request
+
+        Returns:
+            bool: True if admitted; the caller must then release()
+        """
+        started = time.monotonic()
+        expires = started + timeout
+        if not self.concurrency.acquire(timeout):
+            metrics.incr('ratelimit.rejected')
+            return False
+
+        while True:
+            wait = self.bucket.try_acquire()
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > expires:
+                self.concurrency.release()
+                metrics.incr('ratelimit.rejected')
+                return False
+            # Jitter so processes waiting on the same refill don't collide
+            time.sleep(min(wait, MAX_WAIT_STEP_SECONDS) + random.uniform(0, 0.05))
+
+        self._record_wait(started)
+        return True
+
+    async def aacquire(self, timeout: float) -> bool:
+        """Async acquire; the bucket's database round trips run off the event loop"""
+        started = time.monotonic()
+        expires = started + timeout
+        if not await self.concurrency.aacquire(timeout):
+            metrics.incr('ratelimit.rejected')
+            return False
+
+        while True:
+            wait = await sync_to_async(self.bucket.try_acquire)() if self.bucket.enabled else 0.0
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > expires:
+                self.concurrency.release()
+                metrics.incr('ratelimit.rejected')
+                return False
+            await asyncio.sleep(min(wait, MAX_WAIT_STEP_SECONDS) + random.uniform(0, 0.05))
+
+        self._record_wait(started)
+        return True
+
+    def release(self):
+        self.concurrency.release()
+
+    def _record_wait(self, started: float):
+        waited_ms = (time.monotonic() - started) * 1000
+        if waited_ms >= 1:
+            metrics.incr('ratelimit.waited')
+            metrics.observe('ratelimit.wait_ms', waited_ms)
+
+    def _assess(self, response: httpx.Response) -> Optional[float]:
+        """
+        Adjust concurrency from a response and work out how long to pause sending
+
+        Groq's x-ratelimit-*-requests headers count requests per day and the
+        *-tokens headers count tokens per minute, so a low token balance is
+        waited out while a low daily balance only slows us down until it is gone.
+
+        Returns:
+            Optional[float]: Seconds to pause the shared bucket, if any
+        """
+        headers = response.headers
+        if response.status_code == 429:
+            metrics.incr('ratelimit.throttled')
+            self.concurrency.on_overload()
+            return (parse_duration(headers.get('retry-after'))
+                    or parse_duration(headers.get('x-ratelimit-reset-tokens'))
+                    or 1.0)
+        if response.status_code >= 400:
+            return None
+
+        pause = None
+        near_quota = False
+        tokens_left = _header_float(headers, 'x-ratelimit-remaining-tokens')
+        tokens_limit = _header_float(headers, 'x-ratelimit-limit-tokens')
+        if tokens_left is not None and tokens_limit and tokens_left / tokens_limit < self.low_watermark:
+            near_quota = True
+            pause = parse_duration(headers.get('x-ratelimit-reset-tokens'))
+
+        requests_left = _header_float(headers, 'x-ratelimit-remaining-requests')
+        requests_limit = _header_float(headers, 'x-ratelimit-limit-requests')
+        if requests_left is not None and requests_limit and requests_left / requests_limit < self.low_watermark:
+            near_quota = True
+            if requests_left < 1:
+                pause = max(pause or 0.0, parse_duration(headers.get('x-ratelimit-reset-requests')) or 0.0)
+
+        if near_quota:
+            metrics.incr('ratelimit.near_quota')
+            self.concurrency.on_overload()
+        else:
+            self.concurrency.on_success()
+        return pause
+
+    def observe_response(self, response: httpx.Response):
+        """httpx response hook for the shared sync client"""
+        pause = self._assess(response)
+        if pause:
+            self.bucket.pause(pause)
+
+    async def aobserve_response(self, response: httpx.Response):
+        """httpx response hook for the shared async client"""
+        pause = self._assess(response)
+        if pause:
+            await sync_to_async(self.bucket.pause)(pause)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests_per_minute': self.bucket.requests_per_minute,
+            'burst': self.bucket.capacity,
+            'concurrency_limit': int(self.concurrency.limit),
+            'in_flight': self.concurrency.in_flight,
+        }
+
+
+llm_rate_limiter = LLMRateLimiter(
+    SharedTokenBucket(
+        'groq',
+        requests_per_minute=EnvConfig.LLM_RATE_LIMIT_RPM,
+        burst=EnvConfig.LLM_RATE_LIMIT_BURST,
+    ),
+    AdaptiveConcurrencyLimiter(
+        initial=AppConstants.AI_MODELS['AIMD_INITIAL_CONCURRENCY'],
+        min_limit=AppConstants.AI_MODELS['AIMD_MIN_CONCURRENCY'],
+        max_limit=EnvConfig.LLM_MAX_CONCURRENCY,
+        decrease_factor=AppConstants.AI_MODELS['AIMD_DECREASE_FACTOR'],
+        cooldown_seconds=AppConstants.AI_MODELS['AIMD_COOLDOWN_SECONDS'],
+    ),
+    low_watermark=AppConstants.AI_MODELS['RATE_LIMIT_LOW_WATERMARK'],
+)
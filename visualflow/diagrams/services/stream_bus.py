@@ -0,0 +1,167 @@
+"""
+In-process publish/subscribe channels relaying partial diagrams from generation jobs to SSE clients
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+_current_channel = contextvars.ContextVar('stream_channel', default=None)
+
+# Closed channels are kept briefly so clients that connect late still get the final event
+CLOSED_CHANNEL_TTL_SECONDS = 60
+
+
+class StreamChannel:
+    """
+    Latest-value channel for one session.
+
+    Only the most recent partial diagram is kept: each partial supersedes the
+    previous one, so slow subscribers skip intermediate states instead of
+    buffering them, and late subscribers start from the current state.
+    """
+
+    def __init__(self):
+        """Initialize an open channel"""
+        self._cond = threading.Condition()
+        self._version = 0
+        self._partial: Optional[str] = None
+        self._final: Optional[Dict] = None
+        self.closed_at: Optional[float] = None
+
+    def publish_partial(self, code: str):
+        """Replace the current partial diagram"""
+        with self._cond:
+            self._partial = code
+            self._version += 1
+            self._cond.notify_all()
+
+    def close(self, final: Dict):
+        """Publish the terminal event and wake all subscribers"""
+        with self._cond:
+            self._final = final
+            self._version += 1
+            self.closed_at = time.monotonic()
+            self._cond.notify_all()
+
+    def subscribe(self, timeout: float, keepalive: float = 15.0) -> Iterator[Tuple[str, object]]:
+        """
+        Yield ('partial', code), then finally ('done', final_dict)
+
+        Yields ('keepalive', None) when nothing happened for `keepalive` seconds
+        and ('timeout', None) if the channel is not closed within `timeout`.
+        """
+        seen = 0
+        sent_partial = None
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while self._version == seen:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if not self._cond.wait(min(keepalive, remaining)):
+                        break
+                version, partial, final = self._version, self._partial, self._final
+
+            if version == seen:
+                if time.monotonic() >= deadline:
+                    yield 'timeout', None
+                    return
+                yield 'keepalive', None
+                continue
+
+            seen = version
+            if partial is not None and partial != sent_partial:
+                sent_partial = partial
+                yield 'partial', partial
+            if final is not None:
+                yield 'done', final
+                return
+
+    async def asubscribe(self, timeout: float, keepalive: float = 15.0,
+                         poll_interval: float = 0.25):
+        """
+        Async subscribe for ASGI views
+
+        Polls the channel state instead of waiting on the condition, so no
+        thread is held per connected client.
+        """
+        seen = 0
+        sent_partial = None
+        deadline = time.monotonic() + timeout
+        last_event = time.monotonic()
+        while True:
+            with self._cond:
+                version, partial, final = self._version, self._partial, self._final
+
+            if version == seen:
+                now = time.monotonic()
+                if now >= deadline:
+                    yield 'timeout', None
+                    return
+                if now - last_event >= keepalive:
+                    last_event = now
+                    yield 'keepalive', None
+                await asyncio.sleep(poll_interval)
+                continue
+
+            seen = version
+            last_event = time.monotonic()
+            if partial is not None and partial != sent_partial:
+                sent_partial = partial
+                yield 'partial', partial
+            if final is not None:
+                yield 'done', final
+                return
+
+
+class GenerationStreamBus:
+    """Registry of per-session channels for the current process"""
+
+    def __init__(self):
+        """Initialize the bus"""
+        self._channels: Dict[str, StreamChannel] = {}
+        self._lock = threading.Lock()
+
+    def _sweep(self):
+        now = time.monotonic()
+        for key, channel in list(self._channels.items()):
+            if channel.closed_at is not None and now - channel.closed_at > CLOSED_CHANNEL_TTL_SECONDS:
+                del self._channels[key]
+
+    def get_or_create(self, session_id) -> StreamChannel:
+        """Channel for a session, created on first use by publisher or subscriber"""
+        key = str(session_id)
+        with self._lock:
+            self._sweep()
+            channel = self._channels.get(key)
+            if channel is None:
+                channel = self._channels[key] = StreamChannel()
+            return channel
+
+    @contextmanager
+    def publishing(self, session_id):
+        """
+        Make the session's channel the publish target for code running in this block
+
+        Yields:
+            StreamChannel: The channel; callers must close() it with the final state
+        """
+        channel = self.get_or_create(session_id)
+        token = _current_channel.set(channel)
+        try:
+            yield channel
+        finally:
+            _current_channel.reset(token)
+
+
+def current_channel() -> Optional[StreamChannel]:
+    """Channel partial output should be published to, if a subscriber may be listening"""
+    return _current_channel.get()
+
+
+stream_bus = GenerationStreamBus()
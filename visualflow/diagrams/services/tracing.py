@@ -0,0 +1,117 @@
+"""
+Per-generation trace of LLM calls (latency, tokens, cache hits) carried in a context variable
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_current_trace = contextvars.ContextVar('generation_trace', default=None)
+
+# Steps that are LLM calls (as opposed to local work like 'fixer', 'parser' or 'fallback')
+LLM_STEPS = ('analyzer', 'generator', 'fused', 'refine', 'repair')
+
+
+class GenerationTrace:
+    """Collects one record per pipeline step for the generation in progress"""
+
+    def __init__(self):
+        """Initialize an empty trace"""
+        self.steps: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+        self.mode: Optional[str] = None
+
+    def record(self, step: str, elapsed_ms: float, response: Any = None,
+               model: Optional[str] = None, cached: bool = False, **extra):
+        """
+        Record a completed step
+
+        Args:
+            step (str): Step name ('analyzer', 'generator', 'fused', ...)
+            elapsed_ms (float): Wall time of the step
+            response: LangChain message, used for token usage when present
+            model (Optional[str]): Model that served the call
+            cached (bool): True when the step was served from cache
+        """
+        usage = getattr(response, 'usage_metadata', None) or {}
+        self.steps.append({
+            'step': step,
+            'ms': round(elapsed_ms, 2),
+            'prompt_tokens': usage.get('input_tokens', 0),
+            'completion_tokens': usage.get('output_tokens', 0),
+            'model': model,
+            'cached': cached,
+            **extra,
+        })
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(s['prompt_tokens'] for s in self.steps)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(s['completion_tokens'] for s in self.steps)
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Totals per phase, shaped like the GenerationMetrics fields
+
+        Returns:
+            Dict[str, Any]: Timings, token totals, call and cache-hit counts, model, prompt, mode and diagram size
+        """
+        def step_ms(*names):
+            return round(sum(s['ms'] for s in self.steps if s['step'] in names), 2)
+
+        llm_steps = [s for s in self.steps if s['step'] in LLM_STEPS]
+        # The diagram's model and prompt are those of the call that wrote it, not of a repair
+        models = [s['model'] for s in llm_steps if s['step'] != 'repair' and s['model']]
+        prompts = [s['prompt'] for s in llm_steps if s['step'] not in ('analyzer', 'repair') and s.get('prompt')]
+        parsed = [s for s in self.steps if s['step'] == 'parser']
+        return {
+            'mode': self.mode or '',
+            'model_name': models[-1] if models else '',
+            'prompt_version': prompts[-1] if prompts else '',
+            'analyzer_ms': step_ms('analyzer'),
+            'generator_ms': step_ms('generator', 'fused', 'refine'),
+            'fixer_ms': step_ms('fixer', 'validator', 'parser'),
+            'total_ms': round(self.elapsed_ms, 2),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'llm_calls': sum(1 for s in llm_steps if not s['cached']),
+            'cache_hits': sum(1 for s in llm_steps if s['cached']),
+            'used_fallback': any(s['step'] == 'fallback' for s in self.steps),
+            'node_count': parsed[-1]['nodes'] if parsed else 0,
+            'edge_count': parsed[-1]['edges'] if parsed else 0,
+            'steps': list(self.steps),
+        }
+
+
+def current_trace() -> Optional[GenerationTrace]:
+    """Trace of the generation running in this context, if any"""
+    return _current_trace.get()
+
+
+@contextmanager
+def generation_trace():
+    """
+    Use the active trace, or start a new one for the duration of the block
+
+    Yields:
+        GenerationTrace: The trace steps should be recorded on
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+
+    trace = GenerationTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
@@ -0,0 +1,36 @@
+"""
+Signal handlers for the diagrams app
+"""
+
+import logging
+
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Session
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Session)
+def update_content_hash(sender, instance, raw=False, **kwargs):
+    """Hash the canonical Mermaid code whenever a session is saved, so edits and copies stay in step"""
+    if raw:
+        return
+    from .services.mermaid_ast import content_hash
+
+    instance.content_hash = content_hash(instance.generated_uml) if instance.generated_uml else ''
+
+
+@receiver(post_save, sender=Session)
+def update_prompt_index(sender, instance, raw=False, **kwargs):
+    """Keep the near-duplicate prompt index in step with completed sessions"""
+    if raw:
+        return
+    from .services.prompt_index import prompt_index
+
+    try:
+        prompt_index.update(instance)
+    except Exception as e:
+        # The index is an optimization; a failed update must not fail the save
+        logger.warning(f"Prompt index update failed for session {instance.pk}: {e}")
@@ -1,3 +1,293 @@
-from django.test import TestCase
+"""
+Tests for the diagrams app
 
-# Create your tests here.
+The fixer golden test pins the syntax fixer's output on a fixed corpus: the
+benchmark generator's diagrams, the offline fallback diagrams and handwritten
+edge cases. Any change to fixed output fails it; when the change is intended,
+rewrite the digests with
+
+    UPDATE_FIXER_GOLDEN=1 python manage.py test diagrams.tests
+
+fixer_baseline.json holds the digests of the line-based fixer that predates
+the rule engine on the same corpus. It is never rewritten: every item whose
+output differs from it has to be listed in INTENDED_CHANGES with the reason.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from unittest import mock
+
+import httpx
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase
+
+from .benchmarks import CORPUS_TYPES, build_corpus
+from .models import LLMRateLimit
+from .services.circuit_breaker import CircuitBreaker
+from .services.fallback_generator import build_fallback_diagram
+from .services.mermaid_fixer import syntax_fixer
+from .services.metrics import _percentile, metrics
+from .services.rate_limiter import AdaptiveConcurrencyLimiter, LLMRateLimiter, SharedTokenBucket
+
+GOLDEN_PATH = Path(__file__).resolve().parent / 'testdata' / 'fixer_golden.json'
+BASELINE_PATH = GOLDEN_PATH.with_name('fixer_baseline.json')
+
+FALLBACK_TYPES = ('flowchart', 'sequence', 'class', 'er', 'state', 'dfd', 'system_design', 'custom', 'uml', 'erd')
+FALLBACK_PROMPTS = (
+    'Library with books, members and loans; members borrow books',
+    'Login flow with retries and lockout',
+    'Order checkout: cart, payment, shipping, start and end',
+)
+
+HANDWRITTEN = {
+    'flowchart-keywords': "graph TD\n    start --> A[Go]\n    A --> end\n    end[Finish]\n    End --> X\n    A --- Start\n"
+                          "    subgraph S\n    B-->C\n    end\n    classDef hot fill:#f00\n    class A hot\n    style A fill:#fff",
+    'flowchart-emoji': "flowchart LR\n    🚀[Launch] --> 📝[Write]\n    ✅[✅] --> B\n    Start([Start]) --> click[Click me]\n"
+                       "    Link --> Style\n    graph --> callback\n    A -- step 1 --> B",
+    'flowchart-shapes': "flowchart TD\n    A[\"quoted (x)\"] --> B{Is 1 ok?}\n    B -->|Yes 2| C\n    C -.-> D\n    D ==> E",
+    'er-attributes': "erDiagram\n    BOOK {\n        PK bookId\n        FK authorId int\n        int x PK FK\n"
+                     "        string y FK PK\n        bookRef PK FK\n    }\n    A }o--o{ B : has\n    C }|--|{ D : x\n"
+                     "    E ||--o{ F : \"ok\"",
+    'class-multiplicities': "classDiagram\n    class Box~T~ {\n        +List~Item~ items\n    }\n    Order 1 --> * Item\n"
+                            "    Customer \"1\" --> \"*\" Order : places\n    Order \"*--\" Cart\n    A \"1\" *-- B\n"
+                            "    A *-- \"*\" B\n    A o-- 0..1 B\n    A 1..* <|-- B\n    A ..> 0..* B\n    class Foo\n"
+                            "    class Bar:::hot\n    Animal <|-- Dog\n    Link --> Style",
+    'sequence-blocks': "sequenceDiagram\n    A->>B: hi ~there~\n    alt ok\n    B-->>A: 🚀[x]\n    end\n    loop\n"
+                       "    A->>B: y\n    end",
+    'state-keywords': "stateDiagram-v2\n    [*] --> Start\n    Start --> End\n    End --> [*]",
+    'untyped': "   \n\ngraph TD\n\tA\t-->\tend\n",
+    'empty': "",
+}
+for header in ('flowchart TD', 'sequenceDiagram', 'stateDiagram-v2', 'erDiagram', 'classDiagram', 'mindmap'):
+    HANDWRITTEN[f"tilde-{header.split()[0]}"] = f"{header}\n    A[List~Item~] --> B\n    C --> D : Map~K~"
+
+_ROUND_RESERVED_IDS = "reserved IDs in round-shape declarations and targets are renamed like the edges using them"
+_CLASS_DISPATCH = "keyword renaming is for flowchart and state IDs, so a class named Start keeps its name"
+
+# Corpus items whose output differs from the pre-engine fixer on purpose
+INTENDED_CHANGES = {
+    'fallback-flowchart-0': _ROUND_RESERVED_IDS,
+    'fallback-flowchart-1': _ROUND_RESERVED_IDS,
+    'fallback-flowchart-2': _ROUND_RESERVED_IDS,
+    'fallback-custom-0': _ROUND_RESERVED_IDS,
+    'fallback-custom-1': _ROUND_RESERVED_IDS,
+    'fallback-custom-2': _ROUND_RESERVED_IDS,
+    'fallback-class-2': _CLASS_DISPATCH,
+    'fallback-uml-2': _CLASS_DISPATCH,
+    'class-multiplicities': _CLASS_DISPATCH,
+    'flowchart-emoji': "round-shape reserved IDs; numbers in edge labels stay unquoted; emoji IDs come from "
+                       "CRC32 instead of the process-salted hash()",
+    'sequence-blocks': "emoji node IDs are a flowchart fix, so sequence messages shaped like 🚀[x] are left alone",
+}
+
+
+def fixer_corpus():
+    """(name, code) pairs the golden digests cover"""
+    items = []
+    for seed in (0, 1):
+        items.extend((f"{name}@{seed}", code) for name, code in build_corpus(types=CORPUS_TYPES, seed=seed))
+    for diagram_type in FALLBACK_TYPES:
+        for i, prompt in enumerate(FALLBACK_PROMPTS):
+            items.append((f"fallback-{diagram_type}-{i}", build_fallback_diagram(prompt, diagram_type)))
+    items.extend(HANDWRITTEN.items())
+    return items
+
+
+def _digest(code: str) -> str:
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()[:16]
+
+
+class SyntaxFixerGoldenTests(SimpleTestCase):
+    """The fixer's output on the corpus only changes on purpose"""
+
+    def test_corpus_output_unchanged(self):
+        digests = {name: _digest(syntax_fixer.fix(code)[0]) for name, code in fixer_corpus()}
+        if os.getenv('UPDATE_FIXER_GOLDEN'):
+            GOLDEN_PATH.parent.mkdir(exist_ok=True)
+            GOLDEN_PATH.write_text(json.dumps(digests, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+        golden = json.loads(GOLDEN_PATH.read_text(encoding='utf-8'))
+        self.assertEqual(sorted(digests), sorted(golden))
+        changed = [name for name in digests if digests[name] != golden[name]]
+        self.assertEqual(changed, [], f"Fixed output changed for {len(changed)} corpus item(s)")
+
+    def test_differs_from_pre_engine_fixer_only_where_intended(self):
+        baseline = json.loads(BASELINE_PATH.read_text(encoding='utf-8'))
+        changed = sorted(name for name, code in fixer_corpus() if _digest(syntax_fixer.fix(code)[0]) != baseline[name])
+        self.assertEqual(changed, sorted(INTENDED_CHANGES))
+
+    def test_reserved_ids_renamed_consistently(self):
+        fixed, _ = syntax_fixer.fix("flowchart TD\n    Start([Start])\n    Start --> A\n    A --> End([End])")
+        self.assertEqual(fixed, "flowchart TD\n    startNode([Start])\n    startNode --> A\n    A --> endNode([End])")
+
+    def test_tilde_generics_in_every_type(self):
+        for header in ('flowchart TD', 'sequenceDiagram', 'classDiagram'):
+            fixed, _ = syntax_fixer.fix(f"{header}\n    A[List~Item~] --> B")
+            self.assertIn('A[List<Item>]', fixed, header)
+
+    def test_emoji_node_ids_are_stable(self):
+        fixed, _ = syntax_fixer.fix("flowchart TD\n    🚀[✅] --> B")
+        self.assertEqual(fixed, "flowchart TD\n    Node3046[🚀 ✅] --> B")
+
+    def test_rules_follow_the_diagram_type(self):
+        fixed, _ = syntax_fixer.fix("classDiagram\n    Order --> Start")
+        self.assertIn('Order --> Start', fixed)
+        fixed, _ = syntax_fixer.fix("sequenceDiagram\n    B-->>A: 🚀[x]")
+        self.assertIn('B-->>A: 🚀[x]', fixed)
+
+
+class PercentileTests(SimpleTestCase):
+    """Nearest-rank percentiles behind the latency summaries in /api/metrics/"""
+
+    def test_nearest_rank(self):
+        samples = list(range(1, 101))
+        self.assertEqual([_percentile(samples, pct) for pct in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(_percentile(list(range(1, 11)), 90), 9)
+        self.assertEqual(_percentile([1, 2], 50), 1)
+
+    def test_small_and_empty_windows(self):
+        self.assertEqual(_percentile([7], 99), 7)
+        self.assertEqual(_percentile([], 50), 0.0)
+
+
+class FakeClock:
+    """Stands in for time.time / time.monotonic so tests control elapsed time"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class SharedTokenBucketTests(TestCase):
+    """The database-backed bucket every worker takes LLM requests from"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('diagrams.services.rate_limiter.time.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 60 requests per minute is one token per second
+        self.bucket = SharedTokenBucket('test', requests_per_minute=60, burst=2)
+
+    def _row(self):
+        return LLMRateLimit.objects.get(name='test')
+
+    def test_consumes_burst_then_refills_at_the_rate(self):
+        self.assertEqual(self.bucket.try_acquire(), 0.0)
+        self.assertEqual(self.bucket.try_acquire(), 0.0)
+        self.assertAlmostEqual(self.bucket.try_acquire(), 1.0)
+
+        self.clock.advance(0.5)
+        self.assertAlmostEqual(self.bucket.try_acquire(), 0.5)
+        self.clock.advance(0.5)
+        self.assertEqual(self.bucket.try_acquire(), 0.0)
+        self.assertAlmostEqual(self._row().tokens, 0.0)
+
+    def test_refill_is_capped_at_the_burst(self):
+        self.bucket.try_acquire()
+        self.clock.advance(60)
+        self.bucket.try_acquire()
+        self.assertAlmostEqual(self._row().tokens, 1.0)
+
+    def test_retries_after_losing_the_compare_and_swap(self):
+        self.bucket.try_acquire()
+        version = self._row().version
+        conflicts = metrics.counter('ratelimit.cas_conflicts')
+        real_first = QuerySet.first
+        raced = []
+
+        def first_then_race(queryset):
+            row = real_first(queryset)
+            if queryset.model is LLMRateLimit and not raced:
+                # Another worker takes a token between our read and our swap
+                raced.append(True)
+                LLMRateLimit.objects.filter(name='test').update(tokens=F('tokens') - 1, version=F('version') + 1)
+            return row
+
+        self.clock.advance(1)
+        with mock.patch.object(QuerySet, 'first', first_then_race):
+            self.assertEqual(self.bucket.try_acquire(), 0.0)
+
+        self.assertEqual(metrics.counter('ratelimit.cas_conflicts'), conflicts + 1)
+        row = self._row()
+        self.assertEqual(row.version, version + 2)
+        # Both takes count: 1 left + 1 refilled - the other worker's - ours
+        self.assertAlmostEqual(row.tokens, 0.0)
+
+    def test_429_pauses_every_worker_until_the_reset(self):
+        limiter = LLMRateLimiter(
+            self.bucket,
+            AdaptiveConcurrencyLimiter(initial=8, min_limit=1, max_limit=16, decrease_factor=0.5, cooldown_seconds=0),
+            low_watermark=0.1,
+        )
+        self.bucket.try_acquire()
+        request = httpx.Request('POST', 'https://api.groq.com/openai/v1/chat/completions')
+        limiter.observe_response(httpx.Response(429, headers={'retry-after': '7'}, request=request))
+
+        row = self._row()
+        self.assertAlmostEqual(row.blocked_until, self.clock.now + 7)
+        self.assertEqual(row.tokens, 0)
+        self.assertEqual(limiter.concurrency.limit, 4)
+        self.assertAlmostEqual(self.bucket.try_acquire(), 7.0)
+        self.clock.advance(8)
+        self.assertEqual(self.bucket.try_acquire(), 0.0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """closed -> open on the failure rate, open -> half_open after the wait, one probe decides"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('diagrams.services.circuit_breaker.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', window_size=4, min_calls=2, failure_rate=0.5, open_seconds=30)
+
+    def _open(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_opens_at_the_failure_rate(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_open_half_open_closed(self):
+        self._open()
+        self.clock.advance(29)
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.advance(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        # Only the one probe goes through
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self._open()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.advance(29)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_lost_probe_is_replaced(self):
+        self._open()
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow_request())
+        self.clock.advance(30)
+        self.assertTrue(self.breaker.allow_request())
@@ -3,15 +3,32 @@ URL configuration for diagrams app
 """
 
 from django.urls import path
+from config.env_config import EnvConfig
 from . import views
 
 app_name = 'diagrams'
 
+# Async views keep generation on the event loop; they need an ASGI server (see README)
+if EnvConfig.USE_ASYNC_VIEWS:
+    generate_view = views.AsyncGenerateDiagramView
+    refine_view = views.AsyncRefineDiagramView
+    status_view = views.AsyncSessionStatusView
+    stream_view = views.AsyncSessionStreamView
+else:
+    generate_view = views.GenerateDiagramView
+    refine_view = views.RefineDiagramView
+    status_view = views.SessionStatusView
+    stream_view = views.SessionStreamView
+
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
-    path('generate/', views.GenerateDiagramView.as_view(), name='generate'),
+    path('generate/', generate_view.as_view(), name='generate'),
+    path('refine/<uuid:session_id>/', refine_view.as_view(), name='refine'),
     path('delete/<uuid:diagram_id>/', views.delete_diagram, name='delete_diagram'),
     path('display/<uuid:session_id>/', views.DiagramDisplayView.as_view(), name='display'),
+    path('api/status/<uuid:session_id>/', status_view.as_view(), name='status'),
+    path('api/stream/<uuid:session_id>/', stream_view.as_view(), name='stream'),
+    path('api/metrics/', views.MetricsView.as_view(), name='metrics'),
     path('download/<uuid:session_id>/', views.DownloadView.as_view(), name='download'),
     path('contact/', views.handleContactForm, name='contact'),
     path('history/', views.SessionHistoryView.as_view(), name='history'),
@@ -2,16 +2,37 @@
 Views for the VisualFlow diagram generation application
 """
 
+import asyncio
+import json
 import logging
+import time
 from django.shortcuts import redirect, render, get_object_or_404
 from django.views.generic import TemplateView, ListView, DetailView
 from django.views import View
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from asgiref.sync import sync_to_async
+from datetime import timedelta
 from django.contrib import messages
 
-from .models import Session, Contact
+from .models import Session, Contact, GenerationMetrics
 from .forms import ContactForm
-from config.constants import AppConstants
+from .services.generation_jobs import async_job_runner, job_runner
+from .services.cache_service import analysis_cache, generation_cache
+from .services.metrics import metrics
+from .services.circuit_breaker import llm_breaker
+from .services.llm_backends import llm_backend
+from .services.rate_limiter import llm_rate_limiter
+from .services.model_router import model_router
+from .services.intent_classifier import get_intent_classifier
+from .services.stream_bus import stream_bus
+from .services.prompts.registry import prompt_registry
+from .services.prompt_index import prompt_index
+from .services.mermaid_ast import diff_diagrams, parse as parse_mermaid
+from config.constants import AppConstants, ValidationRules
+from config.env_config import EnvConfig
 
 logger = logging.getLogger(__name__)
 
@@ -63,55 +84,122 @@ class GenerateDiagramView(View):
         Process diagram generation form submission
         """
         try:
-            # Get form data
-            prompt = request.POST.get('prompt', '').strip()
-            diagram_type = request.POST.get('diagram_type', '').strip()
-            
-            # Validate input
-            if not prompt:
-                messages.error(request, AppConstants.MESSAGES['ERROR']['INVALID_PROMPT'])
-                return redirect('diagrams:home')
-            
-            if len(prompt) < 10:
-                messages.error(request, "Prompt must be at least 10 characters long.")
+            error, form = self._clean_form(request)
+            if error:
+                messages.error(request, error)
                 return redirect('diagrams:home')
             
-            # Auto-detect diagram type if not provided (simple detection)
-            if not diagram_type or diagram_type == 'auto':
-                diagram_type = self._simple_detect_diagram_type(prompt)
-                logger.info(f"Auto-detected diagram type: {diagram_type}")
-            
-            # Validate diagram type
-            if diagram_type not in AppConstants.DIAGRAM_TYPES.values():
-                diagram_type = 'custom'
+            # A near-identical earlier prompt can be answered without the LLM
+            reused = self._reuse_session(request, form)
+            if reused:
+                messages.success(request, AppConstants.MESSAGES['SUCCESS']['DIAGRAM_REUSED'])
+                return redirect('diagrams:display', session_id=reused.id)
             
             # Create session
             session = Session.objects.create(
-                prompt=prompt,
-                diagram_type=diagram_type,
+                prompt=form['prompt'],
+                diagram_type=form['diagram_type'],
+                explicit_type=form['explicit_type'],
                 status='processing',
                 user_ip=self._get_client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', '')
             )
             
-            # Generate diagram asynchronously (for now, synchronously)
-            self._generate_diagram_sync(session)
-            
-            # Redirect to display page
-            if session.status == 'completed':
-                messages.success(request, AppConstants.MESSAGES['SUCCESS']['DIAGRAM_GENERATED'])
-                return redirect('diagrams:display', session_id=session.id)
-            else:
-                messages.error(request, AppConstants.MESSAGES['ERROR']['GENERATION_FAILED'])
+            # Hand off to the background executor so this worker is freed immediately
+            if not job_runner.submit(session.id, mode=form['generation_mode'], explicit_type=form['explicit_type']):
+                session.status = 'failed'
+                session.error_message = AppConstants.MESSAGES['ERROR']['QUEUE_FULL']
+                session.save()
+                messages.error(request, AppConstants.MESSAGES['ERROR']['QUEUE_FULL'])
                 return redirect('diagrams:home')
+            
+            # Display page shows progress until the job completes
+            messages.info(request, AppConstants.MESSAGES['INFO']['PROCESSING'])
+            return redirect('diagrams:display', session_id=session.id)
                 
         except Exception as e:
             logger.error(f"Error in diagram generation: {str(e)}")
             messages.error(request, AppConstants.MESSAGES['ERROR']['GENERATION_FAILED'])
             return redirect('diagrams:home')
     
+    def _clean_form(self, request):
+        """
+        Validate the generation form and resolve the diagram type
+        
+        Returns:
+            Tuple[Optional[str], dict]: (error_message, form_fields)
+        """
+        # Get form data
+        prompt = request.POST.get('prompt', '').strip()
+        diagram_type = request.POST.get('diagram_type', '').strip()
+        generation_mode = request.POST.get('generation_mode', '').strip() or None
+        
+        # Validate input
+        if not prompt:
+            return AppConstants.MESSAGES['ERROR']['INVALID_PROMPT'], {}
+        
+        if len(prompt) < 10:
+            return "Prompt must be at least 10 characters long.", {}
+        
+        # Auto-detect diagram type if not provided (simple detection)
+        explicit_type = bool(diagram_type) and diagram_type != 'auto'
+        if not explicit_type:
+            diagram_type = self._simple_detect_diagram_type(prompt)
+            logger.info(f"Auto-detected diagram type: {diagram_type}")
+        
+        # Validate diagram type
+        if diagram_type not in AppConstants.DIAGRAM_TYPES.values():
+            diagram_type = 'custom'
+        
+        return None, {
+            'prompt': prompt,
+            'diagram_type': diagram_type,
+            'generation_mode': generation_mode,
+            'explicit_type': explicit_type,
+            # reuse=0 asks for a fresh generation even when a similar diagram exists
+            'reuse': request.POST.get('reuse', '1') != '0',
+        }
+    
+    def _reuse_session(self, request, form):
+        """
+        Completed copy of an earlier session with a near-identical prompt (PROMPT_REUSE_MODE=serve)
+        
+        Returns:
+            Optional[Session]: The new session, or None to generate as usual
+        """
+        if EnvConfig.PROMPT_REUSE_MODE != 'serve' or not form['reuse']:
+            return None
+        match = prompt_index.find(form['prompt'], form['diagram_type'])
+        source = match and Session.objects.filter(pk=match.session_id, status='completed').first()
+        if not source:
+            return None
+        
+        session = Session.objects.create(
+            prompt=form['prompt'],
+            diagram_type=source.diagram_type,
+            generated_uml=source.generated_uml,
+            diagram_svg=source.diagram_svg,
+            status='completed',
+            reused=True,
+            user_ip=self._get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
+        GenerationMetrics.objects.create(
+            session=session,
+            mode='reuse',
+            steps=[{'step': 'reuse', 'source': str(source.pk), 'similarity': round(match.similarity, 3)}]
+        )
+        metrics.incr('prompt_reuse.served')
+        logger.info(f"Served session {session.id} from {source.pk} (similarity {match.similarity:.2f})")
+        return session
+    
     def _simple_detect_diagram_type(self, prompt: str) -> str:
-        """Simple diagram type detection based on keywords"""
+        """Diagram type detection - trained local classifier first, keywords as fallback"""
+        if settings.INTENT_CLASSIFIER_ENABLED:
+            detected_type, _ = get_intent_classifier().classify(prompt)
+            if detected_type in AppConstants.DIAGRAM_TYPES.values():
+                return detected_type
+        
         prompt_lower = prompt.lower()
         
         if any(word in prompt_lower for word in ['flow', 'process', 'workflow', 'step']):
@@ -135,45 +223,152 @@ class GenerateDiagramView(View):
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+
+class AsyncGenerateDiagramView(GenerateDiagramView):
+    """
+    ASGI-native diagram generation: the job runs as a task on the server's event loop
+    """
     
-    def _generate_diagram_sync(self, session):
+    async def post(self, request):
         """
-        Generate Mermaid diagram synchronously - Simple and reliable
+        Process diagram generation form submission
         """
         try:
-            # Use simple Mermaid service
-            from .services.mermaid_service import mermaid_service
+            error, form = self._clean_form(request)
+            if error:
+                messages.error(request, error)
+                return redirect('diagrams:home')
             
-            # Generate Mermaid code based on diagram type
-            mermaid_code, error, detected_type = mermaid_service.generate_mermaid_code(
-                session.prompt, 
-                session.diagram_type
+            reused = await sync_to_async(self._reuse_session)(request, form)
+            if reused:
+                messages.success(request, AppConstants.MESSAGES['SUCCESS']['DIAGRAM_REUSED'])
+                return redirect('diagrams:display', session_id=reused.id)
+            
+            session = await Session.objects.acreate(
+                prompt=form['prompt'],
+                diagram_type=form['diagram_type'],
+                explicit_type=form['explicit_type'],
+                status='processing',
+                user_ip=self._get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
             )
             
+            if not async_job_runner.submit(session.id, mode=form['generation_mode'], explicit_type=form['explicit_type']):
+                session.status = 'failed'
+                session.error_message = AppConstants.MESSAGES['ERROR']['QUEUE_FULL']
+                await session.asave()
+                messages.error(request, AppConstants.MESSAGES['ERROR']['QUEUE_FULL'])
+                return redirect('diagrams:home')
+            
+            messages.info(request, AppConstants.MESSAGES['INFO']['PROCESSING'])
+            return redirect('diagrams:display', session_id=session.id)
+                
+        except Exception as e:
+            logger.error(f"Error in diagram generation: {str(e)}")
+            messages.error(request, AppConstants.MESSAGES['ERROR']['GENERATION_FAILED'])
+            return redirect('diagrams:home')
+
+
+class RefineDiagramView(GenerateDiagramView):
+    """
+    Edit a completed diagram with a short instruction instead of regenerating it
+    
+    The result is a new session linked to the one it was refined from, so every
+    revision stays viewable and the original is untouched if the edit fails.
+    """
+    
+    def post(self, request, session_id):
+        """
+        Process the refine form submitted from a diagram's display page
+        """
+        parent = get_object_or_404(Session, id=session_id)
+        try:
+            error, instruction = self._clean_instruction(request, parent)
             if error:
+                messages.error(request, error)
+                return redirect('diagrams:display', session_id=parent.id)
+            
+            session = Session.objects.create(**self._revision_fields(request, parent, instruction))
+            
+            if not job_runner.submit(session.id):
                 session.status = 'failed'
-                session.error_message = error
+                session.error_message = AppConstants.MESSAGES['ERROR']['QUEUE_FULL']
                 session.save()
-                return
+                messages.error(request, AppConstants.MESSAGES['ERROR']['QUEUE_FULL'])
+                return redirect('diagrams:display', session_id=parent.id)
             
-            # Update diagram type if AI detected a better one
-            if detected_type and detected_type != session.diagram_type:
-                logger.info(f"AI detected diagram type: {detected_type} (original: {session.diagram_type})")
-                session.diagram_type = detected_type
+            messages.info(request, AppConstants.MESSAGES['INFO']['REFINING'])
+            return redirect('diagrams:display', session_id=session.id)
+        
+        except Exception as e:
+            logger.error(f"Error in diagram refinement: {str(e)}")
+            messages.error(request, AppConstants.MESSAGES['ERROR']['GENERATION_FAILED'])
+            return redirect('diagrams:display', session_id=parent.id)
+    
+    def _clean_instruction(self, request, parent):
+        """
+        Validate the refine form against the session being edited
+        
+        Returns:
+            Tuple[Optional[str], str]: (error_message, instruction)
+        """
+        instruction = request.POST.get('instruction', '').strip()
+        if parent.status != 'completed' or not parent.generated_uml:
+            return AppConstants.MESSAGES['ERROR']['NOTHING_TO_REFINE'], ''
+        if len(instruction) < ValidationRules.REFINE_INSTRUCTION_MIN_LENGTH:
+            return AppConstants.MESSAGES['ERROR']['INVALID_INSTRUCTION'], ''
+        if len(instruction) > ValidationRules.REFINE_INSTRUCTION_MAX_LENGTH:
+            return (f"Keep the change under {ValidationRules.REFINE_INSTRUCTION_MAX_LENGTH} characters; "
+                    f"for bigger changes create a new diagram."), ''
+        return None, instruction
+    
+    def _revision_fields(self, request, parent, instruction):
+        return {
+            'prompt': instruction,
+            'diagram_type': parent.diagram_type,
+            'parent': parent,
+            'status': 'processing',
+            'user_ip': self._get_client_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+        }
+
+
+class AsyncRefineDiagramView(RefineDiagramView):
+    """
+    ASGI-native refinement: the edit runs as a task on the server's event loop
+    """
+    
+    async def post(self, request, session_id):
+        """
+        Process the refine form submitted from a diagram's display page
+        """
+        try:
+            parent = await Session.objects.aget(id=session_id)
+        except Session.DoesNotExist:
+            raise Http404("Session not found")
+        try:
+            error, instruction = self._clean_instruction(request, parent)
+            if error:
+                messages.error(request, error)
+                return redirect('diagrams:display', session_id=parent.id)
             
-            # Save results - Mermaid renders in frontend, no server-side SVG needed
-            session.generated_uml = mermaid_code
-            session.diagram_svg = mermaid_code  # Store Mermaid code for frontend rendering
-            session.status = 'completed'
-            session.save()
+            session = await Session.objects.acreate(**self._revision_fields(request, parent, instruction))
             
-            logger.info(f"Successfully generated Mermaid diagram for session {session.id}")
+            if not async_job_runner.submit(session.id):
+                session.status = 'failed'
+                session.error_message = AppConstants.MESSAGES['ERROR']['QUEUE_FULL']
+                await session.asave()
+                messages.error(request, AppConstants.MESSAGES['ERROR']['QUEUE_FULL'])
+                return redirect('diagrams:display', session_id=parent.id)
             
+            messages.info(request, AppConstants.MESSAGES['INFO']['REFINING'])
+            return redirect('diagrams:display', session_id=session.id)
+        
         except Exception as e:
-            session.status = 'failed'
-            session.error_message = str(e)
-            session.save()
-            logger.error(f"Error generating diagram for session {session.id}: {str(e)}")
+            logger.error(f"Error in diagram refinement: {str(e)}")
+            messages.error(request, AppConstants.MESSAGES['ERROR']['GENERATION_FAILED'])
+            return redirect('diagrams:display', session_id=parent.id)
 
 
 class DiagramDisplayView(DetailView):
@@ -194,8 +389,236 @@ class DiagramDisplayView(DetailView):
             'diagram_type_display': AppConstants.DIAGRAM_TYPE_DISPLAY.get(
                 session.diagram_type, session.diagram_type.upper()
             ),
+            **self._reuse_context(session),
+            **self._revision_context(session),
+            # Under WSGI SSE connections are short-lived, see SessionStreamView
+            'use_sse': EnvConfig.USE_ASYNC_VIEWS or EnvConfig.SSE_WSGI_MAX_SECONDS > 0,
         })
         return context
+    
+    def _revision_context(self, session):
+        """What a refinement changed structurally compared with the version it was refined from"""
+        if not session.parent_id or session.status != 'completed':
+            return {}
+        parent_code = Session.objects.filter(id=session.parent_id).values_list('diagram_svg', flat=True).first()
+        if not parent_code or not session.diagram_svg:
+            return {}
+        old, new = parse_mermaid(parent_code), parse_mermaid(session.diagram_svg)
+        if old is None or new is None or old.kind != new.kind:
+            return {}
+        return {'revision_diff': diff_diagrams(old, new)}
+    
+    def _reuse_context(self, session):
+        """Where a reused diagram came from, or an earlier similar diagram to offer while this one generates"""
+        if EnvConfig.PROMPT_REUSE_MODE not in ('suggest', 'serve'):
+            return {}
+        steps = GenerationMetrics.objects.filter(session=session, mode='reuse').values_list('steps', flat=True).first()
+        if steps:
+            return {'reused_from': steps[0]}
+        if session.status != 'processing' or session.parent_id:
+            return {}
+        match = prompt_index.find(session.prompt, session.diagram_type, exclude=session.id)
+        if match:
+            metrics.incr('prompt_reuse.suggested')
+            return {'similar_session': {'id': match.session_id, 'similarity': match.similarity}}
+        return {}
+
+
+class SessionStatusView(View):
+    """
+    Lightweight JSON status endpoint polled while a diagram is being generated
+    """
+    
+    def get(self, request, session_id):
+        session = get_object_or_404(Session, id=session_id)
+        stale = self._stale_session(session, job_runner)
+        if stale is not None:
+            self._expired(session, stale.update(**self._expiry_fields()))
+        return JsonResponse(self._status_payload(session))
+    
+    def _stale_session(self, session, runner):
+        """
+        Jobs live in worker memory, so a restart can orphan a processing session
+        
+        A job still queued or running in this process is not orphaned, however long
+        it waits for a worker.
+        
+        Returns:
+            QuerySet matching the session only while it is still processing and stale,
+            or None when it can't be stale
+        """
+        if session.status != 'processing' or runner.owns(session.id):
+            return None
+        stale_before = timezone.now() - timedelta(seconds=EnvConfig.GENERATION_STALE_SECONDS)
+        if session.created_at >= stale_before:
+            return None
+        return Session.objects.filter(pk=session.pk, status='processing', created_at__lt=stale_before)
+    
+    def _expiry_fields(self) -> dict:
+        return {'status': 'failed', 'error_message': AppConstants.MESSAGES['ERROR']['GENERATION_TIMEOUT']}
+    
+    def _expired(self, session, updated: int):
+        """Reflect the conditional update in the session; a job that just finished wins"""
+        if updated:
+            for field, value in self._expiry_fields().items():
+                setattr(session, field, value)
+        else:
+            session.refresh_from_db(fields=['status', 'error_message'])
+    
+    def _status_payload(self, session) -> dict:
+        return {
+            'id': str(session.id),
+            'status': session.status,
+            'diagram_type': session.diagram_type,
+            'error': session.error_message if session.status == 'failed' else None,
+        }
+
+
+class AsyncSessionStatusView(SessionStatusView):
+    """
+    Async SessionStatusView for ASGI deployments
+    """
+    
+    async def get(self, request, session_id):
+        try:
+            session = await Session.objects.aget(id=session_id)
+        except Session.DoesNotExist:
+            raise Http404("No Session matches the given query.")
+        stale = self._stale_session(session, async_job_runner)
+        if stale is not None:
+            updated = await stale.aupdate(**self._expiry_fields())
+            await sync_to_async(self._expired)(session, updated)
+        return JsonResponse(self._status_payload(session))
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SessionStreamView(View):
+    """
+    Server-Sent Events stream of the diagram while it is being generated
+    
+    Emits 'partial' events with the cleaned code so far and a final 'done' event.
+    Each client holds a worker thread, so a connection lasts at most
+    SSE_WSGI_MAX_SECONDS: the stream then ends without an event, and the browser
+    reconnects after the `retry:` delay and gets the latest partial first. When the
+    job runs in another worker process there is nothing to relay, and 'timeout' is
+    sent at once so the client polls status instead.
+    """
+    
+    def get(self, request, session_id):
+        session = get_object_or_404(Session, id=session_id)
+        response = StreamingHttpResponse(self._events(session), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def _events(self, session):
+        if session.status != 'processing':
+            yield _sse_event('done', {'status': session.status})
+            return
+        
+        age = (timezone.now() - session.created_at).total_seconds()
+        remaining = EnvConfig.GENERATION_STALE_SECONDS - age
+        
+        if job_runner.owns(session.id) and remaining > 0:
+            yield f"retry: {AppConstants.SSE_RETRY_MS}\n\n"
+            channel = stream_bus.get_or_create(session.id)
+            for event, data in channel.subscribe(timeout=min(remaining, EnvConfig.SSE_WSGI_MAX_SECONDS)):
+                if event == 'partial':
+                    yield _sse_event('partial', {'code': data})
+                elif event == 'done':
+                    yield _sse_event('done', data)
+                    return
+                elif event == 'keepalive':
+                    yield ': keepalive\n\n'
+                elif remaining > EnvConfig.SSE_WSGI_MAX_SECONDS:
+                    # Connection time is up but the generation isn't; free the thread
+                    metrics.incr('sse.reconnect')
+                    return
+                else:
+                    break
+        
+        yield _sse_event('timeout', {'status': 'processing'})
+
+
+class AsyncSessionStreamView(View):
+    """
+    Async SessionStreamView - connected clients are coroutines, not threads
+    """
+    
+    async def get(self, request, session_id):
+        try:
+            session = await Session.objects.aget(id=session_id)
+        except Session.DoesNotExist:
+            raise Http404("No Session matches the given query.")
+        response = StreamingHttpResponse(self._events(session), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    async def _events(self, session):
+        if session.status != 'processing':
+            yield _sse_event('done', {'status': session.status})
+            return
+        
+        timeout = EnvConfig.GENERATION_STALE_SECONDS
+        
+        if async_job_runner.owns(session.id):
+            channel = stream_bus.get_or_create(session.id)
+            async for event, data in channel.asubscribe(timeout=timeout):
+                if event == 'partial':
+                    yield _sse_event('partial', {'code': data})
+                elif event == 'done':
+                    yield _sse_event('done', data)
+                    return
+                elif event == 'keepalive':
+                    yield ': keepalive\n\n'
+                else:
+                    break
+        else:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(1)
+                status = await Session.objects.filter(id=session.id).values_list('status', flat=True).afirst()
+                if status != 'processing':
+                    yield _sse_event('done', {'status': status})
+                    return
+                yield ': keepalive\n\n'
+        
+        yield _sse_event('timeout', {'status': 'processing'})
+
+
+class MetricsView(View):
+    """
+    Per-process pipeline metrics (cache hit rates, counters, latency summaries)
+    """
+    
+    def get(self, request):
+        if not (settings.DEBUG or request.user.is_staff):
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        
+        return JsonResponse({
+            'caches': {
+                'analysis': analysis_cache.stats(),
+                'generation': generation_cache.stats(),
+            },
+            'backend': llm_backend.describe(),
+            'breaker': llm_breaker.state,
+            'rate_limit': llm_rate_limiter.stats(),
+            'routes': model_router.table(diagram_types=prompt_registry.diagram_types()),
+            'prompts': {spec.name: {'version': spec.label, 'tokens': spec.tokens}
+                        for spec in prompt_registry.active()},
+            'jobs': {
+                'pending': job_runner.pending,
+                'max_workers': job_runner.max_workers,
+                'async_pending': async_job_runner.pending,
+                'async_max_concurrency': async_job_runner.max_concurrency,
+            },
+            **metrics.snapshot(),
+        })
 
 
 class SessionHistoryView(ListView):
@@ -244,9 +667,17 @@ class DownloadView(View):
             format_type = request.GET.get('format', 'png')
             
             if format_type == 'mmd':
-                # Download Mermaid code
+                # Download Mermaid code; the content hash lets clients revalidate without a new body.
+                # It hashes the canonical form, not these exact bytes, so the ETag is weak
+                etag = f'W/"{session.content_hash}-mmd"' if session.content_hash else None
+                if etag:
+                    not_modified = get_conditional_response(request, etag=etag)
+                    if not_modified is not None:
+                        return not_modified
                 response = HttpResponse(session.generated_uml, content_type='text/plain')
                 response['Content-Disposition'] = f'attachment; filename="diagram_{session.id}.mmd"'
+                if etag:
+                    response['ETag'] = etag
                 return response
             else:
                 # For image download, return HTML page with conversion script
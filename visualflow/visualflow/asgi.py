@@ -7,10 +7,55 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'visualflow.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from config.env_config import EnvConfig  # noqa: E402  after settings are configured
+
+
+class LLMWarmUpApplication:
+    """
+    Warms the async LLM connection pool on the event loop that serves requests
+
+    DiagramsConfig.ready() warms the sync pool from a boot thread, but async
+    connections belong to the loop that opened them. Servers that send ASGI
+    lifespan events (uvicorn, hypercorn) warm the async pool at startup; with
+    others it happens alongside the first request. Django itself does not
+    handle lifespan, so those events are answered here.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._warm_up_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        self._start_warm_up()
+        return await self.app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start_warm_up()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _start_warm_up(self):
+        if self._warm_up_task is None:
+            from diagrams.services.llm_backends import llm_backend
+            self._warm_up_task = asyncio.create_task(llm_backend.awarm_up())
+
+
+application = django_application
+if EnvConfig.LLM_HTTP_WARMUP:
+    application = LLMWarmUpApplication(django_application)
@@ -234,3 +234,9 @@ LANGCHAIN_API_KEY = EnvConfig.LANGCHAIN_API_KEY
 
 APP_NAME = EnvConfig.APP_NAME
 APP_VERSION = EnvConfig.APP_VERSION
+
+INTENT_CLASSIFIER_ENABLED = EnvConfig.INTENT_CLASSIFIER_ENABLED
+INTENT_CLASSIFIER_PATH = EnvConfig.INTENT_CLASSIFIER_PATH or BASE_DIR / 'data' / 'intent_classifier.json'
+INTENT_CLASSIFIER_THRESHOLD = EnvConfig.INTENT_CLASSIFIER_THRESHOLD
+
+LLM_CASSETTE_DIR = EnvConfig.LLM_CASSETTE_DIR or BASE_DIR / 'data' / 'cassettes'